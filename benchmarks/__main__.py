@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the benchmark suite.
+"""
+
+from __future__ import absolute_import
+
+import sys
+
+from benchmarks.suite import main
+
+sys.exit(main())
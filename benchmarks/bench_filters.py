@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark filtering of missing and updated testcases.
+
+Run as `python -m benchmarks.bench_filters`.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import copy
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks import generators
+from cfme_testcases import filters, utils
+from cfme_testcases.input_xmls import InputXMLs
+
+
+def _legacy_filtered_xmls(input_xmls, missing):
+    """Filters the XMLs by removing rejected elements one by one (the original approach)."""
+    missing_testcases = copy.deepcopy(input_xmls.testcases_root)
+    utils.remove_response_property(missing_testcases)
+    for testcase in missing_testcases.findall('testcase'):
+        tc_id = testcase.get('id')
+        if tc_id and tc_id not in missing:
+            missing_testcases.remove(testcase)
+
+    missing_testsuites = copy.deepcopy(input_xmls.testsuites_root)
+    utils.remove_response_property(missing_testsuites)
+    testsuite = missing_testsuites.find('testsuite')
+    for testcase in testsuite.findall('testcase'):
+        tc_id = testcase.get('name')
+        if tc_id and tc_id not in missing:
+            testsuite.remove(testcase)
+    testsuite.set('tests', str(len(testsuite.findall('testcase'))))
+
+    updated_testcases = copy.deepcopy(input_xmls.testcases_root)
+    utils.remove_response_property(updated_testcases)
+    utils.set_lookup_method(updated_testcases, 'name')
+    for testcase in updated_testcases.findall('testcase'):
+        tc_id = testcase.get('id')
+        if tc_id is not None and tc_id in missing:
+            updated_testcases.remove(testcase)
+            continue
+        cfields_parent = testcase.find('custom-fields')
+        for field in cfields_parent.findall('custom-field'):
+            if field.get('id') not in filters.UPDATED_FIELDS:
+                cfields_parent.remove(field)
+
+    return missing_testcases, missing_testsuites, updated_testcases
+
+
+def _run(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def main(args=None):
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-c', '--count', type=int, default=50000,
+                        help='Number of testcases (default: %(default)s)')
+    parser.add_argument('--missing-every', type=int, default=100, metavar='N',
+                        help='Every N-th testcase is missing (default: %(default)s)')
+    args = parser.parse_args(args)
+
+    work_dir = tempfile.mkdtemp(prefix='bench-filters-')
+    try:
+        testcases_file = os.path.join(work_dir, 'test_case_import.xml')
+        testsuites_file = os.path.join(work_dir, 'test_run_import.xml')
+        generators.gen_testcases_xml(testcases_file, args.count)
+        generators.gen_testsuites_xml(testsuites_file, args.count)
+        missing = generators.get_missing_names(args.count, args.missing_every)
+
+        input_xmls = InputXMLs(testcases_file, testsuites_file)
+        parse = _run(lambda: (input_xmls.testcases_root, input_xmls.testsuites_root))
+        legacy = _run(_legacy_filtered_xmls, input_xmls, missing)
+        current = _run(filters.get_filtered_xmls, input_xmls, missing)
+    finally:
+        shutil.rmtree(work_dir)
+
+    print('testcases: {}, missing: {}'.format(args.count, len(missing)))
+    print('parse:                 {:.3f} s'.format(parse))
+    print('remove rejected:       {:.3f} s'.format(legacy))
+    print('select into new root:  {:.3f} s'.format(current))
+    print('speedup: {:.2f}x'.format(legacy / current if current else float('inf')))
+
+
+if __name__ == '__main__':
+    main()
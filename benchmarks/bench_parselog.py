@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark parsing of Polarion Importers job logs.
+
+Run as `python -m benchmarks.bench_parselog`.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks import generators
+from cfme_testcases import parselog
+
+
+def _legacy_parse(log_file):
+    """Line by line parsing with per-line substring checks (the original approach)."""
+    handler = None
+    with open(log_file) as input_file:
+        for line in input_file:
+            if 'Starting import of XUnit results' in line:
+                handler = _legacy_parse_xunit
+                break
+            elif 'Starting import of test cases' in line:
+                handler = _legacy_parse_test_case
+                break
+    return handler(log_file)
+
+
+def _legacy_parse_xunit(log_file):
+    outcome = {'results': [], 'not_unique': [], 'not_found': []}
+    with open(log_file) as input_file:
+        for line in input_file:
+            line = line.strip()
+            if 'Work item: ' in line:
+                work_item = parselog.get_work_item(line)
+                if work_item:
+                    outcome['results'].append(work_item)
+            elif 'Unable to find *unique* work item' in line:
+                warn_item = parselog.get_warn_item(line)
+                if warn_item:
+                    outcome['not_unique'].append(warn_item)
+            elif 'Unable to find work item for' in line:
+                warn_item = parselog.get_warn_item(line)
+                if warn_item:
+                    outcome['not_found'].append(warn_item)
+    return outcome
+
+
+def _legacy_parse_test_case(log_file):
+    outcome = {'results': [], 'not_unique': [], 'not_found': []}
+    with open(log_file) as input_file:
+        for line in input_file:
+            line = line.strip()
+            if 'Updated test case' in line:
+                updated_item = parselog.get_test_case(line)
+                if updated_item:
+                    outcome['results'].append(updated_item)
+            elif 'Created test case' in line:
+                missing_item = parselog.get_test_case(line)
+                if missing_item:
+                    outcome['not_found'].append(missing_item[0])
+            elif 'Found multiple work items with the title' in line:
+                warn_item = parselog.get_test_case_warn(line)
+                if warn_item:
+                    outcome['not_unique'].append(warn_item)
+    return outcome
+
+
+def _throughput(func, log_file, repeat):
+    size = os.path.getsize(log_file) * repeat
+    start = time.time()
+    for __ in range(repeat):
+        outcome = func(log_file)
+    elapsed = time.time() - start
+    return outcome, size / (1024.0 * 1024.0) / elapsed
+
+
+def main(args=None):
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-c', '--count', type=int, default=200000,
+                        help='Number of testcases in the log (default: %(default)s)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of repetitions (default: %(default)s)')
+    args = parser.parse_args(args)
+
+    work_dir = tempfile.mkdtemp(prefix='bench-parselog-')
+    try:
+        for name, gen_func in (('XUnit', generators.gen_xunit_log),
+                               ('Test Case', generators.gen_test_case_log)):
+            log_file = os.path.join(work_dir, 'job.log')
+            gen_func(log_file, args.count)
+            legacy_outcome, legacy = _throughput(_legacy_parse, log_file, args.repeat)
+            current_outcome, current = _throughput(parselog.parse, log_file, args.repeat)
+            if legacy_outcome != current_outcome:
+                raise AssertionError('{} Importer log: outcomes differ'.format(name))
+            print('{} Importer log, {:.1f} MB:'.format(
+                name, os.path.getsize(log_file) / (1024.0 * 1024.0)))
+            print('  line by line:     {:.1f} MB/s'.format(legacy))
+            print('  single pass mmap: {:.1f} MB/s'.format(current))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
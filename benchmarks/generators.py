@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Generators of synthetic data for benchmarks.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import io
+import os
+
+
+# fields are sorted by id the same way as in the Polarion SVN repo
+_WORKITEM_TMPL = '''<?xml version="1.0" encoding="UTF-8"?>
+<work-item>
+  <field id="assignee">user{num_mod}</field>
+  <field id="author">user{num_mod}</field>
+  <field id="automation_script">cfme/tests/test_module_{num}.py</field>
+  <field id="caseautomation">automated</field>
+  <field id="caseimportance">medium</field>
+  <field id="created">2017-10-10 10:10:10.100 +0000</field>
+  <field id="description">{description}</field>
+  <field id="status">{status}</field>
+  <field id="testSteps">{steps}</field>
+  <field id="title">{title}</field>
+  <field id="type">{type}</field>
+  <field id="updated">2017-11-11 11:11:11.110 +0000</field>
+</work-item>
+'''
+
+
+def get_bucket_path(num):
+    """Gets the bucket path of workitem number, e.g. 31942 -> 30000-39999/31000-31999/31900-31999."""
+    dig_len = len(str(num))
+    paths = []
+    for i in range(dig_len - 2):
+        divisor = 10 ** (dig_len - i - 1)
+        paths.append('{}-{}'.format((num // divisor) * divisor, ((num // divisor) + 1) * divisor - 1))
+    return '/'.join(paths)
+
+
+def get_workitem_xml(num, project='RHCF3'):
+    """Returns content of synthetic workitem.xml.
+
+    Every 10th workitem is a requirement and every 7th testcase is inactive.
+    """
+    return _WORKITEM_TMPL.format(
+        num=num,
+        num_mod=num % 50,
+        description='&lt;p&gt;Lorem ipsum dolor sit amet.&lt;/p&gt; ' * 200,
+        steps='&lt;step&gt;&lt;b&gt;Do&lt;/b&gt; something&lt;/step&gt;' * 200,
+        status='inactive' if num % 7 == 0 else 'approved',
+        title='test_synthetic_{}_{}'.format(project.lower(), num),
+        type='requirement' if num % 10 == 0 else 'testcase',
+    )
+
+
+def gen_svn_repo(repo_dir, count, start=1000, project='RHCF3'):
+    """Generates `tracker/workitems` tree with `count` workitems in the real bucket layout."""
+    workitems_dir = os.path.join(repo_dir, 'tracker', 'workitems')
+    for num in range(start, start + count):
+        item_dir = os.path.join(
+            workitems_dir, get_bucket_path(num), '{}-{}'.format(project, num))
+        os.makedirs(item_dir)
+        with io.open(os.path.join(item_dir, 'workitem.xml'), 'w', encoding='utf-8') as out:
+            out.write(get_workitem_xml(num, project))
+    return workitems_dir
+
+
+def _write_lines(xml_file, lines):
+    with io.open(xml_file, 'w', encoding='utf-8') as out:
+        for line in lines:
+            out.write(line)
+            out.write('\n')
+
+
+def get_testcase_name(num):
+    """Returns name of synthetic testcase."""
+    return 'test_synthetic_{}[param{}]'.format(num // 10, num % 10)
+
+
+def gen_testcases_xml(xml_file, count):
+    """Generates XML file with `count` testcases in the Test Case Importer format."""
+    def _lines():
+        yield '<?xml version="1.0" encoding="utf-8"?>'
+        yield '<testcases project-id="RHCF3">'
+        yield '  <properties>'
+        yield '    <property name="lookup-method" value="custom"/>'
+        yield '    <property name="polarion-custom-lookup-method-field-id" value="testCaseID"/>'
+        yield '  </properties>'
+        yield '  <response-properties>'
+        yield '    <response-property name="cfme-testcases" value="synthetic"/>'
+        yield '  </response-properties>'
+        for num in range(count):
+            name = get_testcase_name(num)
+            yield '  <testcase id="{}">'.format(name)
+            yield '    <title>{}</title>'.format(name)
+            yield '    <description>Synthetic testcase {} with longer description.</description>'.format(
+                num)
+            yield '    <custom-fields>'
+            yield '      <custom-field content="automated" id="caseautomation"/>'
+            yield ('      <custom-field content="cfme/tests/test_synthetic_{}.py" '
+                   'id="automation_script"/>'.format(num // 10))
+            yield '      <custom-field content="medium" id="caseimportance"/>'
+            yield '      <custom-field content="functional" id="testtype"/>'
+            yield '      <custom-field content="cfme" id="casecomponent"/>'
+            yield '    </custom-fields>'
+            yield '  </testcase>'
+        yield '</testcases>'
+    _write_lines(xml_file, _lines())
+
+
+def gen_testsuites_xml(xml_file, count, testrun_id='synthetic_testrun'):
+    """Generates XUnit XML file with `count` testcases."""
+    def _lines():
+        yield '<?xml version="1.0" encoding="utf-8"?>'
+        yield '<testsuites>'
+        yield '  <properties>'
+        yield '    <property name="polarion-testrun-id" value="{}"/>'.format(testrun_id)
+        yield '    <property name="polarion-project-id" value="RHCF3"/>'
+        yield '    <property name="polarion-response-cfme-testcases" value="synthetic"/>'
+        yield '    <property name="polarion-lookup-method" value="name"/>'
+        yield '  </properties>'
+        yield ('  <testsuite errors="0" failures="0" name="Import" skipped="{0}" '
+               'tests="{0}" time="0">'.format(count))
+        for num in range(count):
+            yield ('    <testcase classname="cfme.tests.test_synthetic_{}" name="{}" '
+                   'time="0"><skipped message="collect-only"/></testcase>'.format(
+                       num // 10, get_testcase_name(num)))
+        yield '  </testsuite>'
+        yield '</testsuites>'
+    _write_lines(xml_file, _lines())
+
+
+def get_missing_names(count, every=100):
+    """Returns names of every `every`-th synthetic testcase."""
+    return {get_testcase_name(num) for num in range(0, count, every)}
+
+
+_LOG_PREFIX = '2017-10-10 10:10:10,100 INFO  [org.example.importer.{}] (Worker-{}) - '
+
+
+def gen_xunit_log(log_file, count, not_found_every=100, not_unique_every=250):
+    """Generates log of the XUnit Importer with results of `count` testcases."""
+    def _lines():
+        prefix = _LOG_PREFIX.format('XUnitImporter', 1)
+        yield prefix + 'Starting import of XUnit results'
+        for num in range(count):
+            name = get_testcase_name(num)
+            yield prefix + 'Processing testcase {} of {}'.format(num + 1, count)
+            if num % not_found_every == 0:
+                yield prefix + "Unable to find work item for '{}'.".format(name)
+            elif num % not_unique_every == 0:
+                yield (prefix + "Unable to find *unique* work item using lookup method "
+                       "'name' for '{}'.".format(name))
+            else:
+                yield prefix + "Work item: '{}' (RHCF3-{})".format(name, 10000 + num)
+        yield prefix + 'Import finished'
+    _write_lines(log_file, _lines())
+
+
+def gen_test_case_log(log_file, count, created_every=100, multiple_every=250):
+    """Generates log of the Test Case Importer with `count` testcases."""
+    def _lines():
+        prefix = _LOG_PREFIX.format('TestCaseImporter', 2)
+        yield prefix + 'Starting import of test cases'
+        for num in range(count):
+            name = get_testcase_name(num)
+            yield prefix + 'Processing test case {} of {}'.format(num + 1, count)
+            if num % created_every == 0:
+                yield prefix + "Created test case '{}' (RHCF3-{})".format(name, 10000 + num)
+            elif num % multiple_every == 0:
+                yield prefix + "Found multiple work items with the title '{}'.".format(name)
+            else:
+                yield prefix + "Updated test case '{}' (RHCF3-{})".format(name, 10000 + num)
+        yield prefix + 'Import finished'
+    _write_lines(log_file, _lines())
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite recording time and peak memory of the main operations.
+
+Run as `python -m benchmarks`. Each benchmark runs in its own process so the
+peak memory of one doesn't affect the others. Results can be saved as baseline
+and later runs compared to it, the exit code is 1 when any benchmark regressed.
+Import of the CLI must fit into time budget and must not import modules needed
+only on some code paths.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import namedtuple
+
+from benchmarks import generators
+from cfme_testcases import filters, parselog, svn_testcases, utils
+from cfme_testcases.input_xmls import InputXMLs
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+Benchmark = namedtuple('Benchmark', 'name setup run')
+
+Result = namedtuple('Result', 'name seconds peak_mb delta_mb')
+
+_DATA_INFO = 'data.json'
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules needed only on some code paths, importing the CLI must not import them
+LAZY_MODULES = ('dump2polarion', 'lxml', 'multiprocessing', 'sqlite3')
+
+_IMPORT_TIME_SEARCH = re.compile(r'^import time:\s+[0-9]+ \|\s+([0-9]+) \| *(\S+)$')
+
+
+class BenchData(object):
+    """Paths to synthetic data in the data dir."""
+
+    def __init__(self, data_dir, workitems, testcases):
+        self.data_dir = data_dir
+        self.workitems = workitems
+        self.testcases = testcases
+        self.repo_dir = os.path.join(data_dir, 'repo')
+        self.testcases_file = os.path.join(data_dir, 'test_case_import.xml')
+        self.testsuites_file = os.path.join(data_dir, 'test_run_import.xml')
+        self.xunit_log = os.path.join(data_dir, 'job-xunit.log')
+        self.test_case_log = os.path.join(data_dir, 'job-test-case.log')
+
+    @property
+    def missing(self):
+        """Names of testcases that are missing."""
+        return generators.get_missing_names(self.testcases)
+
+    def get_tmp_file(self, name, pid=None):
+        """Returns path to file in the data dir that is removed after the benchmark."""
+        return os.path.join(self.data_dir, 'tmp-{}-{}'.format(pid or os.getpid(), name))
+
+    def remove_tmp_files(self, pid):
+        """Removes temporary files created by the benchmark process."""
+        prefix = os.path.basename(self.get_tmp_file('', pid))
+        for fname in os.listdir(self.data_dir):
+            if fname.startswith(prefix):
+                os.remove(os.path.join(self.data_dir, fname))
+
+    def generate(self):
+        """Generates the data unless it already exists in the data dir."""
+        info = {'workitems': self.workitems, 'testcases': self.testcases}
+        info_file = os.path.join(self.data_dir, _DATA_INFO)
+        if os.path.exists(info_file):
+            with io.open(info_file, encoding='utf-8') as input_file:
+                if json.load(input_file) == info:
+                    return
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+
+        generators.gen_svn_repo(self.repo_dir, self.workitems)
+        generators.gen_testcases_xml(self.testcases_file, self.testcases)
+        generators.gen_testsuites_xml(self.testsuites_file, self.testcases)
+        generators.gen_xunit_log(self.xunit_log, self.testcases)
+        generators.gen_test_case_log(self.test_case_log, self.testcases)
+        with io.open(info_file, 'w', encoding='utf-8') as output_file:
+            output_file.write(json.dumps(info))
+
+
+def _load_testcases(data, index_file=None):
+    polarion_testcases = svn_testcases.PolarionTestcases(data.repo_dir, index_file=index_file)
+    try:
+        polarion_testcases.load_active_testcases()
+    finally:
+        if polarion_testcases.index:
+            polarion_testcases.index.close()
+    return polarion_testcases
+
+
+def _setup_index(data, warm):
+    index_file = data.get_tmp_file('index.sqlite')
+    if warm:
+        _load_testcases(data, index_file)
+    return data, index_file, warm
+
+
+def _run_index(state):
+    data, index_file, warm = state
+    if not warm and os.path.exists(index_file):
+        os.remove(index_file)
+    _load_testcases(data, index_file)
+
+
+def _setup_input_xmls(data):
+    input_xmls = InputXMLs(data.testcases_file, data.testsuites_file)
+    input_xmls.load()
+    return input_xmls, data.missing
+
+
+def _setup_write(data):
+    return utils.get_xml_root(data.testcases_file), data.get_tmp_file('write.xml')
+
+
+def _run_write(state):
+    xml_root, output_file = state
+    utils.write_xml(xml_root, output_file)
+
+
+def _run_write_streaming(data):
+    output_files = filters.FilteredXMLs(*(
+        data.get_tmp_file(name) for name in ('missing-tc.xml', 'missing-ts.xml', 'update.xml')))
+    filters.write_filtered_xmls(
+        data.testcases_file, data.testsuites_file, data.missing, output_files)
+
+
+BENCHMARKS = (
+    Benchmark('load_active_testcases', lambda data: data, _load_testcases),
+    Benchmark('load_active_testcases_index_cold', lambda data: _setup_index(data, False),
+              _run_index),
+    Benchmark('load_active_testcases_index_warm', lambda data: _setup_index(data, True),
+              _run_index),
+    Benchmark('parselog_xunit', lambda data: data.xunit_log, parselog.parse),
+    Benchmark('parselog_test_case', lambda data: data.test_case_log, parselog.parse),
+    Benchmark('parse_input_xmls', lambda data: data,
+              lambda data: InputXMLs(data.testcases_file, data.testsuites_file).load()),
+    Benchmark('get_filtered_xmls', _setup_input_xmls,
+              lambda state: filters.get_filtered_xmls(*state)),
+    Benchmark('write_filtered_xmls_streaming', lambda data: data, _run_write_streaming),
+    Benchmark('write_xml', _setup_write, _run_write),
+)
+
+
+def _get_peak_rss_mb():
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+
+def _measure(bench_num, data, repeat, conn):
+    benchmark = BENCHMARKS[bench_num]
+    try:
+        state = benchmark.setup(data)
+        setup_peak = _get_peak_rss_mb()
+        times = []
+        for __ in range(repeat):
+            start = time.time()
+            benchmark.run(state)
+            times.append(time.time() - start)
+        peak = _get_peak_rss_mb()
+        conn.send(Result(benchmark.name, min(times), peak, peak - setup_peak))
+    # pylint: disable=broad-except
+    except Exception as err:
+        conn.send(err)
+    finally:
+        conn.close()
+
+
+def run_benchmark(bench_num, data, repeat=1):
+    """Runs the benchmark from `BENCHMARKS` in new process, returns its `Result`."""
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(target=_measure, args=(bench_num, data, repeat, child_conn))
+    proc.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        result = RuntimeError('benchmark process died')
+    proc.join()
+    data.remove_tmp_files(proc.pid)
+    if isinstance(result, Exception):
+        raise RuntimeError("Benchmark '{}' failed: {}".format(BENCHMARKS[bench_num].name, result))
+    return result
+
+
+def _run_python(code, importtime=False):
+    env = dict(os.environ)
+    # the bytecode must be cached so only the import itself is measured
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPATH'] = os.pathsep.join(
+        path for path in (_ROOT_DIR, env.get('PYTHONPATH')) if path)
+    args = [sys.executable]
+    if importtime:
+        args.extend(('-X', 'importtime'))
+    args.extend(('-c', code))
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    stdout, stderr = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError('Python failed: {}'.format(stderr.decode('utf-8', 'replace')))
+    return stdout.decode('utf-8'), stderr.decode('utf-8')
+
+
+_PRINT_PEAK = (
+    'import resource, sys; '
+    'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss'
+    ' / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0))')
+
+
+def measure_import(module='cfme_testcases.cli', repeat=3):
+    """Imports the module in new interpreter, returns its `Result` and names of imported modules.
+
+    Time is the best cumulative import time reported by `-X importtime`,
+    memory is peak RSS of the interpreter and its increase over empty interpreter.
+    """
+    # the first run writes the bytecode cache
+    _run_python('import {}'.format(module))
+    base_peak = float(_run_python(_PRINT_PEAK)[0])
+    times = []
+    peak = 0.0
+    imported = set()
+    for __ in range(repeat):
+        stdout, stderr = _run_python('import {}; {}'.format(module, _PRINT_PEAK), importtime=True)
+        peak = max(peak, float(stdout))
+        for line in stderr.splitlines():
+            match = _IMPORT_TIME_SEARCH.match(line)
+            if not match:
+                continue
+            imported.add(match.group(2))
+            if match.group(2) == module:
+                times.append(int(match.group(1)) / 1000000.0)
+    return Result(
+        'import_{}'.format(module.rsplit('.', 1)[-1]), min(times), peak, peak - base_peak), imported
+
+
+def check_import(result, imported, budget):
+    """Returns list of problems with import of the CLI."""
+    problems = []
+    if result.seconds * 1000 > budget:
+        problems.append('{}: import took {:.1f} ms, budget {:.1f} ms'.format(
+            result.name, result.seconds * 1000, budget))
+    eager = sorted(set(name.split('.')[0] for name in imported) & set(LAZY_MODULES))
+    if eager:
+        problems.append('{}: imported {}'.format(result.name, ', '.join(eager)))
+    return problems
+
+
+def compare(results, baseline, tolerance):
+    """Returns list of regressions against the baseline results."""
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if not base:
+            continue
+        # small differences in time and memory are just noise
+        if result.seconds > max(base['seconds'] * tolerance, base['seconds'] + 0.1):
+            regressions.append('{}: time {:.3f} s, baseline {:.3f} s'.format(
+                result.name, result.seconds, base['seconds']))
+        if result.delta_mb > max(base['delta_mb'] * tolerance, base['delta_mb'] + 10):
+            regressions.append('{}: memory {:.1f} MB, baseline {:.1f} MB'.format(
+                result.name, result.delta_mb, base['delta_mb']))
+    return regressions
+
+
+def main(args=None):
+    """Runs the benchmark suite."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workitems', type=int, default=10000,
+                        help='Number of workitems in the SVN repo (default: %(default)s)')
+    parser.add_argument('--testcases', type=int, default=20000,
+                        help='Number of testcases in the XMLs and logs (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Run each benchmark N times and take the best time'
+                             ' (default: %(default)s)')
+    parser.add_argument('--data-dir',
+                        help='Directory for the generated data, it is kept and reused')
+    parser.add_argument('-k', '--select', metavar='SUBSTRING',
+                        help='Run only benchmarks with the substring in name')
+    parser.add_argument('--save-baseline', metavar='FILE',
+                        help='Save results to the file')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='Compare results with results saved in the file')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='How many times worse than baseline is a regression'
+                             ' (default: %(default)s)')
+    parser.add_argument('--import-budget', type=float, default=50.0, metavar='MS',
+                        help='Maximal time of import of the CLI (default: %(default)s)')
+    args = parser.parse_args(args)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='cfme-testcases-bench-')
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    data = BenchData(data_dir, args.workitems, args.testcases)
+    try:
+        print('generating data in {}'.format(data_dir))
+        data.generate()
+
+        results = []
+        problems = []
+        print('{:<36} {:>10} {:>10} {:>10}'.format('benchmark', 'time [s]', 'peak [MB]', 'delta [MB]'))
+        if not args.select or args.select in 'import_cli':
+            if sys.version_info < (3, 7):
+                print('import_cli skipped, -X importtime needs Python 3.7+')
+            else:
+                result, imported = measure_import(repeat=args.repeat)
+                results.append(result)
+                problems.extend(check_import(result, imported, args.import_budget))
+                print('{:<36} {:>10.3f} {:>10.1f} {:>10.1f}'.format(*result))
+        for bench_num, benchmark in enumerate(BENCHMARKS):
+            if args.select and args.select not in benchmark.name:
+                continue
+            result = run_benchmark(bench_num, data, args.repeat)
+            results.append(result)
+            print('{:<36} {:>10.3f} {:>10.1f} {:>10.1f}'.format(*result))
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir)
+
+    if args.save_baseline:
+        with io.open(args.save_baseline, 'w', encoding='utf-8') as output_file:
+            output_file.write(json.dumps(
+                {result.name: result._asdict() for result in results}, indent=2, sort_keys=True))
+
+    if args.baseline:
+        with io.open(args.baseline, encoding='utf-8') as input_file:
+            problems.extend(compare(results, json.load(input_file), args.tolerance))
+    for problem in problems:
+        print('REGRESSION {}'.format(problem))
+    if problems:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Submits jobs to Polarion Importers and verifies all of them concurrently in one event loop.
+
+Needs Python 3.5.2 or newer. The queue is polled using internals of dump2polarion's
+`QueueSearch`, so the supported dump2polarion versions are pinned.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import os
+import time
+
+from collections import OrderedDict
+
+from dump2polarion import configuration, submit, verify
+from lxml import etree
+
+from cfme_testcases import scheduler, utils
+from cfme_testcases.exceptions import TestcasesException
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+
+# the same default as in dump2polarion
+_DEFAULT_TIMEOUT = 600
+
+
+def _get_queue_url(xml_root, config):
+    if xml_root.tag == 'testcases':
+        return config.get('testcase_queue')
+    if xml_root.tag == 'testsuites':
+        return config.get('xunit_queue')
+    raise TestcasesException('Failed to verify submission - queue url not found')
+
+
+def _get_credentials(config, submit_args):
+    # the same order as in dump2polarion
+    return (
+        submit_args.get('user') or config.get('username') or os.environ.get('POLARION_USERNAME'),
+        submit_args.get('password') or config.get('password') or
+        os.environ.get('POLARION_PASSWORD'))
+
+
+def _check_outcome(job_data, job_name):
+    status = job_data.get('status') if job_data else None
+    if status and status.lower() == 'success':
+        return True
+    logger.error("Job '%s': status = %s, results not updated", job_name, status)
+    return False
+
+
+class _QueuePoller(object):
+    """Polls queue of completed jobs of the importer for all jobs waiting for verification.
+
+    The queue is polled often while jobs are completing and less and less often
+    (up to `max_delay` seconds) while nothing happens.
+    """
+
+    def __init__(self, queue_search, executor, min_delay=2.0, max_delay=30.0, max_pages=10):
+        self.queue_search = queue_search
+        self.executor = executor
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_pages = max_pages
+        self._init = None
+        self._waiting = {}
+        # jobs completed before anybody waited for them
+        self._seen = OrderedDict()
+        self._task = None
+        self._delay = min_delay
+
+    async def init(self, loop):
+        """Remembers the last completed job, must be done before submitting."""
+        if self._init is None:
+            self._init = loop.run_in_executor(self.executor, self.queue_search.queue_init)
+        return await self._init
+
+    def _get_new_jobs(self):
+        """Returns jobs completed since the last check, runs in executor."""
+        last_id = self.queue_search.last_id
+        newest_id = None
+        new_jobs = []
+        for page in range(1, self.max_pages + 1):
+            json_data = self.queue_search.download_queue(current_page=page)
+            if not json_data:
+                break
+            jobs = json_data.get('jobs') or []
+            if page == 1 and jobs:
+                newest_id = jobs[0].get('id')
+            for job_data in jobs:
+                if job_data.get('id') == last_id:
+                    break
+                new_jobs.append(job_data)
+            else:
+                if page < json_data.get('maxPages', 0):
+                    continue
+            break
+        if newest_id is not None:
+            self.queue_search.last_id = newest_id
+        return new_jobs
+
+    async def _poll(self, loop):
+        while True:
+            self._waiting = {
+                job_id: future for job_id, future in self._waiting.items() if not future.done()}
+            if not self._waiting:
+                return
+            await asyncio.sleep(self._delay)
+            new_jobs = await loop.run_in_executor(self.executor, self._get_new_jobs)
+            for job_data in new_jobs:
+                job_id = job_data.get('id')
+                future = self._waiting.pop(job_id, None)
+                if future is None:
+                    self._seen[job_id] = job_data
+                elif not future.done():
+                    future.set_result(job_data)
+            while len(self._seen) > 1000:
+                self._seen.popitem(last=False)
+            self._delay = self.min_delay if new_jobs else min(self._delay * 2, self.max_delay)
+
+    def wait_for(self, loop, job_id):
+        """Returns future that gets data of the job once it's completed."""
+        future = loop.create_future()
+        job_data = self._seen.pop(job_id, None)
+        if job_data is not None:
+            future.set_result(job_data)
+            return future
+        self._waiting[job_id] = future
+        # the new job will likely complete soon
+        self._delay = self.min_delay
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._poll(loop))
+        return future
+
+
+class AsyncScheduler(scheduler.Scheduler):
+    """Submits jobs first and then waits for their verification concurrently.
+
+    Jobs are `SubmitRequest`-like objects with `xml`, `submit_args`, `config` and
+    `log_file` attributes. At most `max_workers` submissions are running at once,
+    the number of jobs waiting for verification is not limited. Job is submitted
+    once all jobs it depends on were verified.
+    """
+
+    def __init__(self, max_workers=2, retries=0, backoff=10.0):
+        super(AsyncScheduler, self).__init__(
+            max_workers=max_workers, retries=retries, backoff=backoff)
+        self._pollers = {}
+        self._loop = None
+        self._executor = None
+        self._semaphore = None
+
+    def _get_poller(self, queue_url, credentials):
+        key = (queue_url,) + tuple(credentials)
+        if key not in self._pollers:
+            self._pollers[key] = _QueuePoller(
+                verify.QueueSearch(
+                    user=credentials[0], password=credentials[1], queue_url=queue_url),
+                self._executor)
+        return self._pollers[key]
+
+    async def _submit_and_verify(self, job):
+        request = job.func
+        submit_args = request.submit_args
+        config = request.config or configuration.get_config()
+        # XML parser is not thread safe, parse in the event loop thread
+        xml_root = request.xml if etree.iselement(request.xml) else utils.get_xml_root(
+            request.xml)
+        no_verify = submit_args.get('no_verify')
+
+        poller = None
+        if not no_verify:
+            poller = self._get_poller(
+                _get_queue_url(xml_root, config), _get_credentials(config, submit_args))
+            if not await poller.init(self._loop):
+                return False
+
+        async with self._semaphore:
+            logger.info("Submitting job '%s'", job.name)
+            response = await self._loop.run_in_executor(
+                self._executor,
+                functools.partial(submit.submit, xml_root=xml_root, config=config, **submit_args))
+        job_id = submit.get_job_id(response) if response else None
+        if no_verify or not job_id:
+            return bool(response)
+
+        timeout = submit_args.get('verify_timeout')
+        if timeout is None:
+            timeout = _DEFAULT_TIMEOUT
+        logger.debug("Waiting up to %s sec for completion of job '%s'", timeout, job.name)
+        try:
+            job_data = await asyncio.wait_for(poller.wait_for(self._loop, job_id), timeout)
+        except asyncio.TimeoutError:
+            job_data = None
+        if job_data and request.log_file:
+            await self._loop.run_in_executor(
+                self._executor, poller.queue_search.get_log, job_data, request.log_file)
+        return _check_outcome(job_data, job.name)
+
+    async def _run_job(self, job, finished):
+        deps = [finished[name] for name in job.depends_on]
+        if deps:
+            await asyncio.wait(deps)
+        outcomes = {dep.name: dep.outcome for dep in self.jobs}
+        if any(outcomes[dep] != scheduler.SUCCEEDED for dep in job.depends_on):
+            job.outcome = scheduler.SKIPPED
+            logger.info("Job '%s' skipped, dependency not met", job.name)
+            finished[job.name].set_result(job.outcome)
+            return
+
+        start = time.time()
+        while True:
+            job.attempts += 1
+            try:
+                retval = await self._submit_and_verify(job)
+            # pylint: disable=broad-except
+            except Exception as err:
+                logger.error("Job '%s' failed: %s", job.name, err)
+                job.error = err
+                retval = False
+            if retval or job.attempts > job.retries:
+                break
+            delay = self.backoff * 2 ** (job.attempts - 1)
+            logger.warning(
+                "Job '%s' failed, retrying in %.0f seconds (attempt %d of %d)",
+                job.name, delay, job.attempts + 1, job.retries + 1)
+            await asyncio.sleep(delay)
+        job.duration = time.time() - start
+        job.outcome = scheduler.SUCCEEDED if retval else scheduler.FAILED
+        logger.info("Job '%s' %s in %.1f seconds", job.name, job.outcome, job.duration)
+        finished[job.name].set_result(job.outcome)
+
+    async def _run_all(self, pending):
+        # the semaphore must be created in the running loop on older Pythons
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+        finished = {job.name: self._loop.create_future() for job in pending}
+        for job in self.jobs:
+            if job.outcome is not None:
+                finished[job.name] = self._loop.create_future()
+                finished[job.name].set_result(job.outcome)
+        # submit first the jobs that other jobs are waiting for
+        required = set(dep for job in pending for dep in job.depends_on)
+        pending = sorted(pending, key=lambda job: job.name not in required)
+        await asyncio.wait([self._loop.create_task(self._run_job(job, finished))
+                            for job in pending])
+
+    def run(self):
+        """Runs all jobs and returns them with outcomes filled in."""
+        pending = [job for job in self.jobs if job.outcome is None]
+        if not pending:
+            return self.jobs
+        self._loop = asyncio.new_event_loop()
+        # submissions and polling of the queues are blocking, run them in threads
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.max_workers + 4)
+        try:
+            self._loop.run_until_complete(self._run_all(pending))
+        finally:
+            self._executor.shutdown(wait=True)
+            self._loop.close()
+            self._loop = None
+            self._pollers = {}
+        return self.jobs
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Batch mode, all testruns from the manifest are processed in one run.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import argparse
+import copy
+import io
+import logging
+import os
+
+from collections import OrderedDict, namedtuple
+
+from cfme_testcases import import_files, lookup, pipeline, submissions, utils
+from cfme_testcases.exceptions import NothingToDoException, TestcasesException
+from cfme_testcases.input_xmls import InputXMLs
+from cfme_testcases.lazy_import import LazyModule
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+etree = LazyModule('lxml.etree')
+
+
+# testrun from the batch manifest, XML files are None when not specified
+BatchRun = namedtuple('BatchRun', 'testrun_id testcases testsuites')
+
+
+def read_batch_manifest(manifest):
+    """Reads testruns from the batch manifest.
+
+    Each line is `TESTRUN_ID [TESTCASES_XML TESTSUITES_XML]`, empty lines and
+    lines starting with '#' are ignored.
+    """
+    try:
+        with io.open(os.path.expanduser(manifest), encoding='utf-8') as input_file:
+            lines = input_file.readlines()
+    except (IOError, OSError) as err:
+        raise TestcasesException("Failed to read batch manifest '{}': {}".format(manifest, err))
+
+    runs = []
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        values = line.split()
+        if len(values) not in (1, 3):
+            raise TestcasesException(
+                "Invalid line {} in batch manifest '{}', expected"
+                " 'TESTRUN_ID [TESTCASES_XML TESTSUITES_XML]'".format(line_num, manifest))
+        runs.append(BatchRun(values[0], *(values[1:] or (None, None))))
+
+    if not runs:
+        raise NothingToDoException('No testruns in batch manifest {}'.format(manifest))
+    testrun_ids = [run.testrun_id for run in runs]
+    duplicates = sorted(set(
+        testrun_id for testrun_id in testrun_ids if testrun_ids.count(testrun_id) > 1))
+    if duplicates:
+        raise TestcasesException(
+            "Duplicate testruns in batch manifest '{}': {}".format(
+                manifest, ', '.join(duplicates)))
+    return runs
+
+
+def _get_run_args(args, run):
+    """Returns copy of the arguments for the testrun."""
+    run_args = argparse.Namespace(**vars(args))
+    run_args.testrun_id = run.testrun_id
+    run_args.testcases = run.testcases
+    run_args.testsuites = run.testsuites
+    return run_args
+
+
+def _get_batch_runs(args, runs):
+    """Fills in XML files of testruns, generates them once when needed."""
+    if all(run.testcases for run in runs):
+        return runs
+    if not (args.testcases and args.testsuites):
+        # the XMLs differ only in the testrun id that is set for each testrun anyway
+        pipeline.gen_pytest_xmls(_get_run_args(args, runs[0]))
+    testcases = args.testcases or import_files.TEST_CASE_XML
+    testsuites = args.testsuites or import_files.TEST_RUN_XML
+    return [run if run.testcases else run._replace(testcases=testcases, testsuites=testsuites)
+            for run in runs]
+
+
+def get_run_testsuites(args, testsuites_xml):
+    """Returns filtered testsuites with the testrun id of the testrun.
+
+    In streaming mode the XML (with missing testcases only) is loaded and
+    written to new file.
+    """
+    if testsuites_xml is None:
+        return None
+    if etree.iselement(testsuites_xml):
+        xml_root = copy.deepcopy(testsuites_xml)
+    else:
+        xml_root = utils.get_xml_root(testsuites_xml)
+    utils.set_property(xml_root, 'polarion-testrun-id', args.testrun_id)
+    if args.streaming:
+        return import_files.write_import_file(args, xml_root, args.testsuites, 'missing')
+    return xml_root
+
+
+# testruns sharing the same input XMLs, the XMLs are filtered and the testcases
+# are submitted once for all of them
+BatchGroup = namedtuple('BatchGroup', 'args runs input_xmls')
+
+
+def _get_batch_groups(args, runs):
+    groups = OrderedDict()
+    for run in runs:
+        groups.setdefault((run.testcases, run.testsuites), []).append(run)
+    return [BatchGroup(
+        _get_run_args(args, group_runs[0]),
+        group_runs,
+        InputXMLs(testcases, testsuites, streaming=args.streaming))
+            for (testcases, testsuites), group_runs in groups.items()]
+
+
+def _save_batch_xmls(args, group_args, filtered_xmls, runs_testsuites):
+    """Saves the XMLs if instructed to do so, returns names of the files."""
+    if args.streaming:
+        written = [xml_file for xml_file in filtered_xmls if xml_file is not None]
+        if filtered_xmls.missing_testsuites is not None:
+            # superseded by the testsuites of the testruns
+            written.remove(filtered_xmls.missing_testsuites)
+            if filtered_xmls.missing_testsuites not in runs_testsuites:
+                os.remove(filtered_xmls.missing_testsuites)
+        return written + [xml_file for xml_file in runs_testsuites if xml_file is not None]
+    if not (args.no_submit or args.output_dir):
+        return []
+
+    written = []
+    if filtered_xmls.missing_testcases is not None:
+        written.append(import_files.write_import_file(
+            group_args, filtered_xmls.missing_testcases, group_args.testcases, 'missing'))
+    if filtered_xmls.updated_testcases is not None:
+        written.append(import_files.write_import_file(
+            group_args, filtered_xmls.updated_testcases, group_args.testcases, 'update'))
+    if filtered_xmls.renamed_testcases is not None:
+        written.append(import_files.write_import_file(
+            group_args, filtered_xmls.renamed_testcases, group_args.testcases, 'renamed'))
+    return written
+
+
+def run_batch(args, dump2polarion_config, run_metrics):
+    """Creates and submits XMLs for all testruns from the batch manifest.
+
+    The SVN repo is loaded once and each distinct pair of input XMLs is parsed
+    and filtered once. Missing and updated testcases are submitted once for all
+    testruns sharing the XMLs, all submissions run in one pool of workers.
+    """
+    if args.testrun_init:
+        raise TestcasesException('Initialization of testruns is not supported in batch mode')
+    runs = read_batch_manifest(args.batch)
+
+    with run_metrics.phase('collection'):
+        runs = _get_batch_runs(args, runs)
+    groups = _get_batch_groups(args, runs)
+    if args.job_log and len(groups) > 1:
+        raise TestcasesException(
+            'The job log can be specified only when all testruns share the same XMLs')
+    logger.info('Processing %d testruns with %d distinct sets of XMLs', len(runs), len(groups))
+
+    polarion_testcases = None
+    missing_by_group = []
+    renames_by_group = []
+    unknown_by_group = []
+    with run_metrics.phase('missing') as phase:
+        if args.use_svn:
+            all_testcases = set()
+            for group in groups:
+                all_testcases.update(group.input_xmls.get_testcases_names())
+            polarion_testcases = lookup.load_svn_testcases(
+                args, None if lookup.renames_wanted(args) else all_testcases)
+            phase.count('polarion_testcases', len(polarion_testcases))
+        for group in groups:
+            found_renames = unknown = None
+            if args.use_svn:
+                missing, unknown = lookup.get_missing_from_svn(
+                    group.args, group.input_xmls, polarion_testcases)
+                if args.hybrid_missing:
+                    missing, unknown = lookup.get_missing_hybrid(
+                        group.args, submissions.get_submit_args(group.args), dump2polarion_config,
+                        group.input_xmls, polarion_testcases, missing, unknown, phase=phase)
+                found_renames = lookup.get_renames(
+                    group.args, group.input_xmls, missing, polarion_testcases)
+            else:
+                missing = lookup.get_missing_from_log(
+                    group.args, submissions.get_submit_args(group.args), dump2polarion_config,
+                    group.input_xmls)
+            missing_by_group.append(missing)
+            renames_by_group.append(found_renames)
+            unknown_by_group.append(unknown)
+            phase.add('missing', len(missing))
+            if found_renames is not None:
+                phase.add('renames', len(found_renames))
+
+    filtered_by_run = OrderedDict()
+    filtered_by_group = []
+    with run_metrics.phase('filter') as phase:
+        for group, missing, found_renames, unknown in zip(
+                groups, missing_by_group, renames_by_group, unknown_by_group):
+            filtered_xmls = pipeline.get_filtered_xmls(
+                group.args, group.input_xmls, missing, polarion_testcases, phase=phase,
+                found_renames=found_renames, unknown=unknown)
+            filtered_by_group.append(filtered_xmls)
+            for run in group.runs:
+                run_args = _get_run_args(args, run)
+                filtered_by_run[run.testrun_id] = (run_args, filtered_xmls._replace(
+                    missing_testsuites=get_run_testsuites(
+                        run_args, filtered_xmls.missing_testsuites)))
+
+    with run_metrics.phase('save') as phase:
+        for group, filtered_xmls in zip(groups, filtered_by_group):
+            runs_testsuites = [filtered_by_run[run.testrun_id][1].missing_testsuites
+                               for run in group.runs]
+            written = _save_batch_xmls(args, group.args, filtered_xmls, runs_testsuites)
+            if not args.streaming and (args.no_submit or args.output_dir):
+                for run in group.runs:
+                    run_args, run_filtered = filtered_by_run[run.testrun_id]
+                    if run_filtered.missing_testsuites is not None:
+                        written.append(import_files.write_import_file(
+                            run_args, run_filtered.missing_testsuites, run.testsuites,
+                            'missing'))
+            phase.add('bytes_written', sum(os.path.getsize(fname) for fname in written))
+
+    if args.no_submit:
+        return
+    with run_metrics.phase('submit'):
+        submissions.submit_batch(
+            args, dump2polarion_config, groups, filtered_by_group, filtered_by_run,
+            metrics=run_metrics if args.metrics_file else None)
@@ -6,25 +6,44 @@ Create new testrun and upload missing testcases using Polarion Importers.
 from __future__ import unicode_literals, absolute_import
 
 import argparse
-import datetime
 import logging
-import os
-import random
-import string
-import threading
 
-from dump2polarion import configuration, submit
-
-from cfme_testcases import filters, gen_xmls, parselog, svn_testcases, utils
+from cfme_testcases import (
+    collection_cache,
+    filters,
+    metrics,
+)
 from cfme_testcases.exceptions import NothingToDoException, TestcasesException
+from cfme_testcases.lazy_import import LazyModule
 
 
 # pylint: disable=invalid-name
 logger = logging.getLogger(__name__)
 
+# modules needed only on some code paths are imported on first use to keep startup fast
+batch = LazyModule('cfme_testcases.batch')
+configuration = LazyModule('dump2polarion.configuration')
+lookup = LazyModule('cfme_testcases.lookup')
+pipeline = LazyModule('cfme_testcases.pipeline')
+submissions = LazyModule('cfme_testcases.submissions')
+svn_daemon = LazyModule('cfme_testcases.svn_daemon')
+
+
+def _id_range(value):
+    """Parses range of workitem numbers in the LOW-HIGH format, bounds are optional."""
+    try:
+        low, high = value.split('-')
+        return (int(low) if low else None, int(high) if high else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid range '{}', expected LOW-HIGH".format(value))
+
 
-_TEST_RUN_XML = 'test_run_import.xml'
-_TEST_CASE_XML = 'test_case_import.xml'
+def _fields_list(value):
+    """Parses comma separated list of fields."""
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    if not fields:
+        raise argparse.ArgumentTypeError("invalid list of fields '{}'".format(value))
+    return fields
 
 
 def get_args(args=None):
@@ -32,8 +51,16 @@ def get_args(args=None):
     parser = argparse.ArgumentParser(description='cfme-testcases')
     parser.add_argument('-t', '--testrun-id',
                         help='Polarion test run id')
+    parser.add_argument('--batch', metavar='MANIFEST',
+                        help='Process all testruns listed in the file, one'
+                             ' "TESTRUN_ID [TESTCASES_XML TESTSUITES_XML]" per line')
     parser.add_argument('-o', '--output_dir',
                         help='Directory for saving generated XML files')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Filter the XML files without loading them into memory,'
+                             ' the filtered files are saved to disk')
+    parser.add_argument('--gzip-output', action='store_true',
+                        help='Compress XML files saved to the output dir with gzip')
     parser.add_argument('-n', '--no-submit', action='store_true',
                         help='Don\'t submit generated XML files')
     parser.add_argument('--testrun-init', action='store_true',
@@ -42,6 +69,13 @@ def get_args(args=None):
                         help='Don\'t add new testcases to testrun')
     parser.add_argument('--no-testcases-update', action='store_true',
                         help='Don\'t update existing testcases')
+    parser.add_argument('--update-fields', type=_fields_list, metavar='FIELD[,FIELD]',
+                        default=filters.UPDATED_FIELDS,
+                        help='Custom fields of existing testcases to update'
+                             ' (default: %s)' % ','.join(filters.UPDATED_FIELDS))
+    parser.add_argument('--update-all', action='store_true',
+                        help='Update all existing testcases, don\'t skip testcases with'
+                             ' the same values of fields in the SVN repo')
     parser.add_argument('--user',
                         help='Username to use to submit to Polarion')
     parser.add_argument('--password',
@@ -59,25 +93,75 @@ def get_args(args=None):
     parser.add_argument('--verify-timeout', type=int, default=600, metavar='SEC',
                         help='How long to wait (in seconds) for verification of submission success'
                              ' (default: %(default)s)')
+    parser.add_argument('--async-verify', action='store_true',
+                        help='Submit all XML files first and wait for verification of all of'
+                             ' them at once (Python 3.5.2+)')
+    parser.add_argument('--chunk-size', type=int, metavar='N',
+                        help='Submit missing and updated testcases in chunks of N testcases')
+    parser.add_argument('--submit-workers', type=int, default=2, metavar='N',
+                        help='How many submissions can run at once (default: %(default)s)')
+    parser.add_argument('--submit-retries', type=int, default=0, metavar='N',
+                        help='How many times to retry failed submission (default: %(default)s)')
+    parser.add_argument('--collect-jobs', type=int, default=1, metavar='N',
+                        help='Collect tests in N processes, each collecting subset of'
+                             ' the tests (default: %(default)s)')
+    parser.add_argument('--collect-timeout', type=int, metavar='SEC',
+                        help='Terminate the tests collection when it doesn\'t finish in time')
+    parser.add_argument('--collect-stats-file', metavar='FILE',
+                        help='Append duration and peak memory of the tests collection'
+                             ' to the file as JSON line')
+    parser.add_argument('--collection-cache-dir', metavar='DIR',
+                        help='Directory for caching XMLs generated by pytest collection')
+    parser.add_argument('--collection-cache-size', type=int, default=500, metavar='MB',
+                        help='Size limit of the collection cache (default: %(default)s)')
+    parser.add_argument('--collection-cache-policy', choices=collection_cache.POLICIES,
+                        default='lru',
+                        help='Which entries to evict from the full collection cache'
+                             ' (default: %(default)s)')
+    parser.add_argument('--no-collection-cache', action='store_true',
+                        help='Always run pytest collection, don\'t use the collection cache')
     parser.add_argument('--use-svn', metavar='SVN_REPO',
                         help='Path to SVN repo with Polarion project')
+    parser.add_argument('--svn-index', metavar='INDEX_FILE',
+                        help='Path to file with persistent index of the SVN repo'
+                             ' (default: in user\'s cache dir)')
+    parser.add_argument('--no-svn-index', action='store_true',
+                        help='Don\'t use persistent index of the SVN repo')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help='Number of processes for parsing the SVN repo (default: %(default)s)')
+    parser.add_argument('--svn-id-range', type=_id_range, metavar='LOW-HIGH',
+                        help='Load only workitems with numbers in the range from the SVN repo'
+                             ' (needs --hybrid-missing)')
+    parser.add_argument('--svn-daemon-socket', metavar='SOCKET',
+                        help='Path to socket of the SVN daemon (default: in user\'s runtime dir)')
+    parser.add_argument('--no-svn-daemon', action='store_true',
+                        help='Don\'t use the SVN daemon even if it\'s running')
+    parser.add_argument('--hybrid-missing', action='store_true',
+                        help='Check using dry-run submit only testcases that are not confirmed'
+                             ' by the SVN repo (needs --use-svn)')
+    parser.add_argument('--check-svn-server', action='store_true',
+                        help='With --hybrid-missing, ask the SVN server for workitems changed'
+                             ' after the revision of the working copy instead of using'
+                             ' the persistent index of the SVN repo')
+    parser.add_argument('--detect-renames', action='store_true',
+                        help='Report missing testcases that are likely renamed existing'
+                             ' testcases (needs --use-svn)')
+    parser.add_argument('--map-renames', action='store_true',
+                        help='Rename the existing testcases instead of adding the likely'
+                             ' renamed testcases as new (needs --use-svn)')
+    parser.add_argument('--rename-threshold', type=float, default=0.7, metavar='SCORE',
+                        help='Minimal similarity (0-1) of names of renamed testcases'
+                             ' (default: %(default)s)')
+    parser.add_argument('--metrics-file', metavar='FILE',
+                        help='Write timing and resource metrics of the run to the file')
+    parser.add_argument('--metrics-format', choices=metrics.FORMATS, default='json',
+                        help='Format of the metrics file, "prometheus" is for the node exporter'
+                             ' textfile collector (default: %(default)s)')
     parser.add_argument('--log-level',
                         help='Set logging to specified level')
     return parser.parse_args(args)
 
 
-def get_submit_args(args):
-    """Gets arguments for the `submit_and_verify` method."""
-    submit_args = dict(
-        testrun_id=args.testrun_id,
-        user=args.user,
-        password=args.password,
-        no_verify=args.no_verify,
-        verify_timeout=args.verify_timeout,
-    )
-    return {k: v for k, v in submit_args.items() if v is not None}
-
-
 def init_log(log_level):
     """Initializes logging."""
     log_level = log_level or 'INFO'
@@ -86,241 +170,91 @@ def init_log(log_level):
         level=getattr(logging, log_level.upper(), logging.INFO))
 
 
-def gen_pytest_xmls(args):
-    """Generates the XML files when they were not specified on command line."""
-    if args.testcases and args.testsuites:
-        return
-
-    if not args.testrun_id:
-        raise TestcasesException('The testrun id was not specified')
-    gen_xmls.run_pytest(args.testrun_id)
-
-
-def _get_filename_str(args):
-    return '{}-{:%Y%m%d%H%M%S}'.format(
-        args.testrun_id or
-        ''.join(random.sample(string.ascii_lowercase, 5)), datetime.datetime.now())
-
-
-def _get_import_file_name(args, file_name, path, key):
-    return os.path.join(
-        path,
-        'import-{0}-{1}-{2}'.format(_get_filename_str(args), key, file_name))
-
-
-def get_init_logname(args):
-    """Returns filename of the message bus log file."""
-    if args.job_log:
-        job_log = args.job_log
-    else:
-        job_log = 'init-job-{}.log'.format(_get_filename_str(args))
-        job_log = os.path.join(args.output_dir or '', job_log)
-    return job_log
-
-
-def initial_submit(args, submit_args, config, log):
-    """Submits XML to Polarion and saves the log file returned by the message bus."""
-    if os.path.isfile(log) and not args.testrun_init:
-        # log file already exists, no need to generate one
-        return
-    elif args.no_submit:
-        raise NothingToDoException(
-            'Instructed not to submit and as the message bus log is missing, '
-            'there\'s nothing more to do')
-
-    if args.testrun_init:
-        # we want to init new test run
-        fname = _TEST_RUN_XML
-        xml_root = utils.get_xml_root(fname)
-    else:
-        # we want to just get the log file without changing anything
-        fname = _TEST_CASE_XML
-        xml_root = utils.get_xml_root(fname)
-        utils.set_dry_run(xml_root)
-        utils.set_lookup_method(xml_root, 'name')
-
-    utils.remove_response_property(xml_root)
-
-    if args.output_dir:
-        path, name = os.path.split(fname)
-        init_file = _get_import_file_name(args, name, args.output_dir or path, 'init')
-        utils.write_xml(xml_root, init_file)
-
-    if not submit.submit_and_verify(
-            xml_root=xml_root,
-            config=config,
-            log_file=log,
-            **submit_args):
-        raise TestcasesException('Failed to do the initial submit')
-
-
-def save_filtered_xmls(args, testcases, testsuites, filtered_xmls):
-    """Saves the generated XML files if instructed to do so."""
-    if not (args.no_submit or args.output_dir):
-        return
-
-    if filtered_xmls.missing_testcases is not None:
-        path, name = os.path.split(testcases)
-        filter_testcases_file = _get_import_file_name(
-            args, name, args.output_dir or path, 'missing')
-        utils.write_xml(filtered_xmls.missing_testcases, filter_testcases_file)
-
-        path, name = os.path.split(testsuites)
-        filter_testsuites_file = _get_import_file_name(
-            args, name, args.output_dir or path, 'missing')
-        utils.write_xml(filtered_xmls.missing_testsuites, filter_testsuites_file)
-
-    if filtered_xmls.updated_testcases is not None:
-        path, name = os.path.split(testcases)
-        filter_testcases_file = _get_import_file_name(
-            args, name, args.output_dir or path, 'update')
-        utils.write_xml(filtered_xmls.updated_testcases, filter_testcases_file)
-
-
-def _get_job_log(args, prefix):
-    job_log = None
-    if args.output_dir:
-        job_log = 'job-{}-{}.log'.format(prefix, _get_filename_str(args))
-        job_log = os.path.join(args.output_dir, job_log)
-    return job_log
-
-
-def update_existing_testcases(args, submit_args, config, filtered_xmls):
-    """Updates existing testcases in new thread."""
-    output = []
-    updating_testcases_t = None
-    if not args.no_testcases_update and filtered_xmls.updated_testcases is not None:
-        job_log = _get_job_log(args, 'update')
-        all_submit_args = dict(
-            xml_root=filtered_xmls.updated_testcases,
-            config=config,
-            log_file=job_log,
-            **submit_args)
-
-        # run it in separate thread so we can continue without waiting
-        # for the submit to finish
-        def _run_submit(results, args_dict):
-            retval = submit.submit_and_verify(**args_dict)
-            results.append(retval)
-
-        updating_testcases_t = threading.Thread(
-            target=_run_submit, args=(output, all_submit_args,))
-        updating_testcases_t.start()
-
-    return updating_testcases_t, output
-
-
-def create_missing_testcases(args, submit_args, config, filtered_xmls):
-    """Creates missing testcases in Polarion."""
-    job_log = _get_job_log(args, 'testcases')
-    retval = submit.submit_and_verify(
-        xml_root=filtered_xmls.missing_testcases,
-        config=config,
-        log_file=job_log,
-        **submit_args
-    )
-    return retval
-
-
-def add_missing_testcases_to_testrun(args, submit_args, config, filtered_xmls):
-    """Adds missing testcases to testrun."""
-    job_log = _get_job_log(args, 'testrun')
-    retval = submit.submit_and_verify(
-        xml_root=filtered_xmls.missing_testsuites,
-        config=config,
-        log_file=job_log,
-        **submit_args
-    )
-    return retval
-
-
-def submit_filtered_xmls(args, submit_args, config, filtered_xmls):
-    """Submits filtered XMLs to Polarion Importers."""
-    if args.no_submit:
-        return
-
-    succeeded = []
-    failed = []
-
-    def _append_msg(retval, msg):
-        if retval:
-            succeeded.append(msg)
-        else:
-            failed.append(msg)
-
-    # start update of existing testcases in separate thread
-    updating_testcases_t, output = update_existing_testcases(
-        args, submit_args, config, filtered_xmls)
-
-    # create missing testcases in Polarion
-    missing_testcases_submitted = False
-    if filtered_xmls.missing_testcases is not None:
-        missing_testcases_submitted = create_missing_testcases(
-            args, submit_args, config, filtered_xmls)
-        _append_msg(missing_testcases_submitted, 'add missing testcases')
-
-    # add missing testcases to testrun
-    if (missing_testcases_submitted and
-            not args.no_testrun_update and
-            filtered_xmls.missing_testsuites is not None):
-        missing_testcases_added = add_missing_testcases_to_testrun(
-            args, submit_args, config, filtered_xmls)
-        _append_msg(missing_testcases_added, 'update testrun')
-
-    # wait for update of existing testcases to finish
-    if updating_testcases_t:
-        updating_testcases_t.join()
-        _append_msg(output.pop(), 'update existing testcases')
-
-    if succeeded and failed:
-        logger.info('SUCCEEDED to %s', ', '.join(succeeded))
-    if failed:
-        raise TestcasesException('FAILED to {}'.format(', '.join(failed)))
-
-    logger.info('DONE - RECORDS SUCCESSFULLY UPDATED!')
-
-
-def get_missing_from_log(args, submit_args, dump2polarion_config):
-    """Gets missing testcases from log file."""
-    init_logname = get_init_logname(args)
-    initial_submit(args, submit_args, dump2polarion_config, init_logname)
-    missing = parselog.get_missing(init_logname)
-    return missing
-
-
-def get_missing_from_svn(testcases_file, repo_dir):
-    """Gets missing testcases using SVN repo."""
-    all_testcases = utils.get_all_testcases(testcases_file)
-    missing = svn_testcases.get_missing(repo_dir, all_testcases)
-    return missing
-
-
 def main(args=None):
     """Main function for cli."""
     args = get_args(args)
-    submit_args = get_submit_args(args)
+    submit_args = submissions.get_submit_args(args)
 
     init_log(args.log_level)
 
     dump2polarion_config = configuration.get_config(
         args.dump2polarion_config) if args.dump2polarion_config else None
 
-    testcases = args.testcases or _TEST_CASE_XML
-    testsuites = args.testsuites or _TEST_RUN_XML
-
+    run_metrics = metrics.Metrics()
     try:
-        gen_pytest_xmls(args)
-        if args.use_svn:
-            missing = get_missing_from_svn(testcases, args.use_svn)
+        if lookup.renames_wanted(args) and not args.use_svn:
+            raise TestcasesException(
+                'Detection of renamed testcases needs the SVN repo (--use-svn)')
+        if args.hybrid_missing and not args.use_svn:
+            raise TestcasesException(
+                'Hybrid check of missing testcases needs the SVN repo (--use-svn)')
+        if args.svn_id_range and not args.hybrid_missing:
+            # testcases not found in the range could exist outside of it
+            raise TestcasesException(
+                'Only the hybrid check (--hybrid-missing) can find missing testcases'
+                ' when loading a range of workitems (--svn-id-range)')
+        if args.batch:
+            batch.run_batch(args, dump2polarion_config, run_metrics)
         else:
-            missing = get_missing_from_log(args, submit_args, dump2polarion_config)
-        filtered_xmls = filters.get_filtered_xmls(testcases, testsuites, missing)
-        save_filtered_xmls(args, testcases, testsuites, filtered_xmls)
-        submit_filtered_xmls(args, submit_args, dump2polarion_config, filtered_xmls)
+            pipeline.run(args, submit_args, dump2polarion_config, run_metrics)
     except NothingToDoException as einfo:
         logger.info(einfo)
         return 0
     except TestcasesException as err:
         logger.fatal(err)
         return 1
+    finally:
+        if args.metrics_file:
+            try:
+                run_metrics.write(args.metrics_file, args.metrics_format)
+            except TestcasesException as err:
+                logger.error(err)
+    return 0
+
+
+def get_daemon_args(args=None):
+    """Get command line arguments of the SVN daemon."""
+    parser = argparse.ArgumentParser(
+        description='Serve testcases from SVN repo with Polarion project to cfme-testcases')
+    parser.add_argument('use_svn', metavar='SVN_REPO',
+                        help='Path to SVN repo with Polarion project')
+    parser.add_argument('--svn-daemon-socket', metavar='SOCKET',
+                        help='Path to socket to listen on (default: in user\'s runtime dir)')
+    parser.add_argument('--svn-index', metavar='INDEX_FILE',
+                        help='Path to file with persistent index of the SVN repo'
+                             ' (default: in user\'s cache dir)')
+    parser.add_argument('--no-svn-index', action='store_true',
+                        help='Don\'t use persistent index of the SVN repo')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help='Number of processes for parsing the SVN repo (default: %(default)s)')
+    parser.add_argument('--svn-id-range', type=_id_range, metavar='LOW-HIGH',
+                        help='Load only workitems with numbers in the range from the SVN repo')
+    parser.add_argument('--poll-interval', type=float, default=2.0, metavar='SEC',
+                        help='How often to check the SVN repo for changes when inotify'
+                             ' is not available (default: %(default)s)')
+    parser.add_argument('--rescan-interval', type=float, default=600.0, metavar='SEC',
+                        help='How often to re-scan the SVN repo even if no change was noticed'
+                             ' (default: %(default)s)')
+    parser.add_argument('--log-level',
+                        help='Set logging to specified level')
+    return parser.parse_args(args)
+
+
+def daemon_main(args=None):
+    """Main function for the SVN daemon."""
+    args = get_daemon_args(args)
+    init_log(args.log_level)
+
+    try:
+        svn_daemon.run_daemon(
+            args.use_svn,
+            socket_path=lookup.get_svn_daemon_socket(args),
+            index_file=lookup.get_svn_index_file(args),
+            jobs=args.jobs,
+            id_range=args.svn_id_range,
+            poll_interval=args.poll_interval,
+            rescan_interval=args.rescan_interval)
+    except TestcasesException as err:
+        logger.fatal(err)
+        return 1
     return 0
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of XML files generated by pytest collection.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import errno
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+from cfme_testcases.exceptions import TestcasesException
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+
+_CACHE_VERSION = '2'
+
+# files and directories (relative to the integration tests repo) that affect the collection
+HASHED_PATHS = (
+    'conftest.py',
+    'pytest.ini',
+    'setup.cfg',
+    'cfme/tests',
+    'cfme/fixtures',
+    'cfme/markers',
+    'cfme/test_framework',
+    'cfme/utils',
+    'conf/cfme_data.yaml',
+    'conf/supportability.yaml',
+)
+
+HASHED_SUFFIXES = ('.py', '.yaml', '.yml', '.ini', '.cfg')
+
+POLICIES = ('lru', 'fifo')
+
+_STORED_MARK = '.stored'
+_USED_MARK = '.used'
+_TMP_PREFIX = '.tmp-'
+
+
+def get_default_cache_dir():
+    """Returns path to the collection cache in the user's cache dir."""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_dir, 'cfme-testcases', 'collections')
+
+
+def _iter_hashed_files(root_dir, paths):
+    for path in paths:
+        full_path = os.path.join(root_dir, path)
+        if os.path.isfile(full_path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(full_path):
+            # walk in stable order so the hash doesn't depend on the file system
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(HASHED_SUFFIXES):
+                    yield os.path.relpath(os.path.join(dirpath, filename), root_dir)
+
+
+def _iter_distributions():
+    """Yields (name, version, entry point groups) of installed distributions."""
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+
+    if metadata is not None:
+        for dist in metadata.distributions():
+            yield (
+                dist.metadata['Name'],
+                dist.version,
+                set(entry_point.group for entry_point in dist.entry_points))
+        return
+
+    try:
+        import pkg_resources
+    except ImportError:
+        return
+    for dist in pkg_resources.working_set:
+        yield dist.project_name, dist.version, set(dist.get_entry_map())
+
+
+def get_plugin_versions():
+    """Returns sorted list of versions of pytest and of installed pytest plugins."""
+    versions = set()
+    for name, version, groups in _iter_distributions():
+        if name and (name.lower() == 'pytest' or 'pytest11' in groups):
+            versions.add('{}=={}'.format(name, version))
+    return sorted(versions)
+
+
+def get_content_hash(pytest_args, root_dir='.', paths=HASHED_PATHS):
+    """Returns hash of everything that affects the collection.
+
+    That is content of the files, the collection command line and versions of pytest plugins.
+    """
+    content_hash = hashlib.sha256()
+    content_hash.update('{}\0'.format(_CACHE_VERSION).encode('utf-8'))
+    for item in list(pytest_args) + get_plugin_versions():
+        content_hash.update(item.encode('utf-8'))
+        content_hash.update(b'\0')
+    for path in _iter_hashed_files(root_dir, paths):
+        content_hash.update(path.replace(os.sep, '/').encode('utf-8'))
+        content_hash.update(b'\0')
+        with open(os.path.join(root_dir, path), 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(1024 * 1024), b''):
+                content_hash.update(chunk)
+        content_hash.update(b'\0')
+    return content_hash.hexdigest()
+
+
+def _touch(path):
+    with open(path, 'a'):
+        os.utime(path, None)
+
+
+class CollectionCache(object):
+    """Cache of generated XML files keyed on content hash of the tests.
+
+    Total size of the cache is kept under `max_size` bytes (no limit when 0),
+    entries are evicted either by least recent use ('lru') or by age ('fifo').
+    """
+
+    def __init__(self, cache_dir=None, max_size=500 * 1024 * 1024, policy='lru'):
+        if policy not in POLICIES:
+            raise TestcasesException(
+                "Unknown eviction policy '{}', expected one of {}".format(
+                    policy, ', '.join(POLICIES)))
+        self.cache_dir = os.path.expanduser(cache_dir or get_default_cache_dir())
+        self.max_size = max_size
+        self.policy = policy
+
+    def _get_entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def restore(self, key, files, dest_dir='.'):
+        """Restores cached `files` to the `dest_dir`, returns False on cache miss."""
+        entry_dir = self._get_entry_dir(key)
+        if not os.path.isfile(os.path.join(entry_dir, _STORED_MARK)):
+            return False
+
+        try:
+            for fname in files:
+                with gzip.open(os.path.join(entry_dir, fname + '.gz'), 'rb') as input_file, \
+                        open(os.path.join(dest_dir, fname), 'wb') as output_file:
+                    shutil.copyfileobj(input_file, output_file)
+            _touch(os.path.join(entry_dir, _USED_MARK))
+        except (IOError, OSError) as err:
+            logger.warning('Failed to restore files from collection cache: %s', err)
+            for fname in files:
+                try:
+                    os.remove(os.path.join(dest_dir, fname))
+                except OSError:
+                    pass
+            return False
+        return True
+
+    def store(self, key, files, src_dir='.'):
+        """Stores `files` from the `src_dir` to the cache."""
+        entry_dir = self._get_entry_dir(key)
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+        except OSError as err:
+            # the dir can be created by another process in the meantime
+            if err.errno != errno.EEXIST:
+                logger.warning('Failed to store files to collection cache: %s', err)
+                return
+        try:
+            tmp_dir = tempfile.mkdtemp(prefix=_TMP_PREFIX, dir=self.cache_dir)
+        except (IOError, OSError) as err:
+            logger.warning('Failed to store files to collection cache: %s', err)
+            return
+
+        try:
+            for fname in files:
+                with open(os.path.join(src_dir, fname), 'rb') as input_file, \
+                        gzip.open(os.path.join(tmp_dir, fname + '.gz'), 'wb') as output_file:
+                    shutil.copyfileobj(input_file, output_file)
+            _touch(os.path.join(tmp_dir, _STORED_MARK))
+            _touch(os.path.join(tmp_dir, _USED_MARK))
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            # make the entry visible only when complete
+            os.rename(tmp_dir, entry_dir)
+        except (IOError, OSError) as err:
+            logger.warning('Failed to store files to collection cache: %s', err)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        try:
+            self.evict()
+        except (IOError, OSError) as err:
+            logger.warning('Failed to evict entries from collection cache: %s', err)
+
+    def _get_entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(_TMP_PREFIX):
+                # entry that is being stored
+                continue
+            entry_dir = os.path.join(self.cache_dir, name)
+            stamp_file = os.path.join(
+                entry_dir, _USED_MARK if self.policy == 'lru' else _STORED_MARK)
+            try:
+                stamp = os.stat(stamp_file).st_mtime
+                size = sum(os.path.getsize(os.path.join(entry_dir, fname))
+                           for fname in os.listdir(entry_dir))
+            except OSError:
+                # incomplete entry or entry removed by another process
+                continue
+            entries.append((stamp, size, entry_dir))
+        return sorted(entries)
+
+    def evict(self):
+        """Removes oldest entries until size of the cache is under the limit."""
+        if not self.max_size:
+            return
+        entries = self._get_entries()
+        total_size = sum(size for __, size, __ in entries)
+        # the newest entry is always kept
+        for __, size, entry_dir in entries[:-1]:
+            if total_size <= self.max_size:
+                break
+            logger.debug('Evicting %s from collection cache', entry_dir)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
@@ -5,109 +5,454 @@ Filter missing testcases and testcases for update.
 
 from __future__ import absolute_import, unicode_literals
 
+import copy
 import os
 
 from collections import namedtuple
 
 from cfme_testcases import utils
 from cfme_testcases.exceptions import TestcasesException
+from cfme_testcases.lazy_import import LazyModule
 
 
-FilteredXMLs = namedtuple('FilteredXMLs', 'missing_testcases missing_testsuites updated_testcases')
+# pylint: disable=invalid-name
+etree = LazyModule('lxml.etree')
 
 
-def get_missing_testcases(testcases_file, missing):
+FilteredXMLs = namedtuple(
+    'FilteredXMLs', 'missing_testcases missing_testsuites updated_testcases renamed_testcases')
+# renamed testcases are there only when renames are mapped to existing testcases
+FilteredXMLs.__new__.__defaults__ = (None,)
+
+UPDATED_FIELDS = ('automation_script', 'caseautomation')
+
+
+def _check_root(xml_root, root_tag):
+    if xml_root.tag != root_tag:
+        raise TestcasesException(
+            "XML is not in expected format, expected '{}' root element".format(root_tag))
+
+
+def _shallow_copy(element):
+    """Returns copy of the element without its children."""
+    new_element = etree.Element(element.tag, element.attrib, nsmap=element.nsmap)
+    new_element.text = element.text
+    new_element.tail = element.tail
+    return new_element
+
+
+def _copy_selected(xml_root, child_tag, select):
+    """Returns new root with copies of children of `xml_root`.
+
+    Children with `child_tag` are passed to `select` which returns the element
+    to append (or None to skip it); all other children are copied as they are.
+    The input XML is not modified.
+    """
+    new_root = _shallow_copy(xml_root)
+    for child in xml_root:
+        if child.tag == child_tag:
+            child = select(child)
+            if child is not None:
+                new_root.append(child)
+        else:
+            new_root.append(copy.deepcopy(child))
+    return new_root
+
+
+def _get_updated_testcase(testcase, fields=UPDATED_FIELDS):
+    """Returns copy of the testcase with only the custom fields that are updated."""
+    # copying whole testcase is cheaper than building it element by element
+    testcase = copy.deepcopy(testcase)
+    cfields_parent = testcase.find('custom-fields')
+    if cfields_parent is not None:
+        for field in cfields_parent.findall('custom-field'):
+            if field.get('id') not in fields:
+                cfields_parent.remove(field)
+    return testcase
+
+
+def _get_renamed_testcase(testcase, work_item_id):
+    """Returns copy of the testcase that updates the existing testcase with the id."""
+    testcase = copy.deepcopy(testcase)
+    testcase.set('id', work_item_id)
+    return testcase
+
+
+def _normalize_value(value):
+    return (value or '').strip()
+
+
+class ChangedFieldsCheck(object):
+    """Checks if values of updated custom fields of testcase differ from values in Polarion.
+
+    `get_fields` returns dict of fields of testcase with given name (or None when
+    the testcase is not known). Number of unchanged testcases is counted in `skipped`.
+    """
+
+    def __init__(self, get_fields, fields=None):
+        self.get_fields = get_fields
+        self.fields = fields or UPDATED_FIELDS
+        self.skipped = 0
+
+    def __call__(self, testcase):
+        tc_id = testcase.get('id')
+        current = self.get_fields(tc_id) if tc_id else None
+        if current is None:
+            return True
+
+        cfields_parent = testcase.find('custom-fields')
+        if cfields_parent is not None:
+            for field in cfields_parent.iterchildren('custom-field'):
+                field_id = field.get('id')
+                if field_id not in self.fields:
+                    continue
+                if _normalize_value(field.get('content')) != _normalize_value(
+                        current.get(field_id)):
+                    return True
+
+        self.skipped += 1
+        return False
+
+
+def get_missing_testcases(testcases_root, missing):
     """Gets testcases missing in Polarion."""
     if not missing:
         return None
 
-    xml_root = utils.get_xml_root(testcases_file)
+    _check_root(testcases_root, 'testcases')
 
-    if xml_root.tag != 'testcases':
-        raise TestcasesException(
-            "XML file '{}' is not in expected format".format(testcases_file))
+    def _select(testcase):
+        tc_id = testcase.get('id')
+        if tc_id and tc_id not in missing:
+            return None
+        return copy.deepcopy(testcase)
 
+    xml_root = _copy_selected(testcases_root, 'testcase', _select)
     utils.remove_response_property(xml_root)
+    return xml_root
 
-    testcase_instances = xml_root.findall('testcase')
-    attr = 'id'
 
-    for testcase in testcase_instances:
-        tc_id = testcase.get(attr)
-        if tc_id and tc_id not in missing:
-            xml_root.remove(testcase)
+def get_renamed_testcases(testcases_root, renames):
+    """Gets renamed testcases, they update the existing testcases found by id.
+
+    `renames` is dict of testcase names and ids of the existing testcases.
+    """
+    if not renames:
+        return None
+
+    _check_root(testcases_root, 'testcases')
 
+    def _select(testcase):
+        tc_id = testcase.get('id')
+        if tc_id not in renames:
+            return None
+        return _get_renamed_testcase(testcase, renames[tc_id])
+
+    xml_root = _copy_selected(testcases_root, 'testcase', _select)
+    utils.remove_response_property(xml_root)
+    utils.set_lookup_method(xml_root, 'id')
     return xml_root
 
 
-def get_missing_testsuites(testsuite_file, missing):
-    """Gets testcases missing in testrun."""
-    if not missing:
-        return None
+def _get_not_renamed(missing, renames):
+    if not renames:
+        return missing
+    return set(missing or ()).difference(renames)
 
-    xml_root = utils.get_xml_root(testsuite_file)
 
-    if xml_root.tag != 'testsuites':
-        raise TestcasesException(
-            "XML file '{}' is not in expected format".format(testsuite_file))
+def read_testcases(testcases_file, names):
+    """Returns root with testcases with the `names` from the XML file.
+
+    The XML file is not loaded into memory at once, only the selected testcases are kept.
+    """
+    xml_root = None
+    for testcase in utils.iterparse_testcases(testcases_file):
+        if xml_root is None:
+            _check_streamed_root(testcase.getparent(), 'testcases', testcases_file)
+            xml_root = _get_headers(testcase.getparent())
+        if testcase.get('id') in names:
+            xml_root.append(copy.deepcopy(testcase))
 
+    if xml_root is None:
+        raise TestcasesException("No testcases found in XML file '{}'".format(testcases_file))
     utils.remove_response_property(xml_root)
+    return xml_root
 
-    testsuite = xml_root.find('testsuite')
-    testcase_parent = testsuite
-    testcase_instances = testcase_parent.findall('testcase')
-    attr = 'name'
 
-    for testcase in testcase_instances:
-        tc_id = testcase.get(attr)
-        if tc_id and tc_id not in missing:
-            testcase_parent.remove(testcase)
+def get_missing_testsuites(testsuites_root, missing):
+    """Gets testcases missing in testrun."""
+    if not missing:
+        return None
+
+    _check_root(testsuites_root, 'testsuites')
 
-    testcase_parent.set('tests', str(len(testcase_parent.findall('testcase'))))
-    testcase_parent.attrib.pop('errors', None)
-    testcase_parent.attrib.pop('failures', None)
-    testcase_parent.attrib.pop('skipped', None)
+    testsuite = testsuites_root.find('testsuite')
+    tests_count = [0]
 
+    def _select_testcase(testcase):
+        tc_id = testcase.get('name')
+        if tc_id and tc_id not in missing:
+            return None
+        tests_count[0] += 1
+        return copy.deepcopy(testcase)
+
+    def _select_testsuite(element):
+        if element is not testsuite:
+            return copy.deepcopy(element)
+        new_testsuite = _copy_selected(element, 'testcase', _select_testcase)
+        new_testsuite.set('tests', str(tests_count[0]))
+        new_testsuite.attrib.pop('errors', None)
+        new_testsuite.attrib.pop('failures', None)
+        new_testsuite.attrib.pop('skipped', None)
+        return new_testsuite
+
+    xml_root = _copy_selected(testsuites_root, 'testsuite', _select_testsuite)
+    utils.remove_response_property(xml_root)
     return xml_root
 
 
-def get_updated_testcases(testcases_file, missing):
-    """Gets testcases that will be updated in Polarion."""
+def get_updated_testcases(testcases_root, missing, fields=None, is_changed=None, unknown=None):
+    """Gets testcases that will be updated in Polarion.
+
+    Only the custom `fields` are updated. When `is_changed` is specified, only
+    testcases for which it returns True are included. Testcases in `unknown`
+    (not known whether they exist in Polarion) are not included.
+    """
     if missing is None:
         missing = []
+    unknown = unknown or ()
+    fields = fields or UPDATED_FIELDS
 
-    xml_root = utils.get_xml_root(testcases_file)
+    _check_root(testcases_root, 'testcases')
 
-    if xml_root.tag != 'testcases':
-        raise TestcasesException(
-            "XML file '{}' is not in expected format".format(testcases_file))
+    def _select(testcase):
+        # we lookup using "title" here, but it's value is the same as the value of "id"
+        tc_id = testcase.get('id')
+        if tc_id is not None and (tc_id in missing or tc_id in unknown):
+            return None
+        if is_changed is not None and not is_changed(testcase):
+            return None
+        return _get_updated_testcase(testcase, fields)
 
+    xml_root = _copy_selected(testcases_root, 'testcase', _select)
     utils.remove_response_property(xml_root)
     utils.set_lookup_method(xml_root, 'name')
-
-    testcase_instances = xml_root.findall('testcase')
-    # we lookup using "title" here, but it's value is the same as the value of "id"
-    attr = 'id'
-
-    for testcase in testcase_instances:
-        tc_id = testcase.get(attr)
-        if tc_id is not None and tc_id in missing:
-            xml_root.remove(testcase)
-            continue
-        cfields_parent = testcase.find('custom-fields')
-        cfields_instances = cfields_parent.findall('custom-field')
-        for field in cfields_instances:
-            field_id = field.get('id')
-            if field_id not in ('automation_script', 'caseautomation'):
-                cfields_parent.remove(field)
-
     return xml_root
 
 
-def get_filtered_xmls(testcases_xml, testsuites_xml, missing):
-    """Returns modified XMLs with testcases and testsuites."""
-    missing_testcases = get_missing_testcases(os.path.expanduser(testcases_xml), missing)
-    missing_testsuites = get_missing_testsuites(os.path.expanduser(testsuites_xml), missing)
-    updated_testcases = get_updated_testcases(os.path.expanduser(testcases_xml), missing)
+def get_filtered_xmls(
+        input_xmls, missing, fields=None, is_changed=None, renames=None, unknown=None):
+    """Returns modified XMLs with testcases and testsuites.
+
+    `input_xmls` is `InputXMLs` instance, its parsed XMLs are not modified.
+    When `is_changed` is specified and no testcase was changed, there's no XML
+    with updated testcases. Missing testcases in `renames` (dict of names and ids
+    of existing testcases) are not added, the existing testcases are renamed instead.
+    Testcases in `unknown` are neither added nor updated.
+    """
+    missing_testcases = get_missing_testcases(
+        input_xmls.testcases_root, _get_not_renamed(missing, renames))
+    missing_testsuites = get_missing_testsuites(input_xmls.testsuites_root, missing)
+    updated_testcases = get_updated_testcases(
+        input_xmls.testcases_root, missing, fields=fields, is_changed=is_changed,
+        unknown=unknown)
+    if is_changed is not None and updated_testcases.find('testcase') is None:
+        updated_testcases = None
+    renamed_testcases = get_renamed_testcases(input_xmls.testcases_root, renames)
+
+    return FilteredXMLs(
+        missing_testcases, missing_testsuites, updated_testcases, renamed_testcases)
+
+
+def _get_headers(xml_root):
+    """Returns copy of the root with elements preceding the first testcase (i.e. properties)."""
+    return _copy_selected(xml_root, 'testcase', lambda __: None)
+
+
+def _check_streamed_root(xml_root, root_tag, xml_file):
+    if xml_root.tag != root_tag or xml_root.getparent() is not None:
+        raise TestcasesException("XML file '{}' is not in expected format".format(xml_file))
+
+
+def _finish_writer(writer):
+    try:
+        writer.send(None)
+    except StopIteration:
+        pass
+
+
+def _stream_testcases(
+        testcases_file, missing, output_files, compress, fields, is_changed, renames, unknown):
+    """Filters missing, updated and renamed testcases in single pass over the XML file.
+
+    Only the missing testcases are kept in memory, updated testcases are written
+    to the output file as the input is being parsed. Returns names of written
+    files with missing, updated and renamed testcases.
+    """
+    updated_file = output_files.updated_testcases
+    missing_root = updated_writer = testcase = None
+    updated_count = 0
+    for testcase in utils.iterparse_testcases(testcases_file):
+        if missing_root is None:
+            _check_streamed_root(testcase.getparent(), 'testcases', testcases_file)
+            missing_root = _get_headers(testcase.getparent())
+            updated_writer = utils.xml_writer(
+                updated_file, get_updated_testcases(missing_root, missing, fields), compress)
+            next(updated_writer)
+
+        tc_id = testcase.get('id')
+        # renamed testcases are selected from the missing ones at the end
+        if not tc_id or tc_id in missing:
+            missing_root.append(copy.deepcopy(testcase))
+        if (tc_id is None or (tc_id not in missing and tc_id not in unknown)) and (
+                is_changed is None or is_changed(testcase)):
+            updated_writer.send(_get_updated_testcase(testcase, fields))
+            updated_count += 1
+
+    if missing_root is None:
+        raise TestcasesException("No testcases found in XML file '{}'".format(testcases_file))
+
+    # elements following the last testcase
+    for element in testcase.itersiblings():
+        missing_root.append(copy.deepcopy(element))
+        updated_writer.send(copy.deepcopy(element))
+    _finish_writer(updated_writer)
+    if is_changed is not None and not updated_count:
+        os.remove(updated_file)
+        updated_file = None
+
+    renamed_file = None
+    renamed_testcases = get_renamed_testcases(missing_root, renames)
+    if renamed_testcases is not None:
+        renamed_file = output_files.renamed_testcases
+        utils.write_xml(renamed_testcases, renamed_file, compress=compress)
+
+    missing_file = None
+    missing_testcases = get_missing_testcases(missing_root, _get_not_renamed(missing, renames))
+    if missing_testcases is not None:
+        missing_file = output_files.missing_testcases
+        utils.write_xml(missing_testcases, missing_file, compress=compress)
+    return missing_file, updated_file, renamed_file
+
+
+def _stream_testsuites(testsuites_file, missing, missing_file, compress):
+    """Filters testcases missing in testrun in single pass over the XML file.
+
+    Only the missing testcases are kept in memory.
+    """
+    if not missing:
+        return None
 
-    return FilteredXMLs(missing_testcases, missing_testsuites, updated_testcases)
+    missing_root = first_testsuite = testsuite = None
+    testsuites_map = {}
+    for testcase in utils.iterparse_testcases(testsuites_file):
+        testsuite = testcase.getparent()
+        if missing_root is None:
+            _check_streamed_root(testsuite.getparent(), 'testsuites', testsuites_file)
+            missing_root = _copy_selected(testsuite.getparent(), 'testsuite', lambda __: None)
+            first_testsuite = testsuite
+        if testsuite not in testsuites_map:
+            testsuites_map[testsuite] = _get_headers(testsuite)
+            missing_root.append(testsuites_map[testsuite])
+
+        # only the first testsuite is filtered, the same as in `get_missing_testsuites`
+        tc_id = testcase.get('name')
+        if testsuite is not first_testsuite or not tc_id or tc_id in missing:
+            testsuites_map[testsuite].append(copy.deepcopy(testcase))
+
+    if missing_root is None:
+        raise TestcasesException("No testcases found in XML file '{}'".format(testsuites_file))
+
+    # elements following the last testsuite
+    for element in testsuite.itersiblings():
+        missing_root.append(copy.deepcopy(element))
+
+    utils.write_xml(get_missing_testsuites(missing_root, missing), missing_file, compress=compress)
+    return missing_file
+
+
+def write_filtered_xmls(
+        testcases_xml,
+        testsuites_xml,
+        missing,
+        output_files,
+        compress=False,
+        fields=None,
+        is_changed=None,
+        renames=None,
+        unknown=None):
+    """Filters the XML files in streaming mode and writes the outputs.
+
+    Memory consumption stays roughly constant no matter how big the input files are.
+    `output_files` is `FilteredXMLs` with names of output files, returns `FilteredXMLs`
+    with names of files that were written.
+    """
+    missing_testcases, updated_testcases, renamed_testcases = _stream_testcases(
+        testcases_xml,
+        missing or (),
+        output_files,
+        compress,
+        fields or UPDATED_FIELDS,
+        is_changed,
+        renames,
+        unknown or ())
+    missing_testsuites = _stream_testsuites(
+        testsuites_xml, missing, output_files.missing_testsuites, compress)
+
+    return FilteredXMLs(
+        missing_testcases, missing_testsuites, updated_testcases, renamed_testcases)
+
+
+def _get_testsuite_chunk(testsuites_root, testcases):
+    """Returns copy of the root with `testcases` (list of testsuite, testcase tuples)."""
+    new_root = _copy_selected(testsuites_root, 'testsuite', lambda __: None)
+    new_testsuite = testsuite = None
+    for parent, testcase in testcases:
+        if parent is not testsuite:
+            testsuite = parent
+            new_testsuite = _get_headers(testsuite)
+            new_testsuite.set('tests', '0')
+            new_testsuite.attrib.pop('errors', None)
+            new_testsuite.attrib.pop('failures', None)
+            new_testsuite.attrib.pop('skipped', None)
+            new_root.append(new_testsuite)
+        new_testsuite.append(copy.deepcopy(testcase))
+        new_testsuite.set('tests', str(int(new_testsuite.get('tests')) + 1))
+    return new_root
+
+
+def split_xml(xml_root, chunk_size):
+    """Splits XML with testcases or testsuites into XMLs with at most `chunk_size` testcases.
+
+    Each chunk keeps the properties of the original XML. The input XML is not modified.
+    """
+    if chunk_size < 1:
+        raise TestcasesException('Chunk size must be at least 1')
+
+    if xml_root.tag == 'testcases':
+        testcases = list(xml_root.iterchildren('testcase'))
+    elif xml_root.tag == 'testsuites':
+        testcases = [(testsuite, testcase)
+                     for testsuite in xml_root.iterchildren('testsuite')
+                     for testcase in testsuite.iterchildren('testcase')]
+    else:
+        raise TestcasesException(
+            "XML is not in expected format, unexpected '{}' root element".format(xml_root.tag))
+
+    chunks = []
+    for start in range(0, len(testcases), chunk_size):
+        chunk_testcases = testcases[start:start + chunk_size]
+        if xml_root.tag == 'testcases':
+            chunk = _get_headers(xml_root)
+            chunk.extend(copy.deepcopy(testcase) for testcase in chunk_testcases)
+        else:
+            chunk = _get_testsuite_chunk(xml_root, chunk_testcases)
+        chunks.append(chunk)
+    return chunks
+
+
+def get_testcases_names(xml_root):
+    """Returns set of names of testcases in XML with testcases or testsuites."""
+    if xml_root.tag == 'testcases':
+        return set(tc.get('id') for tc in xml_root.iterchildren('testcase') if tc.get('id'))
+    return set(tc.get('name') for tc in xml_root.iterfind('testsuite/testcase') if tc.get('name'))
@@ -5,11 +5,28 @@ Run pytest --collect-only and generate XMLs.
 
 from __future__ import absolute_import, unicode_literals
 
+import json
 import logging
 import os
+import re
+import shutil
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+from cfme_testcases import collection_cache, utils
 from cfme_testcases.exceptions import TestcasesException
 
 
@@ -37,12 +54,7 @@ def _cleanup():
             pass
 
 
-def run_pytest(testrun_id):
-    """Runs the pytest command."""
-    pytest_retval = None
-    _check_environment()
-    _cleanup()
-
+def _get_pytest_args(testrun_id, paths=None, rootdir=None):
     args = [
         'miq-runtest',
         '-qq',
@@ -55,20 +67,355 @@ def run_pytest(testrun_id):
         '--xmls-testrun-id',
         str(testrun_id)
     ]
+    if rootdir:
+        args.extend(('--rootdir', rootdir))
+    if paths:
+        args.extend(paths)
+    return args
 
-    logger.info("Generating the XMLs using '%s'", ' '.join(args))
-    with open(os.devnull, 'w') as devnull:
-        pytest_proc = subprocess.Popen(args, stdout=devnull, stderr=devnull)
-        try:
-            pytest_retval = pytest_proc.wait()
-        # pylint: disable=broad-except
-        except Exception:
-            try:
-                pytest_proc.terminate()
-            except OSError:
-                pass
-            pytest_proc.wait()
-            return None
+
+# e.g. "collected 10 items", "10 tests collected in 1.23 seconds"
+_COLLECTED_SEARCH = re.compile(r'collected ([0-9]+) items?|([0-9]+) (?:tests?|items?) collected')
+# with "-qq" number of items collected from each file is printed, e.g. "cfme/tests/test_a.py: 10"
+_FILE_COLLECTED_SEARCH = re.compile(r'^(.+\.py): ([0-9]+)$')
+
+CollectionStats = namedtuple(
+    'CollectionStats', 'retval duration max_rss collected errors shards')
+
+
+class CollectionProgress(object):
+    """Progress of collection, updated from output of the collection processes."""
+
+    def __init__(self, log_interval=10.0):
+        self.log_interval = log_interval
+        self.collected = 0
+        self.reported = None
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._last_log = time.time()
+
+    @property
+    def total(self):
+        """Number of collected items as reported by pytest or as counted from the output."""
+        return self.collected if self.reported is None else self.reported
+
+    def add_line(self, line, name=None):
+        """Processes line of output of the collection process."""
+        if name:
+            logger.debug('[%s] %s', name, line)
+        else:
+            logger.debug(line)
+
+        summary = _COLLECTED_SEARCH.search(line)
+        file_summary = None if summary else _FILE_COLLECTED_SEARCH.search(line)
+        with self._lock:
+            if summary:
+                self.reported = (self.reported or 0) + int(summary.group(1) or summary.group(2))
+            elif file_summary:
+                self.collected += int(file_summary.group(2))
+            elif line.startswith('ERROR'):
+                self.errors += 1
+                logger.warning(line)
+            elif '::' in line and not line[:1].isspace():
+                # with "-q" every collected item is printed on its own line
+                self.collected += 1
+
+            now = time.time()
+            if now - self._last_log >= self.log_interval:
+                self._last_log = now
+                logger.info('Collected %d items so far', self.collected)
+
+
+def _read_output(stream, progress, name):
+    for line in iter(stream.readline, b''):
+        progress.add_line(line.decode('utf-8', 'replace').rstrip(), name)
+    stream.close()
+
+
+def _signal_group(proc, sig):
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(proc.pid, sig)
+        elif sig == signal.SIGTERM:
+            proc.terminate()
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+
+def _terminate(procs, grace_period=10):
+    """Terminates the processes with all their children, kills them if they don't exit in time."""
+    for proc in procs:
+        _signal_group(proc, signal.SIGTERM)
+    deadline = time.time() + grace_period
+    while any(proc.poll() is None for proc in procs) and time.time() < deadline:
+        time.sleep(0.1)
+    for proc in procs:
+        if proc.poll() is None:
+            _signal_group(proc, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        proc.wait()
+
+
+class RunningCollections(object):
+    """Collection processes that are running, so all of them can be terminated at once.
+
+    The processes run in their own sessions, they don't get SIGINT from the terminal.
+    """
+
+    def __init__(self):
+        self._procs = set()
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def start(self, args, cwd=None):
+        """Starts the collection process, unless all of them were already terminated."""
+        popen_kwargs = {}
+        # run in new process group so the whole tree of processes can be terminated
+        if sys.version_info >= (3, 2):
+            # unlike `preexec_fn`, safe to use when other threads are running
+            popen_kwargs['start_new_session'] = True
+        elif hasattr(os, 'setsid'):
+            popen_kwargs['preexec_fn'] = os.setsid
+        with self._lock:
+            if self._stopped:
+                raise TestcasesException('The collection was terminated')
+            proc = subprocess.Popen(
+                args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd, **popen_kwargs)
+            self._procs.add(proc)
+        return proc
+
+    def finished(self, proc):
+        """Forgets the finished process."""
+        with self._lock:
+            self._procs.discard(proc)
+
+    def terminate_all(self):
+        """Terminates all running processes, no new processes can be started then."""
+        with self._lock:
+            self._stopped = True
+            procs = list(self._procs)
+            self._procs.clear()
+        _terminate(procs)
+
+
+def _run_collection(args, progress, cwd=None, deadline=None, name=None, running=None):
+    """Runs the collection process, returns its exit code.
+
+    Output of the process is passed to `progress`. When the process doesn't finish
+    before the `deadline` or when interrupted, it's terminated together with all
+    its children. The process is tracked in `running` (`RunningCollections`).
+    """
+    running = running or RunningCollections()
+    pytest_proc = running.start(args, cwd=cwd)
+    reader = threading.Thread(target=_read_output, args=(pytest_proc.stdout, progress, name))
+    reader.daemon = True
+    reader.start()
+
+    timed_out = False
+    try:
+        # the output can be closed before the process exits, keep checking the deadline
+        while pytest_proc.poll() is None:
+            if deadline is not None and time.time() > deadline:
+                timed_out = True
+                break
+            if reader.is_alive():
+                reader.join(0.5)
+            else:
+                time.sleep(0.5)
+        if timed_out:
+            _terminate([pytest_proc])
+    except BaseException:
+        # e.g. KeyboardInterrupt, the process is in its own session and didn't get the SIGINT
+        _terminate([pytest_proc])
+        raise
+    finally:
+        running.finished(pytest_proc)
+
+    if timed_out:
+        raise TestcasesException(
+            'The collection{} didn\'t finish in time'.format(
+                " of '{}'".format(name) if name else ''))
+
+    pytest_retval = pytest_proc.returncode
+    # the output can still be held open by orphaned children, don't wait for them forever
+    reader.join(5)
+    return pytest_retval
+
+
+def _get_max_rss():
+    """Returns peak RSS of the largest child process in kB (on Linux), None if not available."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+
+def _write_stats(stats_file, testrun_id, stats):
+    record = dict(stats._asdict(), testrun_id=str(testrun_id), timestamp=time.time())
+    try:
+        with open(os.path.expanduser(stats_file), 'a') as output_file:
+            output_file.write(json.dumps(record, sort_keys=True))
+            output_file.write('\n')
+    except (IOError, OSError) as err:
+        logger.warning('Failed to write collection stats to %s: %s', stats_file, err)
+
+
+def get_shards(tests_dir='cfme/tests'):
+    """Returns list of shards, each is a list of paths to collect.
+
+    Every subdirectory of the `tests_dir` is a shard, test files directly in the
+    `tests_dir` form one more shard. The biggest shards come first so they don't
+    end up running alone at the end.
+    """
+    shards = []
+    top_files = []
+    for name in sorted(os.listdir(tests_dir)):
+        path = os.path.join(tests_dir, name)
+        if os.path.isdir(path):
+            if name.startswith(('.', '_')):
+                continue
+            size = sum(
+                len([fname for fname in filenames if fname.startswith('test_')])
+                for __, __, filenames in os.walk(path))
+            if size:
+                shards.append((size, [path]))
+        elif name.startswith('test_') and name.endswith('.py'):
+            top_files.append(path)
+    if top_files:
+        shards.append((len(top_files), top_files))
+    shards.sort(key=lambda shard: -shard[0])
+    return [paths for __, paths in shards]
+
+
+def _merge_testcases(xml_roots):
+    merged = xml_roots[0]
+    for xml_root in xml_roots[1:]:
+        merged.extend(xml_root.iterchildren('testcase'))
+    return merged
+
+
+def _merge_testsuites(xml_roots):
+    merged = xml_roots[0]
+    merged_testsuite = merged.find('testsuite')
+    counters = ('tests', 'errors', 'failures', 'skipped')
+    for xml_root in xml_roots[1:]:
+        for testsuite in xml_root.iterchildren('testsuite'):
+            if merged_testsuite is None:
+                merged_testsuite = testsuite
+                merged.append(testsuite)
+                continue
+            merged_testsuite.extend(testsuite.iterchildren('testcase'))
+            for counter in counters:
+                value = testsuite.get(counter)
+                if value is not None:
+                    merged_testsuite.set(
+                        counter, str(int(merged_testsuite.get(counter) or 0) + int(value)))
+        for counter in counters:
+            value = xml_root.get(counter)
+            if value is not None:
+                merged.set(counter, str(int(merged.get(counter) or 0) + int(value)))
+    return merged
+
+
+def merge_xmls(work_dirs, output_dir='.'):
+    """Merges XMLs generated in the work dirs into the output dir."""
+    for fname, merge_func in zip(_XML_FILES, (_merge_testcases, _merge_testsuites)):
+        xml_roots = []
+        for work_dir in work_dirs:
+            xml_file = os.path.join(work_dir, fname)
+            if not os.path.exists(xml_file):
+                raise TestcasesException(
+                    'The XML file {} was not generated in {}'.format(fname, work_dir))
+            xml_roots.append(utils.get_xml_root(xml_file))
+        utils.write_xml(merge_func(xml_roots), os.path.join(output_dir, fname))
+
+
+def _run_sharded(testrun_id, jobs, progress, deadline=None):
+    """Runs the collection of shards in parallel, each in its own work dir."""
+    shards = get_shards()
+    if not shards:
+        raise TestcasesException('No tests found in cfme/tests')
+    rootdir = os.path.abspath('.')
+    work_dirs = [tempfile.mkdtemp(prefix='cfme-testcases-shard-') for __ in shards]
+    running = RunningCollections()
+
+    def _run_shard(shard_num):
+        paths = [os.path.join(rootdir, path) for path in shards[shard_num]]
+        args = _get_pytest_args(testrun_id, paths=paths, rootdir=rootdir)
+        logger.debug("Collecting shard %d in %s", shard_num, work_dirs[shard_num])
+        return _run_collection(
+            args,
+            progress,
+            cwd=work_dirs[shard_num],
+            deadline=deadline,
+            name=' '.join(shards[shard_num]),
+            running=running)
+
+    logger.info(
+        "Generating the XMLs using '%s' in %d shards, %d at once",
+        ' '.join(_get_pytest_args(testrun_id)), len(shards), jobs)
+    pool = ThreadPool(jobs)
+    try:
+        retvals = pool.map(_run_shard, range(len(shards)))
+        pool.close()
+        merge_xmls(work_dirs)
+    finally:
+        # when a shard failed or on interrupt the other shards are still running,
+        # they must be stopped before their work dirs are removed
+        running.terminate_all()
+        pool.terminate()
+        pool.join()
+        for work_dir in work_dirs:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return max(retvals), len(shards)
+
+
+def run_pytest(testrun_id, cache=None, jobs=1, timeout=None, stats_file=None):
+    """Runs the pytest command.
+
+    When `cache` (`CollectionCache`) is specified, the XMLs are restored from it
+    if nothing affecting the collection changed since they were generated.
+    With more than one job, tests are collected in shards in parallel and
+    the generated XMLs are merged. The collection is terminated when it doesn't
+    finish in `timeout` seconds. Duration, peak memory and number of collected
+    items are logged and appended as JSON line to the `stats_file`.
+    """
+    _check_environment()
+    _cleanup()
+
+    cache_key = None
+    if cache:
+        cache_key = collection_cache.get_content_hash(_get_pytest_args(testrun_id))
+        if cache.restore(cache_key, _XML_FILES):
+            logger.info('The XMLs were restored from the collection cache')
+            return 0
+
+    progress = CollectionProgress()
+    start = time.time()
+    deadline = start + timeout if timeout else None
+    if jobs and jobs > 1:
+        pytest_retval, shards = _run_sharded(testrun_id, jobs, progress, deadline)
+    else:
+        args = _get_pytest_args(testrun_id)
+        logger.info("Generating the XMLs using '%s'", ' '.join(args))
+        pytest_retval, shards = _run_collection(args, progress, deadline=deadline), 1
+
+    stats = CollectionStats(
+        retval=pytest_retval,
+        duration=time.time() - start,
+        max_rss=_get_max_rss(),
+        collected=progress.total,
+        errors=progress.errors,
+        shards=shards)
+    logger.info(
+        'Collected %d items (%d errors) in %.1f seconds, peak memory %s',
+        stats.collected,
+        stats.errors,
+        stats.duration,
+        '{} MB'.format(stats.max_rss // 1024) if stats.max_rss is not None else 'unknown')
+    if stats_file:
+        _write_stats(stats_file, testrun_id, stats)
 
     missing_files = []
     for fname in _XML_FILES:
@@ -78,4 +425,7 @@ def run_pytest(testrun_id):
         raise TestcasesException(
             'The XML files {} were not generated'.format(' and '.join(missing_files)))
 
+    if cache and pytest_retval == 0:
+        cache.store(cache_key, _XML_FILES)
+
     return pytest_retval
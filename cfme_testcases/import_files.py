@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Names of generated XML files and of job logs.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+import os
+import random
+import string
+
+from cfme_testcases import utils
+
+
+TEST_RUN_XML = 'test_run_import.xml'
+TEST_CASE_XML = 'test_case_import.xml'
+
+
+def _get_filename_str(args):
+    return '{}-{:%Y%m%d%H%M%S}'.format(
+        args.testrun_id or
+        ''.join(random.sample(string.ascii_lowercase, 5)), datetime.datetime.now())
+
+
+def _get_import_file_name(args, file_name, path, key):
+    return os.path.join(
+        path,
+        'import-{0}-{1}-{2}'.format(_get_filename_str(args), key, file_name))
+
+
+def get_import_file(args, xml_file, key):
+    """Returns name of file in the output dir or next to the original file and compression."""
+    path, name = os.path.split(xml_file)
+    import_file = _get_import_file_name(args, name, args.output_dir or path, key)
+    compress = bool(args.output_dir and args.gzip_output)
+    if compress:
+        import_file = '{}.gz'.format(import_file)
+    return import_file, compress
+
+
+def write_import_file(args, xml_root, xml_file, key):
+    """Writes the XML next to the original file or to the output dir (compressed if requested)."""
+    import_file, compress = get_import_file(args, xml_file, key)
+    utils.write_xml(xml_root, import_file, compress=compress)
+    return import_file
+
+
+def get_init_logname(args):
+    """Returns filename of the message bus log file."""
+    if args.job_log:
+        job_log = args.job_log
+    else:
+        job_log = 'init-job-{}.log'.format(_get_filename_str(args))
+        job_log = os.path.join(args.output_dir or '', job_log)
+    return job_log
+
+
+def get_job_log(args, prefix):
+    """Returns filename of the log of the submit job, None when there's no output dir."""
+    job_log = None
+    if args.output_dir:
+        job_log = 'job-{}-{}.log'.format(prefix, _get_filename_str(args))
+        job_log = os.path.join(args.output_dir, job_log)
+    return job_log
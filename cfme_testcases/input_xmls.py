@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Input XML files with testcases and testsuites.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+
+from cfme_testcases import utils
+from cfme_testcases.exceptions import TestcasesException
+
+
+class InputXMLs(object):
+    """XML files with testcases and testsuites, each file is parsed at most once.
+
+    The parsed XML roots are shared, consumers must not modify them. In streaming
+    mode the files are not loaded into memory for getting names of testcases.
+    """
+
+    def __init__(self, testcases_file, testsuites_file, streaming=False):
+        self.testcases_file = os.path.expanduser(testcases_file)
+        self.testsuites_file = os.path.expanduser(testsuites_file)
+        self.streaming = streaming
+        self._testcases_root = None
+        self._testsuites_root = None
+        self._testcases_names = None
+
+    @staticmethod
+    def _parse(xml_file, root_tag):
+        xml_root = utils.get_xml_root(xml_file)
+        if xml_root.tag != root_tag:
+            raise TestcasesException(
+                "XML file '{}' is not in expected format".format(xml_file))
+        return xml_root
+
+    @property
+    def testcases_root(self):
+        """Returns parsed XML with testcases."""
+        if self._testcases_root is None:
+            self._testcases_root = self._parse(self.testcases_file, 'testcases')
+        return self._testcases_root
+
+    @property
+    def testsuites_root(self):
+        """Returns parsed XML with testsuites."""
+        if self._testsuites_root is None:
+            self._testsuites_root = self._parse(self.testsuites_file, 'testsuites')
+        return self._testsuites_root
+
+    def load(self):
+        """Parses both XML files unless in streaming mode."""
+        if self.streaming:
+            return
+        # pylint: disable=pointless-statement
+        self.testcases_root
+        self.testsuites_root
+
+    def get_testcases_names(self):
+        """Returns names of all testcases."""
+        if self._testcases_names is None:
+            if self.streaming:
+                self._testcases_names = list(utils.get_all_testcases(self.testcases_file))
+            else:
+                self._testcases_names = [
+                    tc_id for tc_id in
+                    (testcase.get('id')
+                     for testcase in self.testcases_root.iterchildren('testcase'))
+                    if tc_id]
+        return self._testcases_names
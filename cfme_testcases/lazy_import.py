@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Modules imported on first use.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import importlib
+
+
+class LazyModule(object):
+    """Proxy of module that is imported on first access to any of its attributes.
+
+    Attributes are not cached on the proxy, so patching the module is always
+    visible through it.
+    """
+
+    def __init__(self, name):
+        self._lazy_name = name
+        self._lazy_module = None
+
+    def __getattr__(self, attr):
+        # called only for attributes not found on the proxy itself
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self._lazy_name)
+        return getattr(self._lazy_module, attr)
+
+    def __repr__(self):
+        return '<LazyModule {}{}>'.format(
+            self._lazy_name, '' if self._lazy_module is None else ' (imported)')
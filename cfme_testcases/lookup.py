@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Lookup of testcases missing in Polarion.
+
+The missing testcases are found either in the log of dry-run submit, in the SVN
+repo with Polarion project or in both.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import os
+import threading
+
+from cfme_testcases import filters, import_files, utils
+from cfme_testcases.exceptions import NothingToDoException, TestcasesException
+from cfme_testcases.lazy_import import LazyModule
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+submit = LazyModule('dump2polarion.submit')
+parselog = LazyModule('cfme_testcases.parselog')
+renames = LazyModule('cfme_testcases.renames')
+svn_daemon = LazyModule('cfme_testcases.svn_daemon')
+svn_index = LazyModule('cfme_testcases.svn_index')
+svn_testcases = LazyModule('cfme_testcases.svn_testcases')
+
+
+def _initial_submit_needed(args, log):
+    if os.path.isfile(log) and not args.testrun_init:
+        # log file already exists, no need to generate one
+        return False
+    elif args.no_submit:
+        raise NothingToDoException(
+            'Instructed not to submit and as the message bus log is missing, '
+            'there\'s nothing more to do')
+    return True
+
+
+def get_initial_xml(args):
+    """Returns XML for the initial submit."""
+    if args.testrun_init:
+        # we want to init new test run
+        fname = import_files.TEST_RUN_XML
+        xml_root = utils.get_xml_root(fname)
+    else:
+        # we want to just get the log file without changing anything
+        fname = import_files.TEST_CASE_XML
+        xml_root = utils.get_xml_root(fname)
+        utils.set_dry_run(xml_root)
+        utils.set_lookup_method(xml_root, 'name')
+
+    utils.remove_response_property(xml_root)
+
+    if args.output_dir:
+        import_files.write_import_file(args, xml_root, fname, 'init')
+
+    return xml_root
+
+
+def _submit_initial_xml(xml_root, submit_args, config, log):
+    if not submit.submit_and_verify(
+            xml_root=xml_root,
+            config=config,
+            log_file=log,
+            **submit_args):
+        raise TestcasesException('Failed to do the initial submit')
+
+
+def initial_submit(args, submit_args, config, log):
+    """Submits XML to Polarion and saves the log file returned by the message bus."""
+    if not _initial_submit_needed(args, log):
+        return
+    _submit_initial_xml(get_initial_xml(args), submit_args, config, log)
+
+
+def get_missing_from_log(args, submit_args, dump2polarion_config, input_xmls):
+    """Gets missing testcases from log file.
+
+    The input XMLs are loaded while the initial submit is running, so the work
+    is done while waiting for the importer. dump2polarion writes the log in one
+    piece when the job is finished, the log is parsed after that.
+    """
+    init_logname = import_files.get_init_logname(args)
+    if not _initial_submit_needed(args, init_logname):
+        return parselog.get_missing(init_logname)
+
+    # XML parser is not thread safe, prepare the XML in this thread
+    xml_root = get_initial_xml(args)
+    errors = []
+
+    def _run_submit():
+        try:
+            _submit_initial_xml(xml_root, submit_args, dump2polarion_config, init_logname)
+        # pylint: disable=broad-except
+        except Exception as err:
+            errors.append(err)
+
+    submit_t = threading.Thread(target=_run_submit)
+    submit_t.start()
+    try:
+        input_xmls.load()
+    finally:
+        submit_t.join()
+    if errors:
+        raise errors[0]
+    return parselog.get_missing(init_logname)
+
+
+def get_svn_index_file(args):
+    """Returns path to the persistent index of the SVN repo."""
+    if args.no_svn_index:
+        return None
+    return args.svn_index or svn_index.get_default_index_file(args.use_svn)
+
+
+def get_svn_daemon_socket(args):
+    """Returns path to socket of the SVN daemon."""
+    return args.svn_daemon_socket or svn_daemon.get_default_socket_path(args.use_svn)
+
+
+def _load_svn_testcases_from_daemon(args, testcase_names):
+    socket_path = get_svn_daemon_socket(args)
+    try:
+        polarion_testcases = svn_daemon.load_testcases(
+            socket_path,
+            args.use_svn,
+            testcase_names,
+            id_range=args.svn_id_range,
+            fields=args.update_fields)
+    except TestcasesException as err:
+        logger.warning('%s, loading testcases from SVN repo', err)
+        return None
+    if polarion_testcases is None:
+        logger.debug('SVN daemon is not running on %s', socket_path)
+    else:
+        logger.info('Using SVN daemon running on %s', socket_path)
+    return polarion_testcases
+
+
+def load_svn_testcases(args, testcase_names=None):
+    """Loads testcases from SVN repo.
+
+    When `testcase_names` are specified and the SVN daemon is running, only
+    these testcases are loaded using the daemon.
+    """
+    if testcase_names is not None and not args.no_svn_daemon:
+        polarion_testcases = _load_svn_testcases_from_daemon(args, testcase_names)
+        if polarion_testcases is not None:
+            return polarion_testcases
+    return svn_testcases.load_testcases(
+        args.use_svn,
+        index_file=get_svn_index_file(args),
+        jobs=args.jobs,
+        id_range=args.svn_id_range,
+        fields=args.update_fields)
+
+
+def get_missing_from_svn(args, input_xmls, polarion_testcases=None):
+    """Gets missing testcases using SVN repo.
+
+    Returns sets of missing testcases and of testcases not known to exist or to be
+    missing, see `PolarionTestcases.get_missing`.
+    """
+    all_testcases = input_xmls.get_testcases_names()
+    if polarion_testcases is None:
+        polarion_testcases = load_svn_testcases(args, all_testcases)
+    return polarion_testcases.get_missing(all_testcases)
+
+
+def get_changed_workitems(args, polarion_testcases):
+    """Returns ids of workitems that could be changed in Polarion after the SVN repo update.
+
+    These are workitems changed in the working copy since the previous run, as found
+    by the persistent index using the stored mtime and size of the workitem files.
+    The SVN server is asked for workitems changed after the revision of the working
+    copy when requested or when the index was not used.
+    """
+    if not args.check_svn_server and polarion_testcases.changed_workitems is not None:
+        return polarion_testcases.changed_workitems
+    return svn_testcases.get_changed_workitems(args.use_svn)
+
+
+def get_unconfirmed_testcases(args, input_xmls, polarion_testcases, svn_missing, unknown=()):
+    """Returns names of testcases whose presence in Polarion the SVN repo can't confirm.
+
+    These are testcases not found in the SVN repo (they could be added to Polarion
+    after the last update or be outside of the loaded range of workitems) and
+    testcases whose workitems were changed recently, see `get_changed_workitems`.
+    All testcases are unconfirmed when the changed workitems can't be found out.
+    """
+    names = set(input_xmls.get_testcases_names())
+    try:
+        changed = get_changed_workitems(args, polarion_testcases)
+    except TestcasesException as err:
+        logger.warning('%s, checking all testcases', err)
+        return names
+    unconfirmed = set(svn_missing) | set(unknown)
+    unconfirmed.update(
+        name for name, work_item_id in polarion_testcases.available_testcases.items()
+        if work_item_id in changed and name in names)
+    return unconfirmed
+
+
+def get_dry_run_xml(args, input_xmls, testcase_names):
+    """Returns XML for the dry-run submit of testcases with the names."""
+    if input_xmls.streaming:
+        xml_root = filters.read_testcases(input_xmls.testcases_file, testcase_names)
+    else:
+        xml_root = filters.get_missing_testcases(input_xmls.testcases_root, testcase_names)
+    utils.set_dry_run(xml_root)
+    utils.set_lookup_method(xml_root, 'name')
+
+    if args.output_dir:
+        import_files.write_import_file(args, xml_root, input_xmls.testcases_file, 'init')
+
+    return xml_root
+
+
+def get_missing_hybrid(
+        args, submit_args, dump2polarion_config, input_xmls, polarion_testcases, svn_missing,
+        unknown=(), phase=None):
+    """Gets missing testcases using SVN repo and dry-run submit of the unconfirmed ones.
+
+    Outcome of the dry-run overrides the SVN repo for the testcases it covers.
+    Returns sets of missing testcases and of testcases that are still not known.
+    Number of the unconfirmed testcases is recorded in the metrics `phase`.
+    """
+    unconfirmed = get_unconfirmed_testcases(
+        args, input_xmls, polarion_testcases, svn_missing, unknown)
+    if phase:
+        phase.add('unconfirmed', len(unconfirmed))
+    if not unconfirmed:
+        return set(svn_missing), set(unknown)
+    logger.info(
+        '%d of %d testcases not confirmed by the SVN repo',
+        len(unconfirmed), len(input_xmls.get_testcases_names()))
+
+    init_logname = import_files.get_init_logname(args)
+    if not os.path.isfile(init_logname):
+        if args.no_submit:
+            logger.warning(
+                'Instructed not to submit and as the message bus log is missing,'
+                ' using missing testcases from the SVN repo')
+            return set(svn_missing), set(unknown)
+        _submit_initial_xml(
+            get_dry_run_xml(args, input_xmls, unconfirmed),
+            submit_args,
+            dump2polarion_config,
+            init_logname)
+
+    outcome = parselog.parse(init_logname)
+    not_found = set(outcome['not_found'])
+    answered = set(name for name, __ in outcome['results'])
+    answered.update(outcome['not_unique'], not_found)
+    return (set(svn_missing) - answered) | (not_found & unconfirmed), set(unknown) - answered
+
+
+def renames_wanted(args):
+    return args.detect_renames or args.map_renames
+
+
+def get_renames(args, input_xmls, missing, polarion_testcases):
+    """Finds missing testcases that are likely renamed testcases existing in Polarion."""
+    if not renames_wanted(args) or not missing:
+        return None
+    found_renames = renames.find_renames(
+        missing,
+        polarion_testcases.available_testcases,
+        input_xmls.get_testcases_names(),
+        threshold=args.rename_threshold)
+    renames.log_renames(found_renames, mapped=args.map_renames)
+    return found_renames
+
+
+def get_svn_testcases_names(args, input_xmls):
+    # all titles are needed for the renames detection, the daemon can't be used for it
+    if renames_wanted(args):
+        return None
+    return input_xmls.get_testcases_names()
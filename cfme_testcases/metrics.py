@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Timing and resource metrics of the phases of the run.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+from cfme_testcases import utils
+from cfme_testcases.exceptions import TestcasesException
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+
+FORMATS = ('json', 'prometheus')
+
+_PROMETHEUS_PREFIX = 'cfme_testcases'
+
+
+def _reset_peak_rss():
+    """Resets peak RSS of this process, returns False when it's not possible (Linux only)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def _get_peak_rss():
+    """Returns peak RSS of this process since the last reset in bytes, None if not available."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+def _get_max_rss():
+    """Returns maximum RSS of this process and of the largest child process in bytes.
+
+    The maximum of this process is reset together with the peak RSS.
+    """
+    if resource is None:
+        return None, None
+    # kB on Linux, bytes on macOS
+    multiplier = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * multiplier,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * multiplier)
+
+
+class Phase(object):
+    """Metrics of single phase.
+
+    `peak_rss_bytes` is peak RSS during the phase (available only on Linux),
+    `max_rss_bytes` and `children_max_rss_bytes` are running maximums since the start
+    of the run.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.children_cpu_seconds = None
+        self.peak_rss_bytes = None
+        self.max_rss_bytes = None
+        self.children_max_rss_bytes = None
+        self.failed = False
+        self.counts = OrderedDict()
+        self._start = None
+        self._peak_reset = False
+
+    def count(self, name, value):
+        """Records count of items processed in the phase."""
+        self.counts[name] = value
+
+    def add(self, name, value):
+        """Adds to count of items processed in the phase."""
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def start(self):
+        """Starts measuring the phase."""
+        self._peak_reset = _reset_peak_rss()
+        self._start = (time.time(), os.times())
+
+    def stop(self):
+        """Stops measuring the phase."""
+        start_wall, start_times = self._start
+        end_times = os.times()
+        self.wall_seconds = time.time() - start_wall
+        self.cpu_seconds = (end_times[0] + end_times[1]) - (start_times[0] + start_times[1])
+        self.children_cpu_seconds = (
+            (end_times[2] + end_times[3]) - (start_times[2] + start_times[3]))
+        # the peak of the phase is known only when it was reset at the start of the phase
+        self.peak_rss_bytes = _get_peak_rss() if self._peak_reset else None
+        self.max_rss_bytes, self.children_max_rss_bytes = _get_max_rss()
+
+    def to_dict(self):
+        """Returns the metrics as dict."""
+        return OrderedDict((
+            ('wall_seconds', self.wall_seconds),
+            ('cpu_seconds', self.cpu_seconds),
+            ('children_cpu_seconds', self.children_cpu_seconds),
+            ('peak_rss_bytes', self.peak_rss_bytes),
+            ('max_rss_bytes', self.max_rss_bytes),
+            ('children_max_rss_bytes', self.children_max_rss_bytes),
+            ('failed', self.failed),
+            ('counts', self.counts),
+        ))
+
+
+class Metrics(object):
+    """Collects metrics of phases and of submit jobs."""
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.jobs = OrderedDict()
+        self.started = time.time()
+        self._max_rss = None
+
+    @contextmanager
+    def phase(self, name):
+        """Measures the phase running in the `with` block, yields the `Phase`."""
+        phase = self.phases[name] = Phase(name)
+        phase.start()
+        try:
+            yield phase
+        except Exception:
+            phase.failed = True
+            raise
+        finally:
+            phase.stop()
+            # the process maximum is reset with the peak of each phase, keep the running maximum
+            if phase.max_rss_bytes is not None:
+                self._max_rss = phase.max_rss_bytes = max(
+                    self._max_rss or 0, phase.max_rss_bytes)
+
+    def add_job(self, job, **counts):
+        """Records outcome of finished scheduler job."""
+        self.jobs[job.name] = OrderedDict((
+            ('outcome', job.outcome),
+            ('attempts', job.attempts),
+            ('duration_seconds', job.duration),
+            ('counts', counts),
+        ))
+
+    def to_dict(self):
+        """Returns all the metrics as dict."""
+        return OrderedDict((
+            ('started', self.started),
+            ('phases', OrderedDict(
+                (name, phase.to_dict()) for name, phase in self.phases.items())),
+            ('jobs', self.jobs),
+        ))
+
+    def to_prometheus(self):
+        """Returns the metrics in the Prometheus text format."""
+        metrics = OrderedDict()
+
+        def _add(name, help_text, labels, value):
+            if value is None:
+                return
+            if isinstance(value, bool):
+                value = int(value)
+            samples = metrics.setdefault(name, (help_text, []))[1]
+            label_str = ','.join(
+                '{}="{}"'.format(key, str(val).replace('\\', '\\\\').replace('"', '\\"'))
+                for key, val in labels)
+            if label_str:
+                label_str = '{{{}}}'.format(label_str)
+            samples.append('{}_{}{} {}'.format(_PROMETHEUS_PREFIX, name, label_str, value))
+
+        for name, phase in self.phases.items():
+            labels = (('phase', name),)
+            _add('phase_wall_seconds', 'Wall time of the phase.', labels, phase.wall_seconds)
+            _add('phase_cpu_seconds', 'CPU time of the phase.', labels, phase.cpu_seconds)
+            _add('phase_children_cpu_seconds', 'CPU time of child processes in the phase.',
+                 labels, phase.children_cpu_seconds)
+            _add('phase_peak_rss_bytes', 'Peak RSS during the phase.',
+                 labels, phase.peak_rss_bytes)
+            _add('phase_max_rss_bytes', 'Maximum RSS since the start of the run.',
+                 labels, phase.max_rss_bytes)
+            _add('phase_children_max_rss_bytes',
+                 'Maximum RSS of the largest child process since the start of the run.',
+                 labels, phase.children_max_rss_bytes)
+            _add('phase_failed', 'The phase failed.', labels, phase.failed)
+            for count_name, value in phase.counts.items():
+                _add('phase_items', 'Number of items processed in the phase.',
+                     labels + (('item', count_name),), value)
+        for name, job in self.jobs.items():
+            labels = (('job', name),)
+            _add('job_duration_seconds', 'Duration of the submit job.',
+                 labels, job['duration_seconds'])
+            _add('job_attempts', 'Number of attempts of the submit job.', labels, job['attempts'])
+            _add('job_succeeded', 'The submit job succeeded.',
+                 labels, job['outcome'] == 'succeeded')
+            for count_name, value in job['counts'].items():
+                _add('job_items', 'Number of items processed by the submit job.',
+                     labels + (('item', count_name),), value)
+        _add('last_run_timestamp_seconds', 'Start of the run.', (), self.started)
+
+        lines = []
+        for name, (help_text, samples) in metrics.items():
+            lines.append('# HELP {}_{} {}'.format(_PROMETHEUS_PREFIX, name, help_text))
+            lines.append('# TYPE {}_{} gauge'.format(_PROMETHEUS_PREFIX, name))
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, metrics_file, metrics_format='json'):
+        """Writes the metrics to file, the file is replaced atomically."""
+        if metrics_format == 'json':
+            content = utils.get_unicode_str(json.dumps(self.to_dict(), indent=2))
+        elif metrics_format == 'prometheus':
+            content = self.to_prometheus()
+        else:
+            raise TestcasesException("Unknown metrics format '{}'".format(metrics_format))
+
+        metrics_file = os.path.expanduser(metrics_file)
+        tmp_file = '{}.tmp{}'.format(metrics_file, os.getpid())
+        try:
+            with io.open(tmp_file, 'w', encoding='utf-8') as output_file:
+                output_file.write(content)
+            # the file can be read at any time, e.g. by the textfile collector
+            os.rename(tmp_file, metrics_file)
+        except (IOError, OSError) as err:
+            raise TestcasesException(
+                "Failed to write metrics to '{}': {}".format(metrics_file, err))
+        logger.info('Metrics written to %s', metrics_file)
@@ -5,6 +5,8 @@ Parse log file produced by Polarion Importers.
 
 from __future__ import absolute_import, unicode_literals
 
+import gzip
+import mmap
 import os
 import re
 
@@ -54,73 +56,164 @@ def get_test_case_warn(line):
         return None
 
 
+_XUNIT = 'xunit'
+_TEST_CASE = 'test_case'
+
+_IMPORT_START = b'Starting import of '
+_IMPORTERS = (
+    (b'XUnit results', _XUNIT),
+    (b'test cases', _TEST_CASE),
+)
+
+_NAME = br"test_[^'\n]+|[A-Z][^'\n]+"
+
+# Single regex for all kinds of lines, each kind has its own named groups. It starts
+# with the quote in front of the name, so the regex engine can quickly skip to candidate
+# positions (it's much slower when the regex starts with an alternation of messages).
+# The kind of line is recognized by lookbehind, only the rare warnings are told apart
+# later by their message.
+_ITEM_SEARCH = re.compile(
+    br"'(?:(?<=Work item: ')(?P<work_item>" + _NAME + br")' \((?P<work_item_id>[^)\n]+)\)"
+    br"[ \t\r]*$"
+    br"|(?<=Updated test case ')(?P<updated>" + _NAME + br")' \((?P<updated_id>[^)/\n]+)"
+    br"|(?<=Created test case ')(?P<created>" + _NAME + br")' \([^)/\n]"
+    br"|(?P<warning>" + _NAME + br")'\.[ \t\r]*$)",
+    re.MULTILINE)
+
+_WARNING_END = re.compile(br"\.[ \t\r]*$", re.MULTILINE)
+
+# message preceding the name on warning lines, (importer, outcome key)
+_WARNINGS = (
+    (b'Unable to find *unique* work item', (_XUNIT, 'not_unique')),
+    (b'Unable to find work item for', (_XUNIT, 'not_found')),
+    (b'Found multiple work items with the title', (_TEST_CASE, 'not_unique')),
+)
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+def _decode(value):
+    return value.decode('utf-8', 'ignore')
+
+
+class _LogOutcome(object):
+    """Outcome of the importer that produced the log."""
+
+    def __init__(self):
+        self.importer = None
+        self.outcomes = {
+            _XUNIT: {'results': [], 'not_unique': [], 'not_found': []},
+            _TEST_CASE: {'results': [], 'not_unique': [], 'not_found': []},
+        }
+
+    def _find_importer(self, data):
+        # the import starts at the beginning of the log, so the search stops early
+        pos = data.find(_IMPORT_START)
+        while pos != -1:
+            pos += len(_IMPORT_START)
+            for marker, importer in _IMPORTERS:
+                if data[pos:pos + len(marker)] == marker:
+                    self.importer = importer
+                    return
+            pos = data.find(_IMPORT_START, pos)
+
+    def _add_warnings(self, data, names):
+        """Sorts names from warning lines by their message."""
+        pos = 0
+        for name in names:
+            quoted = b"'" + name + b"'"
+            # the warnings are found in order, find the line of each after the previous one
+            while True:
+                pos = data.find(quoted, pos)
+                if _WARNING_END.match(data, pos + len(quoted)):
+                    break
+                pos += len(quoted)
+            message = data[data.rfind(b'\n', 0, pos) + 1:pos]
+            pos += len(quoted)
+            for marker, (importer, key) in _WARNINGS:
+                if marker in message:
+                    self.outcomes[importer][key].append(_decode(name))
+                    break
+
+    def add(self, data):
+        """Adds results found in the data (complete lines as bytes).
+
+        Lines of both importers are collected in one pass, the importer that
+        produced the log is recognized by the line starting the import.
+        """
+        if not self.importer:
+            self._find_importer(data)
+
+        xunit_results = self.outcomes[_XUNIT]['results']
+        test_case_results = self.outcomes[_TEST_CASE]['results']
+        created = self.outcomes[_TEST_CASE]['not_found']
+        warnings = []
+        # findall returns tuples of all the named groups, only groups of one kind are set
+        for work_item, work_item_id, updated, updated_id, created_item, warning in (
+                _ITEM_SEARCH.findall(data)):
+            if work_item:
+                xunit_results.append(
+                    (work_item.decode('utf-8', 'ignore'), work_item_id.decode('utf-8', 'ignore')))
+            elif updated:
+                test_case_results.append(
+                    (updated.decode('utf-8', 'ignore'), updated_id.decode('utf-8', 'ignore')))
+            elif created_item:
+                # we don't want to store tuple as we want to search in a list
+                # and also the ID's have no meaning here
+                created.append(created_item.decode('utf-8', 'ignore'))
+            else:
+                warnings.append(warning)
+        if warnings:
+            self._add_warnings(data, warnings)
+
+    def get_outcome(self, log_file, importer=None):
+        """Returns outcome of the importer that produced the log."""
+        importer = importer or self.importer
+        if not importer:
+            raise TestcasesException("No valid data found in the log file '{}'".format(log_file))
+
+        outcome = self.outcomes[importer]
+        if not (outcome['results'] or outcome['not_unique'] or outcome['not_found']):
+            raise TestcasesException("No valid data found in the log file '{}'".format(log_file))
+
+        return outcome
+
+
+def _parse_log(log_file):
+    """Parses the log file in single pass, the file is memory-mapped or gunzipped."""
+    log_outcome = _LogOutcome()
+    with open(os.path.expanduser(log_file), 'rb') as input_file:
+        if input_file.read(2) == _GZIP_MAGIC:
+            input_file.seek(0)
+            with gzip.GzipFile(fileobj=input_file) as gz_file:
+                log_outcome.add(gz_file.read())
+            return log_outcome
+
+        try:
+            data = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return log_outcome
+        try:
+            log_outcome.add(data)
+        finally:
+            data.close()
+    return log_outcome
+
+
 def parse_xunit(log_file):
     """Parse log file produced by the XUnit Iporter."""
-    outcome = {'results': [], 'not_unique': [], 'not_found': []}
-    with open(os.path.expanduser(log_file)) as input_file:
-        for line in input_file:
-            line = line.strip()
-            if 'Work item: ' in line:
-                work_item = get_work_item(line)
-                if work_item:
-                    outcome['results'].append(work_item)
-            elif 'Unable to find *unique* work item' in line:
-                warn_item = get_warn_item(line)
-                if warn_item:
-                    outcome['not_unique'].append(warn_item)
-            elif 'Unable to find work item for' in line:
-                warn_item = get_warn_item(line)
-                if warn_item:
-                    outcome['not_found'].append(warn_item)
-
-    if not(outcome['results'] or outcome['not_unique'] or outcome['not_found']):
-        raise TestcasesException("No valid data found in the log file '{}'".format(log_file))
-
-    return outcome
+    return _parse_log(log_file).get_outcome(log_file, _XUNIT)
 
 
 def parse_test_case(log_file):
     """Parse log file produced by the Test Case Importer."""
-    outcome = {'results': [], 'not_unique': [], 'not_found': []}
-    with open(os.path.expanduser(log_file)) as input_file:
-        for line in input_file:
-            line = line.strip()
-            if 'Updated test case' in line:
-                updated_item = get_test_case(line)
-                if updated_item:
-                    outcome['results'].append(updated_item)
-            elif 'Created test case' in line:
-                missing_item = get_test_case(line)
-                if missing_item:
-                    # we don't want to store tuple as we want to
-                    # search in a list and also the ID's have no
-                    # meaning here
-                    outcome['not_found'].append(missing_item[0])
-            elif 'Found multiple work items with the title' in line:
-                warn_item = get_test_case_warn(line)
-                if warn_item:
-                    outcome['not_unique'].append(warn_item)
-
-    if not(outcome['results'] or outcome['not_unique'] or outcome['not_found']):
-        raise TestcasesException("No valid data found in the log file '{}'".format(log_file))
-
-    return outcome
+    return _parse_log(log_file).get_outcome(log_file, _TEST_CASE)
 
 
 def parse(log_file):
     """Parse log file."""
-    handler = None
-    with open(os.path.expanduser(log_file)) as input_file:
-        for line in input_file:
-            if 'Starting import of XUnit results' in line:
-                handler = parse_xunit
-                break
-            elif 'Starting import of test cases' in line:
-                handler = parse_test_case
-                break
-    if not handler:
-        raise TestcasesException("No valid data found in the log file '{}'".format(log_file))
-    return handler(log_file)
+    return _parse_log(log_file).get_outcome(log_file)
 
 
 def get_missing(log_file):
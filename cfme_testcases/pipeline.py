@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Processing of single testrun, from the tests collection to the submit of filtered XMLs.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import os
+
+from cfme_testcases import collection_cache, filters, import_files, lookup, submissions
+from cfme_testcases.exceptions import TestcasesException
+from cfme_testcases.input_xmls import InputXMLs
+from cfme_testcases.lazy_import import LazyModule
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+etree = LazyModule('lxml.etree')
+gen_xmls = LazyModule('cfme_testcases.gen_xmls')
+
+
+def gen_pytest_xmls(args):
+    """Generates the XML files when they were not specified on command line."""
+    if args.testcases and args.testsuites:
+        return
+
+    if not args.testrun_id:
+        raise TestcasesException('The testrun id was not specified')
+    cache = None
+    if not args.no_collection_cache:
+        cache = collection_cache.CollectionCache(
+            cache_dir=args.collection_cache_dir,
+            max_size=args.collection_cache_size * 1024 * 1024,
+            policy=args.collection_cache_policy)
+    gen_xmls.run_pytest(
+        args.testrun_id,
+        cache=cache,
+        jobs=args.collect_jobs,
+        timeout=args.collect_timeout,
+        stats_file=args.collect_stats_file)
+
+
+def get_changed_fields_check(args, polarion_testcases):
+    """Returns check of changed fields when values of the fields can be compared."""
+    if polarion_testcases is None or args.update_all or args.no_testcases_update:
+        return None
+    return filters.ChangedFieldsCheck(
+        polarion_testcases.get_fields_by_name, fields=args.update_fields)
+
+
+def _get_mapped_renames(args, found_renames):
+    """Returns dict of names and ids of existing testcases that will be renamed."""
+    if not (args.map_renames and found_renames):
+        return None
+    return {name: rename.work_item_id for name, rename in found_renames.items()}
+
+
+def get_filtered_xmls(
+        args, input_xmls, missing, polarion_testcases=None, phase=None, found_renames=None,
+        unknown=None):
+    """Filters the XML files, in streaming mode writes the outputs to files.
+
+    When testcases loaded from the SVN repo are available, only testcases with
+    changed fields are updated. Testcases in `unknown` are neither added nor updated.
+    Counts of testcases are recorded in the metrics `phase`.
+    """
+    is_changed = get_changed_fields_check(args, polarion_testcases)
+    mapped_renames = _get_mapped_renames(args, found_renames)
+    if not args.streaming:
+        filtered_xmls = filters.get_filtered_xmls(
+            input_xmls,
+            missing,
+            fields=args.update_fields,
+            is_changed=is_changed,
+            renames=mapped_renames,
+            unknown=unknown)
+    else:
+        filtered_xmls = _write_filtered_xmls(
+            args, input_xmls, missing, is_changed, mapped_renames, unknown)
+    if unknown:
+        logger.warning(
+            'Skipped %d testcases not found in the range of workitems loaded from the SVN repo,'
+            ' it\'s not known whether they exist in Polarion', len(unknown))
+    if is_changed is not None:
+        logger.info('Skipped %d testcases with unchanged fields', is_changed.skipped)
+    if phase:
+        for name, xml in zip(filtered_xmls._fields, filtered_xmls):
+            if etree.iselement(xml):
+                phase.add(name, submissions.count_testcases(xml))
+        if is_changed is not None:
+            phase.add('unchanged_testcases', is_changed.skipped)
+        if unknown:
+            phase.add('unknown_testcases', len(unknown))
+    return filtered_xmls
+
+
+def _write_filtered_xmls(args, input_xmls, missing, is_changed, mapped_renames, unknown):
+    testcases_file, testsuites_file = input_xmls.testcases_file, input_xmls.testsuites_file
+    missing_testcases, compress = import_files.get_import_file(args, testcases_file, 'missing')
+    missing_testsuites, __ = import_files.get_import_file(args, testsuites_file, 'missing')
+    updated_testcases, __ = import_files.get_import_file(args, testcases_file, 'update')
+    renamed_testcases, __ = import_files.get_import_file(args, testcases_file, 'renamed')
+    return filters.write_filtered_xmls(
+        input_xmls.testcases_file,
+        input_xmls.testsuites_file,
+        missing,
+        filters.FilteredXMLs(
+            missing_testcases, missing_testsuites, updated_testcases, renamed_testcases),
+        compress=compress,
+        fields=args.update_fields,
+        is_changed=is_changed,
+        renames=mapped_renames,
+        unknown=unknown)
+
+
+def save_filtered_xmls(args, testcases, testsuites, filtered_xmls):
+    """Saves the generated XML files if instructed to do so, returns names of the files."""
+    if args.streaming:
+        # in streaming mode the files were already written
+        return [xml_file for xml_file in filtered_xmls if xml_file is not None]
+    if not (args.no_submit or args.output_dir):
+        return []
+
+    written = []
+    if filtered_xmls.missing_testcases is not None:
+        written.append(
+            import_files.write_import_file(
+                args, filtered_xmls.missing_testcases, testcases, 'missing'))
+        written.append(
+            import_files.write_import_file(
+                args, filtered_xmls.missing_testsuites, testsuites, 'missing'))
+
+    if filtered_xmls.updated_testcases is not None:
+        written.append(
+            import_files.write_import_file(
+                args, filtered_xmls.updated_testcases, testcases, 'update'))
+
+    if filtered_xmls.renamed_testcases is not None:
+        written.append(
+            import_files.write_import_file(
+                args, filtered_xmls.renamed_testcases, testcases, 'renamed'))
+    return written
+
+
+def run(args, submit_args, dump2polarion_config, run_metrics):
+    """Creates and submits XMLs for single testrun."""
+    testcases = args.testcases or import_files.TEST_CASE_XML
+    testsuites = args.testsuites or import_files.TEST_RUN_XML
+
+    with run_metrics.phase('collection'):
+        gen_pytest_xmls(args)
+    input_xmls = InputXMLs(testcases, testsuites, streaming=args.streaming)
+    polarion_testcases = found_renames = unknown = None
+    with run_metrics.phase('missing') as phase:
+        if args.use_svn:
+            polarion_testcases = lookup.load_svn_testcases(
+                args, lookup.get_svn_testcases_names(args, input_xmls))
+            phase.count('polarion_testcases', len(polarion_testcases))
+            missing, unknown = lookup.get_missing_from_svn(args, input_xmls, polarion_testcases)
+            if args.hybrid_missing:
+                missing, unknown = lookup.get_missing_hybrid(
+                    args, submit_args, dump2polarion_config, input_xmls, polarion_testcases,
+                    missing, unknown, phase=phase)
+            found_renames = lookup.get_renames(args, input_xmls, missing, polarion_testcases)
+        else:
+            missing = lookup.get_missing_from_log(
+                args, submit_args, dump2polarion_config, input_xmls)
+        phase.count('missing', len(missing))
+        if found_renames is not None:
+            phase.count('renames', len(found_renames))
+    with run_metrics.phase('filter') as phase:
+        filtered_xmls = get_filtered_xmls(
+            args, input_xmls, missing, polarion_testcases, phase=phase,
+            found_renames=found_renames, unknown=unknown)
+    with run_metrics.phase('save') as phase:
+        written = save_filtered_xmls(args, testcases, testsuites, filtered_xmls)
+        phase.count('bytes_written', sum(os.path.getsize(fname) for fname in written))
+    with run_metrics.phase('submit'):
+        submissions.submit_filtered_xmls(
+            args,
+            submit_args,
+            dump2polarion_config,
+            filtered_xmls,
+            metrics=run_metrics if args.metrics_file else None)
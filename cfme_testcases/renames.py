@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Detect testcases that were renamed instead of added.
+
+Testcase that was renamed in the tests repo looks like missing in Polarion. Candidates
+for the old name are found using index of n-grams of titles of Polarion testcases
+so each missing name is compared only with titles sharing its rare n-grams.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import math
+import re
+
+from collections import OrderedDict, defaultdict, namedtuple
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+
+# missing testcase `name` is likely the renamed testcase `title` with id `work_item_id`
+Rename = namedtuple('Rename', 'name title work_item_id score')
+
+DEFAULT_THRESHOLD = 0.7
+
+# tolerance for float error in products with threshold, e.g. 0.28 * 25 is 7.000000000000001
+_EPSILON = 1e-9
+
+# numeric suffix and parameters of parametrized test, e.g. "3[rhv]" in "test_vm_3[rhv]"
+_SUFFIX_SEARCH = re.compile(r'[0-9]*(\[.*\])?$')
+
+
+def get_stem(name):
+    """Returns the name without numeric suffix and parameters."""
+    return _SUFFIX_SEARCH.sub('', name, count=1)
+
+
+def get_ngrams(name, size=3):
+    """Returns set of character n-grams of the name, the name is padded so short names match."""
+    name = ' {} '.format(name.lower())
+    return frozenset(name[i:i + size] for i in range(max(len(name) - size + 1, 1)))
+
+
+def jaccard(first, second):
+    """Returns Jaccard similarity of two sets."""
+    if not (first or second):
+        return 1.0
+    shared = len(first & second)
+    return shared / float(len(first) + len(second) - shared)
+
+
+class TitleIndex(object):
+    """Index of n-grams of titles.
+
+    Title similar to the name must share most of the n-grams with it, so it's enough
+    to look up only the rarest n-grams of the name to find all candidates. Common
+    n-grams (e.g. "tes" from "test_") with long lists of titles are mostly skipped.
+    """
+
+    def __init__(self, titles, size=3):
+        self.size = size
+        self.titles = list(titles)
+        self.ngrams = [get_ngrams(title, size) for title in self.titles]
+        self._postings = defaultdict(list)
+        for pos, ngrams in enumerate(self.ngrams):
+            for ngram in ngrams:
+                self._postings[ngram].append(pos)
+
+    def _get_candidates(self, ngrams, threshold):
+        """Returns positions of titles sharing at least `threshold` fraction of the n-grams."""
+        min_shared = int(math.ceil(threshold * len(ngrams) - _EPSILON))
+        # any `len(ngrams) - min_shared + 1` n-grams include at least one shared n-gram
+        rarest = sorted(ngrams, key=lambda ngram: len(self._postings.get(ngram, ())))
+        candidates = set()
+        for ngram in rarest[:len(ngrams) - min_shared + 1]:
+            candidates.update(self._postings.get(ngram, ()))
+        return candidates
+
+    def search(self, name, threshold=DEFAULT_THRESHOLD):
+        """Returns list of (score, title) of titles similar to the name, the best first."""
+        ngrams = get_ngrams(name, self.size)
+        found = []
+        for pos in self._get_candidates(ngrams, threshold):
+            title_ngrams = self.ngrams[pos]
+            # the similarity can't be higher than ratio of the sizes
+            if min(len(ngrams), len(title_ngrams)) < threshold * max(
+                    len(ngrams), len(title_ngrams)) - _EPSILON:
+                continue
+            score = jaccard(ngrams, title_ngrams)
+            if score >= threshold:
+                found.append((score, self.titles[pos]))
+        found.sort(key=lambda item: (-item[0], item[1]))
+        return found
+
+    def __len__(self):
+        return len(self.titles)
+
+
+def _get_unique_best(matches):
+    """Returns the best match from list of (score, match), None if it's not unique."""
+    if not matches:
+        return None
+    best_score = max(score for score, __ in matches)
+    best = [match for score, match in matches if score == best_score]
+    return best[0] if len(best) == 1 else None
+
+
+def find_renames(missing, testcases, current_names, threshold=DEFAULT_THRESHOLD):
+    """Finds likely old names of missing testcases.
+
+    `testcases` is dict of titles and ids of testcases in Polarion, only testcases
+    not present in `current_names` could have been renamed. Titles differing from
+    the missing name only in numeric suffix or parameters belong to other tests
+    (e.g. other parametrizations), not to old names. Missing testcase is matched
+    with Polarion testcase only when each is the unique best match of the other.
+    Returns dict of missing names and `Rename` records.
+    """
+    current_names = set(current_names)
+    index = TitleIndex(title for title in testcases if title not in current_names)
+    if not index:
+        return OrderedDict()
+
+    by_name = {}
+    by_title = defaultdict(list)
+    for name in missing:
+        stem = get_stem(name)
+        found = [(score, title) for score, title in index.search(name, threshold)
+                 if get_stem(title) != stem]
+        by_name[name] = found
+        for score, title in found:
+            by_title[title].append((score, name))
+
+    renames = OrderedDict()
+    for name in sorted(by_name):
+        title = _get_unique_best(by_name[name])
+        if title is None or _get_unique_best(by_title[title]) != name:
+            continue
+        score = by_name[name][0][0]
+        renames[name] = Rename(name, title, testcases[title], score)
+    return renames
+
+
+def log_renames(renames, mapped=False):
+    """Logs the detected renames."""
+    for rename in renames.values():
+        logger.warning(
+            "Missing testcase '%s' is likely renamed '%s' (%s, similarity %.2f)%s",
+            rename.name,
+            rename.title,
+            rename.work_item_id,
+            rename.score,
+            ', updating the existing testcase' if mapped else '')
+    if renames and not mapped:
+        logger.warning(
+            'New testcases will be created for %d likely renamed testcases,'
+            ' use --map-renames to update the existing ones instead', len(renames))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Runs jobs with dependencies among them in worker threads.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import threading
+import time
+
+from cfme_testcases.exceptions import TestcasesException
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class Job(object):
+    """Job to run, `func` returns True on success."""
+
+    def __init__(self, name, func, depends_on=(), retries=0, description=None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.retries = retries
+        self.description = description or name
+        self.outcome = None
+        self.attempts = 0
+        self.duration = None
+        self.error = None
+
+    @property
+    def succeeded(self):
+        """Returns True if the job finished successfully."""
+        return self.outcome == SUCCEEDED
+
+    def __repr__(self):
+        return '<Job {} {}>'.format(self.name, self.outcome or 'pending')
+
+
+class Scheduler(object):
+    """Runs jobs in dependency order with limited number of jobs running at once.
+
+    Job is started once all jobs it depends on succeeded, it's skipped when
+    any of them failed or was skipped. Jobs that other jobs depend on are
+    started first. Failed job is retried with exponential backoff.
+    """
+
+    def __init__(self, max_workers=2, retries=0, backoff=10.0):
+        if max_workers < 1:
+            raise TestcasesException('Number of workers must be at least 1')
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.jobs = []
+        self._cond = threading.Condition()
+
+    def add(self, name, func, depends_on=(), retries=None, description=None):
+        """Adds new job, jobs it depends on must be added first."""
+        names = set(job.name for job in self.jobs)
+        if name in names:
+            raise TestcasesException("Job '{}' already exists".format(name))
+        unknown = [dep for dep in depends_on if dep not in names]
+        if unknown:
+            raise TestcasesException(
+                "Job '{}' depends on unknown jobs: {}".format(name, ', '.join(unknown)))
+        job = Job(
+            name,
+            func,
+            depends_on=depends_on,
+            retries=self.retries if retries is None else retries,
+            description=description)
+        self.jobs.append(job)
+        return job
+
+    def _run_job(self, job):
+        start = time.time()
+        while True:
+            job.attempts += 1
+            try:
+                retval = job.func()
+            # pylint: disable=broad-except
+            except Exception as err:
+                logger.error("Job '%s' failed: %s", job.name, err)
+                job.error = err
+                retval = False
+            if retval or job.attempts > job.retries:
+                break
+            delay = self.backoff * 2 ** (job.attempts - 1)
+            logger.warning(
+                "Job '%s' failed, retrying in %.0f seconds (attempt %d of %d)",
+                job.name, delay, job.attempts + 1, job.retries + 1)
+            time.sleep(delay)
+        job.duration = time.time() - start
+        logger.info(
+            "Job '%s' %s in %.1f seconds", job.name, SUCCEEDED if retval else FAILED, job.duration)
+
+        with self._cond:
+            job.outcome = SUCCEEDED if retval else FAILED
+            self._cond.notify()
+
+    def _get_ready(self, pending):
+        outcomes = {job.name: job.outcome for job in self.jobs}
+        ready = []
+        for job in list(pending):
+            deps = [outcomes[dep] for dep in job.depends_on]
+            if any(dep in (FAILED, SKIPPED) for dep in deps):
+                job.outcome = SKIPPED
+                logger.info("Job '%s' skipped, dependency not met", job.name)
+                pending.remove(job)
+            elif all(dep == SUCCEEDED for dep in deps):
+                ready.append(job)
+        # start first the jobs that other jobs are waiting for
+        required = set(dep for job in pending for dep in job.depends_on)
+        ready.sort(key=lambda job: job.name not in required)
+        return ready
+
+    def run(self):
+        """Runs all jobs and returns them with outcomes filled in."""
+        pending = [job for job in self.jobs if job.outcome is None]
+        running = []
+        with self._cond:
+            while pending or running:
+                running = [job for job in running if job.outcome is None]
+                # jobs can be skipped in cascade, re-check until nothing changes
+                while True:
+                    count = len(pending)
+                    ready = self._get_ready(pending)
+                    if len(pending) == count:
+                        break
+                for job in ready[:self.max_workers - len(running)]:
+                    pending.remove(job)
+                    running.append(job)
+                    worker = threading.Thread(target=self._run_job, args=(job,))
+                    worker.daemon = True
+                    worker.start()
+                if running:
+                    self._cond.wait()
+        return self.jobs
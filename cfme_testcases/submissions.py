@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Submission of filtered XMLs to Polarion Importers.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import os
+import sys
+
+from collections import OrderedDict, namedtuple
+
+from cfme_testcases import filters, import_files, scheduler, utils
+from cfme_testcases.exceptions import TestcasesException
+from cfme_testcases.lazy_import import LazyModule
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+async_verify = LazyModule('cfme_testcases.async_verify')
+submit = LazyModule('dump2polarion.submit')
+etree = LazyModule('lxml.etree')
+
+
+def get_submit_args(args):
+    """Gets arguments for the `submit_and_verify` method."""
+    submit_args = dict(
+        testrun_id=args.testrun_id,
+        user=args.user,
+        password=args.password,
+        no_verify=args.no_verify,
+        verify_timeout=args.verify_timeout,
+    )
+    return {k: v for k, v in submit_args.items() if v is not None}
+
+
+class _CountingWriter(object):
+    """File-like object that only counts bytes written to it."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        """Counts the written data."""
+        self.size += len(data)
+
+
+def get_xml_size(xml):
+    """Returns size of the XML (root or file name) in bytes."""
+    if etree.iselement(xml):
+        # don't keep the whole serialized XML in memory just to get its length
+        counter = _CountingWriter()
+        etree.ElementTree(xml).write(counter, encoding='utf-8')
+        return counter.size
+    return os.path.getsize(xml)
+
+
+def count_testcases(xml_root):
+    """Returns number of testcases in XML with testcases or testsuites."""
+    if xml_root.tag == 'testsuites':
+        return sum(1 for __ in xml_root.iterfind('testsuite/testcase'))
+    return sum(1 for __ in xml_root.iterchildren('testcase'))
+
+
+def _get_xml_arg(xml):
+    """Returns argument for `submit_and_verify`, the XML is either root or file name."""
+    if etree.iselement(xml):
+        return {'xml_root': xml}
+    return {'xml_file': xml}
+
+
+class SubmitRequest(namedtuple('SubmitRequest', 'xml submit_args config log_file')):
+    """Submission of XML (root or file name) to Polarion Importer.
+
+    Calling it submits the XML and waits for verification of the import.
+    """
+    __slots__ = ()
+
+    def __call__(self):
+        return submit.submit_and_verify(
+            config=self.config,
+            log_file=self.log_file,
+            **dict(self.submit_args, **_get_xml_arg(self.xml))
+        )
+
+
+def _get_updated_testcases(args, filtered_xmls):
+    if args.no_testcases_update:
+        return None
+    return filtered_xmls.updated_testcases
+
+
+def _get_missing_testcases(__, filtered_xmls):
+    return filtered_xmls.missing_testcases
+
+
+def _get_renamed_testcases(__, filtered_xmls):
+    return filtered_xmls.renamed_testcases
+
+
+def _get_missing_testsuites(args, filtered_xmls):
+    if args.no_testrun_update:
+        return None
+    return filtered_xmls.missing_testsuites
+
+
+# name (used also in job log name), description, function that returns XML to submit
+# (or None when the submission is not wanted), names of submissions that must succeed first
+# and whether the submission is specific to testrun (in batch mode it's done for each testrun)
+Submission = namedtuple('Submission', 'name description get_xml depends_on per_testrun')
+
+SUBMISSIONS = [
+    Submission('update', 'update existing testcases', _get_updated_testcases, (), False),
+    Submission('testcases', 'add missing testcases', _get_missing_testcases, (), False),
+    Submission('renames', 'rename existing testcases', _get_renamed_testcases, (), False),
+    Submission(
+        'testrun', 'update testrun', _get_missing_testsuites, ('testcases', 'renames'), True),
+]
+
+
+def register_submission(name, description, get_xml, depends_on=(), per_testrun=False):
+    """Adds new kind of submission of filtered XMLs."""
+    SUBMISSIONS.append(Submission(name, description, get_xml, tuple(depends_on), per_testrun))
+
+
+# chunk of XML scheduled for submission
+SubmitChunk = namedtuple('SubmitChunk', 'job_name description xml names')
+
+
+def get_submit_chunks(args, submission, xml):
+    """Splits the XML into chunks when chunked submission was requested."""
+    if not args.chunk_size:
+        return [SubmitChunk(submission.name, submission.description, xml, None)]
+
+    if not etree.iselement(xml):
+        xml = utils.get_xml_root(xml)
+    chunks = filters.split_xml(xml, args.chunk_size)
+    if len(chunks) <= 1:
+        return [SubmitChunk(
+            submission.name, submission.description, xml, filters.get_testcases_names(xml))]
+
+    return [SubmitChunk(
+        '{}-{}'.format(submission.name, num),
+        '{} (chunk {}/{})'.format(submission.description, num, len(chunks)),
+        chunk,
+        filters.get_testcases_names(chunk)) for num, chunk in enumerate(chunks, 1)]
+
+
+def _get_chunk_deps(chunk, dep_chunks):
+    """Returns names of jobs with chunks the chunk depends on.
+
+    Chunk depends only on chunks with the same testcases when there are any.
+    """
+    if len(dep_chunks) == 1 or not chunk.names:
+        return [dep.job_name for dep in dep_chunks]
+    deps = [dep.job_name for dep in dep_chunks if dep.names and chunk.names & dep.names]
+    return deps or [dep.job_name for dep in dep_chunks]
+
+
+def add_submit_jobs(job_scheduler, args, submit_args, config, filtered_xmls,
+                    submissions=None, prefix='', scheduled_before=None):
+    """Adds jobs for the wanted `submissions` (all by default) to the scheduler.
+
+    Names of the jobs are prefixed with `prefix`. The submissions can depend on
+    submissions in `scheduled_before`. Returns the scheduled chunks of each submission.
+    """
+    scheduled = OrderedDict()
+    available = OrderedDict(scheduled_before or ())
+    all_submissions = {submission.name: submission for submission in SUBMISSIONS}
+    for submission in SUBMISSIONS if submissions is None else submissions:
+        xml = submission.get_xml(args, filtered_xmls)
+        if xml is None:
+            continue
+        # there's nothing to wait for when the submission has nothing to submit
+        depends_on = [
+            dep for dep in submission.depends_on
+            if dep in available or all_submissions[dep].get_xml(args, filtered_xmls) is not None]
+        if not all(dep in available for dep in depends_on):
+            # submission this one depends on is not wanted, so this one is not possible
+            continue
+        chunks = [chunk._replace(job_name=prefix + chunk.job_name)
+                  for chunk in get_submit_chunks(args, submission, xml)]
+        for chunk in chunks:
+            deps = []
+            for dep in depends_on:
+                deps.extend(_get_chunk_deps(chunk, available[dep]))
+            job_scheduler.add(
+                chunk.job_name,
+                SubmitRequest(
+                    chunk.xml, submit_args, config, import_files.get_job_log(args, chunk.job_name)),
+                depends_on=deps,
+                description=chunk.description)
+        scheduled[submission.name] = available[submission.name] = chunks
+    return scheduled
+
+
+def get_job_scheduler(args):
+    """Returns scheduler for the submit jobs."""
+    if not args.async_verify:
+        return scheduler.Scheduler(max_workers=args.submit_workers, retries=args.submit_retries)
+    # `loop.create_future` is new in 3.5.2
+    if sys.version_info < (3, 5, 2):
+        raise TestcasesException('Asynchronous verification needs Python 3.5.2 or newer')
+    return async_verify.AsyncScheduler(
+        max_workers=args.submit_workers, retries=args.submit_retries)
+
+
+def get_submit_scheduler(args, submit_args, config, filtered_xmls):
+    """Returns scheduler with jobs for all wanted submissions and the scheduled chunks."""
+    job_scheduler = get_job_scheduler(args)
+    scheduled = add_submit_jobs(job_scheduler, args, submit_args, config, filtered_xmls)
+    return job_scheduler, scheduled
+
+
+def _save_failed_chunks(args, outcomes, scheduled):
+    """Saves chunks that were not submitted so only these can be resubmitted."""
+    for chunks in scheduled.values():
+        if len(chunks) == 1:
+            continue
+        for chunk in chunks:
+            if outcomes[chunk.job_name] == scheduler.SUCCEEDED:
+                continue
+            failed_file, compress = import_files.get_import_file(
+                args, '{}.xml'.format(chunk.job_name), 'failed')
+            utils.write_xml(chunk.xml, failed_file, compress=compress)
+            logger.info('Chunk that was not submitted saved to %s', failed_file)
+
+
+def _record_jobs(metrics, jobs, scheduled):
+    chunks = {chunk.job_name: chunk for chunks in scheduled.values() for chunk in chunks}
+    for job in jobs:
+        chunk = chunks[job.name]
+        counts = {}
+        if job.outcome == scheduler.SUCCEEDED:
+            counts['bytes_submitted'] = get_xml_size(chunk.xml)
+            if etree.iselement(chunk.xml):
+                counts['testcases'] = count_testcases(chunk.xml)
+        metrics.add_job(job, **counts)
+
+
+def _get_submit_summary(outcomes, scheduled, label=None):
+    """Returns descriptions of submissions that succeeded and that failed."""
+    descriptions = {submission.name: submission.description for submission in SUBMISSIONS}
+    succeeded = []
+    failed = []
+    for name, chunks in scheduled.items():
+        chunks_outcomes = [outcomes[chunk.job_name] for chunk in chunks]
+        failed_count = chunks_outcomes.count(scheduler.FAILED)
+        msg = descriptions[name]
+        if len(chunks) > 1:
+            logger.info(
+                '%s%s: %d of %d chunks succeeded, %d failed, %d skipped',
+                '{}: '.format(label) if label else '',
+                msg,
+                chunks_outcomes.count(scheduler.SUCCEEDED),
+                len(chunks),
+                failed_count,
+                chunks_outcomes.count(scheduler.SKIPPED))
+            if failed_count:
+                msg = '{} ({} of {} chunks)'.format(msg, failed_count, len(chunks))
+        if failed_count:
+            failed.append(msg)
+        elif all(outcome == scheduler.SUCCEEDED for outcome in chunks_outcomes):
+            succeeded.append(msg)
+    return succeeded, failed
+
+
+def submit_filtered_xmls(args, submit_args, config, filtered_xmls, metrics=None):
+    """Submits filtered XMLs to Polarion Importers, records outcome of jobs in `metrics`."""
+    if args.no_submit:
+        return
+
+    job_scheduler, scheduled = get_submit_scheduler(args, submit_args, config, filtered_xmls)
+    jobs = job_scheduler.run()
+    if metrics:
+        _record_jobs(metrics, jobs, scheduled)
+    outcomes = {job.name: job.outcome for job in jobs}
+    succeeded, failed = _get_submit_summary(outcomes, scheduled)
+
+    if args.chunk_size:
+        _save_failed_chunks(args, outcomes, scheduled)
+
+    if succeeded and failed:
+        logger.info('SUCCEEDED to %s', ', '.join(succeeded))
+    if failed:
+        raise TestcasesException('FAILED to {}'.format(', '.join(failed)))
+
+    logger.info('DONE - RECORDS SUCCESSFULLY UPDATED!')
+
+
+def submit_batch(args, config, groups, filtered_by_group, filtered_by_run, metrics=None):
+    """Submits filtered XMLs of all testruns in one pool of workers."""
+    job_scheduler = get_job_scheduler(args)
+    shared = [submission for submission in SUBMISSIONS if not submission.per_testrun]
+    per_testrun = [submission for submission in SUBMISSIONS if submission.per_testrun]
+
+    # label, arguments and scheduled chunks of submissions
+    units = []
+    for group, filtered_xmls in zip(groups, filtered_by_group):
+        group_scheduled = add_submit_jobs(
+            job_scheduler,
+            group.args,
+            get_submit_args(group.args),
+            config,
+            filtered_xmls,
+            submissions=shared,
+            prefix='{}-'.format(group.args.testrun_id))
+        units.append((
+            'testruns {}'.format(', '.join(run.testrun_id for run in group.runs)),
+            group.args,
+            group_scheduled))
+        for run in group.runs:
+            run_args, run_filtered = filtered_by_run[run.testrun_id]
+            units.append(('testrun {}'.format(run.testrun_id), run_args, add_submit_jobs(
+                job_scheduler,
+                run_args,
+                get_submit_args(run_args),
+                config,
+                run_filtered,
+                submissions=per_testrun,
+                prefix='{}-'.format(run.testrun_id),
+                scheduled_before=group_scheduled)))
+
+    jobs = job_scheduler.run()
+    all_scheduled = OrderedDict()
+    for __, __, scheduled in units:
+        for name, chunks in scheduled.items():
+            all_scheduled.setdefault(name, []).extend(chunks)
+    if metrics:
+        _record_jobs(metrics, jobs, all_scheduled)
+    outcomes = {job.name: job.outcome for job in jobs}
+
+    failed_units = []
+    for label, unit_args, scheduled in units:
+        succeeded, failed = _get_submit_summary(outcomes, scheduled, label)
+        if succeeded:
+            logger.info('%s: SUCCEEDED to %s', label, ', '.join(succeeded))
+        if failed:
+            logger.error('%s: FAILED to %s', label, ', '.join(failed))
+            failed_units.append('{} ({})'.format(label, ', '.join(failed)))
+        if unit_args.chunk_size:
+            _save_failed_chunks(unit_args, outcomes, scheduled)
+
+    logger.info(
+        'Batch of %d testruns: %d jobs succeeded, %d failed, %d skipped',
+        len(filtered_by_run),
+        sum(1 for job in jobs if job.outcome == scheduler.SUCCEEDED),
+        sum(1 for job in jobs if job.outcome == scheduler.FAILED),
+        sum(1 for job in jobs if job.outcome == scheduler.SKIPPED))
+    if failed_units:
+        raise TestcasesException('FAILED for {}'.format('; '.join(failed_units)))
+
+    logger.info('DONE - RECORDS SUCCESSFULLY UPDATED!')
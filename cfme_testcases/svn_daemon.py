@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+"""
+Daemon serving testcases from warm SVN index over local Unix socket.
+
+The protocol is newline delimited JSON, each request line gets one response line.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    # Python 2.x
+    import SocketServer as socketserver
+
+from cfme_testcases import svn_testcases
+from cfme_testcases.exceptions import TestcasesException
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+
+# inotify events signalling change of file or directory content
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_EVENTS = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+
+def get_default_socket_path(repo_dir):
+    """Returns path to the daemon socket for the SVN repo in the user's runtime dir."""
+    runtime_dir = (os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('XDG_CACHE_HOME') or
+                   os.path.expanduser('~/.cache'))
+    repo_hash = hashlib.sha1(
+        os.path.abspath(os.path.expanduser(repo_dir)).encode('utf-8')).hexdigest()
+    return os.path.join(runtime_dir, 'cfme-testcases', 'svn-daemon-{}.sock'.format(repo_hash[:12]))
+
+
+def _get_watched_paths(repo_dir):
+    # every `svn update` writes to the working copy database, changes made
+    # outside of svn are found by the periodic rescan
+    return [path for path in (os.path.join(repo_dir, '.svn'),
+                              os.path.join(repo_dir, 'tracker', 'workitems'))
+            if os.path.isdir(path)]
+
+
+class _Inotify(object):
+    """Minimal inotify watch of directories (not recursive)."""
+
+    def __init__(self, paths):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError('libc not found')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify not available')
+        self.fd = libc.inotify_init1(getattr(os, 'O_CLOEXEC', 0o2000000))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        for path in paths:
+            if not isinstance(path, bytes):
+                path = path.encode(sys.getfilesystemencoding() or 'utf-8')
+            if libc.inotify_add_watch(self.fd, path, _IN_EVENTS) < 0:
+                err = ctypes.get_errno()
+                self.close()
+                raise OSError(err, "Couldn't watch {}".format(path))
+
+    def wait(self, timeout):
+        """Returns True if any event arrived in `timeout` seconds."""
+        ready, __, __ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        os.read(self.fd, 64 * 1024)
+        return True
+
+    def close(self):
+        """Stops watching."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class RepoWatcher(object):
+    """Watches SVN repo for changes, using inotify if available and polling otherwise."""
+
+    def __init__(self, repo_dir, poll_interval=2.0):
+        self.repo_dir = repo_dir
+        self.poll_interval = poll_interval
+        self._inotify = None
+        paths = _get_watched_paths(repo_dir)
+        if paths:
+            try:
+                self._inotify = _Inotify(paths)
+            except (AttributeError, OSError) as err:
+                logger.debug('Not using inotify: %s', err)
+        self._stamp = self._get_stamp()
+
+    @property
+    def method(self):
+        """Returns name of the method used for watching."""
+        return 'inotify' if self._inotify else 'polling'
+
+    def _get_stamp(self):
+        stamp = []
+        for path in (os.path.join(self.repo_dir, '.svn', 'wc.db'),
+                     os.path.join(self.repo_dir, 'tracker', 'workitems')):
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_mtime, stat.st_size, stat.st_ino))
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+    def wait(self, timeout, stop):
+        """Waits up to `timeout` seconds for change, returns True if the repo changed.
+
+        Returns early when the `stop` event is set.
+        """
+        deadline = time.time() + timeout
+        while not stop.is_set():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            if self._inotify:
+                if self._inotify.wait(min(remaining, self.poll_interval)):
+                    return True
+                continue
+            stop.wait(min(remaining, self.poll_interval))
+            stamp = self._get_stamp()
+            if stamp != self._stamp:
+                self._stamp = stamp
+                return True
+        return False
+
+    def close(self):
+        """Stops watching."""
+        if self._inotify:
+            self._inotify.close()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, b''):
+            try:
+                request = json.loads(line.decode('utf-8'))
+                response = self.server.svn_daemon.handle_request(request)
+            except (ValueError, TypeError, KeyError) as err:
+                response = {'status': 'error', 'message': 'Bad request: {}'.format(err)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class SVNDaemon(object):
+    """Keeps testcases from SVN repo loaded and up to date, answers queries about them.
+
+    The repo is re-scanned whenever the watcher notices a change and every
+    `rescan_interval` seconds, with the index only changed workitems are parsed.
+    """
+
+    def __init__(self, repo_dir, socket_path=None, index_file=None, jobs=1, id_range=None,
+                 poll_interval=2.0, rescan_interval=600.0, settle_time=2.0):
+        self.repo_dir = os.path.abspath(os.path.expanduser(repo_dir))
+        self.socket_path = os.path.expanduser(
+            socket_path or get_default_socket_path(self.repo_dir))
+        self.polarion_testcases = svn_testcases.PolarionTestcases(
+            self.repo_dir, index_file=index_file, jobs=jobs, id_range=id_range)
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.settle_time = settle_time
+        self.updated = None
+        self._stop = threading.Event()
+        self._server = None
+
+    def refresh(self):
+        """Re-loads active testcases, returns False when it failed."""
+        start = time.time()
+        try:
+            self.polarion_testcases.load_active_testcases()
+        # pylint: disable=broad-except
+        except Exception as err:
+            logger.error('Failed to load testcases from SVN repo %s: %s', self.repo_dir, err)
+            return False
+        finally:
+            # the index is used from different threads, don't keep the connection open
+            if self.polarion_testcases.index:
+                self.polarion_testcases.index.close()
+        self.updated = time.time()
+        logger.info(
+            'Loaded %d active testcases in %.1f seconds',
+            len(self.polarion_testcases), self.updated - start)
+        return True
+
+    def _watch(self, watcher):
+        try:
+            while not self._stop.is_set():
+                changed = watcher.wait(self.rescan_interval, self._stop)
+                if changed:
+                    logger.debug('Change of SVN repo detected')
+                    # wait for the update to finish
+                    while watcher.wait(self.settle_time, self._stop):
+                        pass
+                if not self._stop.is_set():
+                    self.refresh()
+        finally:
+            watcher.close()
+
+    def get_status(self):
+        """Returns status of the daemon."""
+        return {
+            'status': 'ok',
+            'repo_dir': self.repo_dir,
+            'id_range': self.polarion_testcases.id_range,
+            'testcases': len(self.polarion_testcases),
+            'updated': self.updated,
+        }
+
+    def get_missing(self, names):
+        """Returns names not found and dict of names and ids of the others.
+
+        When the daemon loaded only a range of workitems, the names not found
+        are not necessarily missing in Polarion.
+        """
+        # the dict is replaced as whole on refresh, the snapshot stays consistent
+        available = self.polarion_testcases.available_testcases
+        testcases = {}
+        not_found = set()
+        for name in names:
+            work_item_id = available.get(name)
+            if work_item_id is None:
+                not_found.add(name)
+            else:
+                testcases[name] = work_item_id
+        return sorted(not_found), testcases
+
+    def handle_request(self, request):
+        """Returns response to the request."""
+        if not isinstance(request, dict):
+            return {'status': 'error', 'message': 'Bad request: expected JSON object'}
+        command = request.get('command')
+        if command == 'status':
+            return self.get_status()
+        if command != 'get_missing':
+            return {'status': 'error', 'message': "Unknown command '{}'".format(command)}
+
+        repo_dir = request.get('repo_dir')
+        if repo_dir and os.path.abspath(repo_dir) != self.repo_dir:
+            return {'status': 'error',
+                    'message': 'Serving different SVN repo {}'.format(self.repo_dir)}
+        id_range = tuple(request['id_range']) if request.get('id_range') else None
+        own_range = self.polarion_testcases.id_range
+        if own_range and tuple(own_range) != id_range:
+            return {'status': 'error',
+                    'message': 'Serving different range of workitems {}'.format(own_range)}
+        missing, testcases = self.get_missing(request['names'])
+        # testcases are found in the whole range of workitems the daemon loaded
+        return {'status': 'ok', 'missing': missing, 'testcases': testcases,
+                'id_range': own_range, 'updated': self.updated}
+
+    def _bind(self):
+        socket_dir = os.path.dirname(self.socket_path)
+        if socket_dir and not os.path.isdir(socket_dir):
+            os.makedirs(socket_dir, 0o700)
+        if os.path.exists(self.socket_path):
+            try:
+                running = _request(self.socket_path, {'command': 'status'}, timeout=5)
+            except TestcasesException:
+                running = True
+            if running:
+                raise TestcasesException(
+                    'SVN daemon is already running on {}'.format(self.socket_path))
+            # left behind by daemon that didn't exit cleanly
+            os.remove(self.socket_path)
+        server = _Server(self.socket_path, _RequestHandler)
+        server.svn_daemon = self
+        return server
+
+    def serve_forever(self):
+        """Loads the testcases and serves queries until stopped."""
+        watcher = RepoWatcher(self.repo_dir, self.poll_interval)
+        if not self.refresh() or not self.polarion_testcases:
+            watcher.close()
+            raise TestcasesException(
+                'No testcases loaded from SVN repo {}'.format(self.repo_dir))
+
+        try:
+            self._server = self._bind()
+        except (IOError, OSError) as err:
+            watcher.close()
+            raise TestcasesException(
+                'Failed to listen on {}: {}'.format(self.socket_path, err))
+
+        watch_thread = threading.Thread(target=self._watch, args=(watcher,))
+        watch_thread.daemon = True
+        watch_thread.start()
+        logger.info(
+            'Serving testcases from %s on %s, watching for changes using %s',
+            self.repo_dir, self.socket_path, watcher.method)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._stop.set()
+            self._server.server_close()
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        """Stops serving, must be called from different thread than `serve_forever`."""
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+
+
+def _request(socket_path, request, timeout):
+    """Sends request to the daemon and returns its response.
+
+    Returns None when no daemon is listening on the socket.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(socket_path)
+        except socket.error as err:
+            if err.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                return None
+            raise
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        response_file = sock.makefile('rb')
+        try:
+            line = response_file.readline()
+        finally:
+            response_file.close()
+    except socket.error as err:
+        raise TestcasesException('Communication with SVN daemon failed: {}'.format(err))
+    finally:
+        sock.close()
+
+    try:
+        response = json.loads(line.decode('utf-8'))
+    except ValueError:
+        raise TestcasesException('Invalid response from SVN daemon')
+    if response.get('status') != 'ok':
+        raise TestcasesException('SVN daemon error: {}'.format(response.get('message')))
+    return response
+
+
+def query_missing(socket_path, repo_dir, testcase_names, id_range=None, timeout=60):
+    """Gets set of testcases not found by the daemon and dict of names and ids of the others.
+
+    Returns also the range of workitems that was searched (None for all workitems)
+    or None when no daemon is running.
+    """
+    response = _request(
+        os.path.expanduser(socket_path),
+        {
+            'command': 'get_missing',
+            'repo_dir': os.path.abspath(os.path.expanduser(repo_dir)),
+            'names': list(testcase_names),
+            'id_range': id_range,
+        },
+        timeout)
+    if response is None:
+        return None
+    return set(response['missing']), response['testcases'], response.get('id_range', id_range)
+
+
+def load_testcases(socket_path, repo_dir, testcase_names, id_range=None, fields=None):
+    """Loads active testcases from `testcase_names` using the daemon.
+
+    Returns None when no daemon is running. Only the testcases found are available,
+    their `fields` are loaded from the SVN repo on access.
+    """
+    result = query_missing(socket_path, repo_dir, testcase_names, id_range=id_range)
+    if result is None:
+        return None
+    __, testcases, searched_range = result
+    polarion_testcases = svn_testcases.PolarionTestcases(
+        repo_dir, id_range=tuple(searched_range) if searched_range else None, fields=fields)
+    polarion_testcases.available_testcases = testcases
+    return polarion_testcases
+
+
+def _interrupt(__, ___):
+    raise KeyboardInterrupt()
+
+
+def run_daemon(repo_dir, **kwargs):
+    """Runs the daemon until it's interrupted or terminated.
+
+    Keyword arguments are passed to `SVNDaemon`.
+    """
+    daemon = SVNDaemon(repo_dir, **kwargs)
+    # exit cleanly and remove the socket when terminated
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
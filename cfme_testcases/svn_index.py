@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent index of workitems from Polarion SVN repo.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import errno
+import hashlib
+import logging
+import os
+import sqlite3
+
+from cfme_testcases.exceptions import TestcasesException
+
+
+# pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+
+
+_SCHEMA_VERSION = '1'
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS workitems ('
+    'work_item_id TEXT PRIMARY KEY, title TEXT, status TEXT, type TEXT, '
+    'mtime REAL NOT NULL, size INTEGER NOT NULL)',
+)
+
+
+def get_default_index_file(repo_dir):
+    """Returns path to the index file for the SVN repo in the user's cache dir."""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    repo_hash = hashlib.sha1(
+        os.path.abspath(os.path.expanduser(repo_dir)).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, 'cfme-testcases', 'svn-index-{}.sqlite'.format(repo_hash[:12]))
+
+
+class WorkItemIndex(object):
+    """SQLite index of workitems with their files' mtime and size."""
+
+    def __init__(self, index_file, repo_dir):
+        self.index_file = os.path.expanduser(index_file)
+        self.repo_dir = os.path.abspath(os.path.expanduser(repo_dir))
+        # ids of workitems added or changed since the previous refresh, None before refresh
+        self.changed = None
+        self._conn = None
+
+    @property
+    def conn(self):
+        """Returns connection to the index database, creates the database if needed."""
+        if self._conn is None:
+            index_dir = os.path.dirname(self.index_file)
+            try:
+                if index_dir and not os.path.isdir(index_dir):
+                    os.makedirs(index_dir)
+            except OSError as err:
+                # the dir can be created by another process in the meantime
+                if err.errno != errno.EEXIST:
+                    raise TestcasesException(
+                        "Failed to create dir for SVN index '{}': {}".format(self.index_file, err))
+            try:
+                self._conn = sqlite3.connect(self.index_file, timeout=60)
+                self._init_schema()
+            except sqlite3.Error as err:
+                raise TestcasesException(
+                    "Failed to open SVN index '{}': {}".format(self.index_file, err))
+        return self._conn
+
+    def _init_schema(self):
+        conn = self._conn
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        meta = dict(conn.execute('SELECT key, value FROM meta'))
+        if meta.get('version') == _SCHEMA_VERSION and meta.get('repo_dir') == self.repo_dir:
+            return
+        # index created by different version or for different repo, start from scratch
+        if meta:
+            logger.info('Rebuilding SVN index %s', self.index_file)
+        conn.execute('DELETE FROM workitems')
+        conn.execute('DELETE FROM meta')
+        conn.executemany(
+            'INSERT INTO meta (key, value) VALUES (?, ?)',
+            (('version', _SCHEMA_VERSION), ('repo_dir', self.repo_dir)))
+        conn.commit()
+
+    def close(self):
+        """Closes connection to the index database."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def refresh(self, workitem_files, parse_func, in_scope=None):
+        """Re-parses workitems that were added or changed and drops deleted ones.
+
+        `workitem_files` is iterable of (work_item_id, path to workitem.xml) and
+        `parse_func` takes iterable of such tuples and yields
+        (work_item_id, title, status, type) tuples. When only part of the repo
+        was traversed, `in_scope` tells which workitem ids it covers.
+        """
+        conn = self.conn
+        known = {row[0]: (row[1], row[2]) for row in conn.execute(
+            'SELECT work_item_id, mtime, size FROM workitems')}
+
+        seen = set()
+        changed = {}
+        for work_item_id, path in workitem_files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            seen.add(work_item_id)
+            file_stamp = (stat.st_mtime, stat.st_size)
+            if known.get(work_item_id) != file_stamp:
+                changed[work_item_id] = (path, file_stamp)
+        deleted = [(work_item_id,) for work_item_id in known if work_item_id not in seen and
+                   (in_scope is None or in_scope(work_item_id))]
+
+        to_parse = ((work_item_id, path) for work_item_id, (path, __) in changed.items())
+        rows = []
+        for summary in parse_func(to_parse):
+            file_stamp = changed[summary[0]][1]
+            rows.append(summary + file_stamp)
+
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO workitems '
+                '(work_item_id, title, status, type, mtime, size) VALUES (?, ?, ?, ?, ?, ?)',
+                rows)
+            conn.executemany('DELETE FROM workitems WHERE work_item_id = ?', deleted)
+        self.changed = set(changed)
+
+        logger.debug(
+            'SVN index refreshed: %d workitems, %d added or changed, %d deleted',
+            len(seen), len(rows), len(deleted))
+        return len(rows), len(deleted)
+
+    def iter_active_testcases(self, in_scope=None):
+        """Yields id, title and status of all active testcases."""
+        cursor = self.conn.execute(
+            "SELECT work_item_id, title, status FROM workitems WHERE type = 'testcase' "
+            "AND status IS NOT NULL AND status != 'inactive' "
+            "AND title IS NOT NULL AND title != '' ORDER BY work_item_id")
+        for row in cursor:
+            if in_scope is None or in_scope(row[0]):
+                yield row
+
+    def get_active_testcases(self, in_scope=None):
+        """Returns dict of all active testcase's names and ids."""
+        return {title: work_item_id
+                for work_item_id, title, __ in self.iter_active_testcases(in_scope)}
@@ -5,14 +5,26 @@ Testcases data from Polarion SVN repo.
 
 from __future__ import absolute_import, unicode_literals
 
+import functools
 import logging
+import multiprocessing
 import os
+import re
+import subprocess
+import sys
 
-from collections import defaultdict
+from collections import OrderedDict
 
 from lxml import etree
 
+try:
+    from os import scandir
+except ImportError:
+    # Python < 3.5
+    from scandir import scandir
+
 from cfme_testcases.exceptions import TestcasesException
+from cfme_testcases.svn_index import WorkItemIndex
 
 
 # pylint: disable=invalid-name
@@ -25,12 +37,241 @@ class InvalidObject(object):
     pass
 
 
+_INVALID = InvalidObject()
+
+
+try:
+    _intern = sys.intern
+except AttributeError:
+    # Python 2.x
+    def _intern(value):
+        try:
+            # pylint: disable=undefined-variable
+            return intern(value)
+        except TypeError:
+            # unicode can't be interned in Python 2.x
+            return value
+
+
+# fields loaded by default for every workitem
+WORKITEM_FIELDS = ('type', 'status', 'title', 'assignee')
+
+
+def get_workitem_fields(path, fields=None, testcases_only=False):
+    """Returns dict of fields of the workitem stored in the file.
+
+    Only `fields` are returned when specified (all fields otherwise). When
+    `testcases_only` is set, only the `type` field is returned for workitem
+    that is not a testcase.
+    """
+    try:
+        tree = etree.parse(path)
+    # pylint: disable=broad-except
+    except Exception:
+        logger.warning('Couldn\'t load workitem %s', path)
+        return None
+    found = {item.attrib['id']: item.text for item in tree.xpath('/work-item/field')}
+    if testcases_only and found.get('type') != 'testcase':
+        return {'type': found.get('type')}
+    if fields:
+        wanted = set(fields)
+        if testcases_only:
+            wanted.add('type')
+        found = {field_id: value for field_id, value in found.items() if field_id in wanted}
+    return found
+
+
+_BUCKET_SEARCH = re.compile(r'^([0-9]+)-([0-9]+)$')
+
+
+def get_workitem_number(work_item_id):
+    """Gets number from the workitem id, e.g. 31942 from RHCF3-31942."""
+    try:
+        return int(work_item_id.rsplit('-', 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def in_id_range(num, id_range):
+    """Checks that workitem number is in the (low, high) range, bounds are optional."""
+    if not id_range:
+        return True
+    low, high = id_range
+    return (low is None or num >= low) and (high is None or num <= high)
+
+
+def _run_svn(args):
+    """Runs the svn command and returns its output."""
+    try:
+        return subprocess.check_output(
+            ['svn', '--non-interactive'] + list(args), stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError) as err:
+        output = (getattr(err, 'output', None) or b'').decode('utf-8', 'ignore').strip()
+        raise TestcasesException('Failed to run svn {}: {}{}'.format(
+            args[0], err, ' {}'.format(output) if output else ''))
+
+
+def _get_revision(path, revision):
+    output = _run_svn(['info', '--show-item', 'revision', '-r', revision, path])
+    try:
+        return int(output.strip())
+    except ValueError:
+        raise TestcasesException("Failed to get {} revision of '{}'".format(revision, path))
+
+
+def get_path_workitem(path):
+    """Gets workitem id from path in the SVN repo, e.g. RHCF3-31942 from
+    '/trunk/tracker/workitems/30000-39999/31000-31999/31900-31999/RHCF3-31942/workitem.xml'.
+    """
+    __, found, rest = (path or '').partition('/tracker/workitems/')
+    if not found:
+        return None
+    for part in rest.split('/'):
+        if not _BUCKET_SEARCH.match(part):
+            return part or None
+    return None
+
+
+def get_changed_workitems(repo_dir):
+    """Returns ids of workitems changed in the SVN repo after the revision of the working copy.
+
+    The changes are not in the working copy yet, so the SVN server is asked.
+    """
+    workitems_dir = os.path.join(os.path.expanduser(repo_dir), 'tracker', 'workitems')
+    base = _get_revision(workitems_dir, 'BASE')
+    head = _get_revision(workitems_dir, 'HEAD')
+    if head <= base:
+        return set()
+
+    log = _run_svn(
+        ['log', '--xml', '--verbose', '-r', '{}:{}'.format(base + 1, head), workitems_dir])
+    try:
+        log_root = etree.fromstring(log)
+    except etree.XMLSyntaxError as err:
+        raise TestcasesException('Failed to parse svn log: {}'.format(err))
+
+    changed = set()
+    for path in log_root.iterfind('logentry/paths/path'):
+        work_item_id = get_path_workitem(path.text)
+        if work_item_id:
+            changed.add(work_item_id)
+    logger.debug('%d workitems changed in revisions %d-%d', len(changed), base + 1, head)
+    return changed
+
+
+def iter_workitem_files(workitems_dir, id_range=None):
+    """Yields id and path to workitem.xml of workitems in the `tracker/workitems` tree.
+
+    Descends only into buckets (e.g. 30000-39999/31000-31999/31900-31999) that can
+    contain workitems from the `id_range` and doesn't list the workitem directories.
+    """
+    try:
+        entries = scandir(workitems_dir)
+    except OSError as err:
+        logger.warning('Couldn\'t list %s: %s', workitems_dir, err)
+        return
+
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+
+        bucket = _BUCKET_SEARCH.match(entry.name)
+        if bucket:
+            if id_range:
+                low, high = id_range
+                if ((low is not None and int(bucket.group(2)) < low) or
+                        (high is not None and int(bucket.group(1)) > high)):
+                    continue
+            for workitem_file in iter_workitem_files(entry.path, id_range):
+                yield workitem_file
+            continue
+
+        if '*' in entry.name:
+            continue
+        num = get_workitem_number(entry.name)
+        if num is None or not in_id_range(num, id_range):
+            continue
+        yield entry.name, os.path.join(entry.path, 'workitem.xml')
+
+
+def get_workitem_summary(workitem_file):
+    """Returns id, title, status and type of the workitem.
+
+    `workitem_file` is tuple of workitem id and path to workitem.xml.
+    """
+    work_item_id, path = workitem_file
+    fields = get_workitem_fields(path, ('title', 'status'), testcases_only=True) or {}
+    return (work_item_id, fields.get('title'), fields.get('status'), fields.get('type'))
+
+
+def iter_workitem_summaries(workitem_files, jobs=1, chunksize=64):
+    """Yields summaries of workitems, parses them in `jobs` processes."""
+    if not jobs or jobs <= 1:
+        for workitem_file in workitem_files:
+            yield get_workitem_summary(workitem_file)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        # the pool consumes `workitem_files` lazily so parsing starts while
+        # the repo is still being traversed
+        for summary in pool.imap_unordered(get_workitem_summary, workitem_files, chunksize):
+            yield summary
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _iter_active_testcases(summaries):
+    """Yields id, title and status of active testcases from the workitem summaries."""
+    for case_id, case_title, case_status, case_type in summaries:
+        if case_type != 'testcase':
+            continue
+        if not case_status or case_status == 'inactive':
+            continue
+        if not case_title:
+            logger.warning('work item %s has no title', case_id)
+            continue
+        yield case_id, case_title, case_status
+
+
+class WorkItemRecord(object):
+    """Compact record of testcase workitem."""
+    __slots__ = ('project', 'number', 'title', 'status', 'assignee')
+
+    def __init__(self, work_item_id, title=None, status=None, assignee=None):
+        project, number = work_item_id.rsplit('-', 1)
+        self.project = _intern(project)
+        self.number = int(number)
+        self.title = _intern(title) if title else title
+        self.status = _intern(status) if status else status
+        self.assignee = _intern(assignee) if assignee else ''
+
+    @property
+    def work_item_id(self):
+        """Returns workitem id, e.g. RHCF3-31942."""
+        return '{}-{}'.format(self.project, self.number)
+
+    def __repr__(self):
+        return '<WorkItemRecord {}>'.format(self.work_item_id)
+
+
 class WorkItemCache(object):
-    """Cache of Polarion workitems."""
-    def __init__(self, repo_dir):
+    """Cache of Polarion workitems.
+
+    Compact records of loaded testcases are kept for the lifetime of the cache,
+    all loaded fields are kept only for `maxsize` most recently used workitems
+    (no limit when `maxsize` is 0).
+    """
+    def __init__(self, repo_dir, fields=None, maxsize=1000):
         self.repo_dir = repo_dir
         self.test_case_dir = os.path.join(self.repo_dir, 'tracker/workitems/')
-        self._cache = defaultdict(dict)
+        self.fields = WORKITEM_FIELDS + tuple(
+            field for field in fields or () if field not in WORKITEM_FIELDS)
+        self.maxsize = maxsize
+        self._records = {}
+        self._fields_cache = OrderedDict()
 
     @staticmethod
     def get_path(num):
@@ -44,89 +285,141 @@ class WorkItemCache(object):
         for i in range(dig_len - 2):
             divisor = 10 ** (dig_len - i - 1)
             paths.append(
-                '{}-{}'.format((num / divisor) * divisor, (((num / divisor) + 1) * divisor) - 1))
+                '{}-{}'.format((num // divisor) * divisor, (((num // divisor) + 1) * divisor) - 1))
         return '/'.join(paths)
 
-    def get_tree(self, work_item_id):
-        """Gets XML tree of the workitem."""
+    def get_workitem_file(self, work_item_id):
+        """Gets path to the workitem.xml of the workitem."""
         try:
             __, tcid = work_item_id.split('-')
         except ValueError:
             logger.warning('Couldn\'t load workitem %s, bad format', work_item_id)
-            self._cache[work_item_id] = InvalidObject()
+            self._records[work_item_id] = _INVALID
             return None
 
-        path = os.path.join(
+        return os.path.join(
             self.test_case_dir, self.get_path(tcid), work_item_id, 'workitem.xml')
-        try:
-            tree = etree.parse(path)
-        # pylint: disable=broad-except
-        except Exception:
-            logger.warning('Couldn\'t load workitem %s', work_item_id)
-            self._cache[work_item_id] = InvalidObject()
-            return None
-        return tree
 
-    def __getitem__(self, work_item_id):
-        if work_item_id in self._cache:
-            return self._cache[work_item_id]
-        elif isinstance(self._cache[work_item_id], InvalidObject):
+    def _load(self, work_item_id):
+        """Loads fields of the workitem, returns None if it's not a testcase."""
+        path = self.get_workitem_file(work_item_id)
+        if not path:
             return None
 
-        tree = self.get_tree(work_item_id)
-        if not tree:
+        fields = get_workitem_fields(path, self.fields, testcases_only=True)
+        if not fields or fields.get('type') != 'testcase':
+            self._records[work_item_id] = _INVALID
             return None
 
-        for item in tree.xpath('/work-item/field'):
-            self._cache[work_item_id][item.attrib['id']] = item.text
+        if 'assignee' not in fields:
+            fields['assignee'] = ''
+        if 'title' not in fields:
+            logger.warning('work item %s has no title', work_item_id)
 
-        if self._cache[work_item_id]['type'] != 'testcase':
-            self._cache[work_item_id] = InvalidObject()
-            return None
+        self._records[work_item_id] = WorkItemRecord(
+            work_item_id, fields.get('title'), fields.get('status'), fields['assignee'])
+        return fields
 
-        if 'assignee' not in self._cache[work_item_id]:
-            self._cache[work_item_id]['assignee'] = ''
-        if 'title' not in self._cache[work_item_id]:
-            logger.warning('work item %s has no title', work_item_id)
+    def add_record(self, work_item_id, title, status):
+        """Adds compact record of testcase workitem that was already parsed, returns it."""
+        record = WorkItemRecord(work_item_id, title, status)
+        self._records[work_item_id] = record
+        return record
+
+    def get_record(self, work_item_id):
+        """Gets compact record of the testcase workitem."""
+        if work_item_id not in self._records:
+            self._load(work_item_id)
+        record = self._records.get(work_item_id)
+        return None if record is _INVALID else record
+
+    def __getitem__(self, work_item_id):
+        fields = self._fields_cache.pop(work_item_id, None)
+        if fields is None:
+            if self._records.get(work_item_id) is _INVALID:
+                return None
+            fields = self._load(work_item_id)
+            if fields is None:
+                return None
 
-        return self._cache[work_item_id]
+        # (re)insert as the most recently used
+        self._fields_cache[work_item_id] = fields
+        if self.maxsize and len(self._fields_cache) > self.maxsize:
+            self._fields_cache.popitem(last=False)
+        return fields
 
 
 class PolarionTestcases(object):
     """Loads and access Polarion testcases."""
 
-    def __init__(self, repo_dir):
+    def __init__(
+            self, repo_dir, index_file=None, jobs=1, id_range=None, cache_size=1000, fields=None):
         self.repo_dir = os.path.expanduser(repo_dir)
-        self.wi_cache = WorkItemCache(self.repo_dir)
+        self.jobs = jobs
+        self.id_range = id_range
+        self.wi_cache = WorkItemCache(self.repo_dir, fields=fields, maxsize=cache_size)
+        self.index = WorkItemIndex(index_file, self.repo_dir) if index_file else None
         self.available_testcases = {}
+        # ids of workitems changed in the working copy since the previous load using the
+        # index, None when it's not known
+        self.changed_workitems = None
 
-    def load_active_testcases(self):
-        """Creates dict of all active testcase's names and ids."""
-        cases = {}
-        for item in os.walk(self.wi_cache.test_case_dir):
-            if 'workitem.xml' not in item[2]:
-                continue
-            case_id = os.path.split(item[0])[-1]
-            if not (case_id and '*' not in case_id):
-                continue
-            item_cache = self.wi_cache[case_id]
-            if not item_cache:
-                continue
-            case_status = item_cache.get('status')
-            if not case_status or case_status == 'inactive':
-                continue
-            case_title = item_cache.get('title')
-            if not case_title:
-                continue
-            cases[case_title] = case_id
+    def iter_workitem_files(self):
+        """Yields id and path to workitem.xml of all workitems in the repo."""
+        return iter_workitem_files(self.wi_cache.test_case_dir, self.id_range)
 
+    def in_scope(self, work_item_id):
+        """Checks that the workitem is in the id range of this instance."""
+        num = get_workitem_number(work_item_id)
+        return num is not None and in_id_range(num, self.id_range)
+
+    def _set_active_testcases(self, testcases):
+        """Keeps compact records of the active testcases and maps their titles to ids.
+
+        `testcases` are tuples of workitem id, title and status.
+        """
+        cases = {}
+        for case_id, case_title, case_status in testcases:
+            record = self.wi_cache.add_record(case_id, case_title, case_status)
+            cases[record.title] = case_id
         self.available_testcases = cases
 
+    def load_active_testcases(self):
+        """Creates dict of all active testcase's names and ids."""
+        parse_func = functools.partial(iter_workitem_summaries, jobs=self.jobs)
+        if self.index:
+            in_scope = self.in_scope if self.id_range else None
+            self.index.refresh(self.iter_workitem_files(), parse_func, in_scope)
+            self.changed_workitems = self.index.changed
+            self._set_active_testcases(self.index.iter_active_testcases(in_scope))
+            return
+        self._set_active_testcases(
+            _iter_active_testcases(parse_func(self.iter_workitem_files())))
+
+    def get_missing(self, testcase_names):
+        """Returns sets of testcases missing in Polarion and of testcases not known.
+
+        When only a range of workitems was loaded, testcases not found in it could
+        be outside of the range, so it's not known whether they are missing.
+        """
+        not_found = set(
+            name for name in testcase_names if name not in self.available_testcases)
+        if self.id_range:
+            return set(), not_found
+        return not_found, set()
+
     def get_by_name(self, testcase_name):
         """Gets testcase by it's name."""
         testcase_id = self.available_testcases[testcase_name]
         return self.wi_cache[testcase_id]
 
+    def get_fields_by_name(self, testcase_name):
+        """Gets fields of testcase by it's name, None if there's no such active testcase."""
+        testcase_id = self.available_testcases.get(testcase_name)
+        if testcase_id is None:
+            return None
+        return self.wi_cache[testcase_id]
+
     def get_by_id(self, testcase_id):
         """Gets testcase by it's id."""
         return self.wi_cache[testcase_id]
@@ -144,16 +437,30 @@ class PolarionTestcases(object):
         return '<Testcases {}>'.format(self.available_testcases)
 
 
-def get_missing(repo_dir, testcase_names):
-    """Gets set of testcases missing in Polarion."""
-    polarion_testcases = PolarionTestcases(repo_dir)
+def load_testcases(repo_dir, index_file=None, jobs=1, id_range=None, fields=None):
+    """Loads active testcases from SVN repo, `fields` are loaded on access."""
+    polarion_testcases = PolarionTestcases(
+        repo_dir, index_file=index_file, jobs=jobs, id_range=id_range, fields=fields)
     try:
         polarion_testcases.load_active_testcases()
     except Exception as err:
         raise TestcasesException(
             'Failed to load testcases from SVN repo {}: {}'.format(repo_dir, err))
+    finally:
+        if polarion_testcases.index:
+            polarion_testcases.index.close()
     if not polarion_testcases:
         raise TestcasesException(
             'No testcases loaded from SVN repo {}'.format(repo_dir))
-    missing = set(testcase_names) - set(polarion_testcases)
+    return polarion_testcases
+
+
+def get_missing(repo_dir, testcase_names, index_file=None, jobs=1, id_range=None):
+    """Gets set of testcases missing in Polarion.
+
+    With `id_range` no testcase is known to be missing, see `PolarionTestcases.get_missing`.
+    """
+    polarion_testcases = load_testcases(
+        repo_dir, index_file=index_file, jobs=jobs, id_range=id_range)
+    missing, __ = polarion_testcases.get_missing(testcase_names)
     return missing
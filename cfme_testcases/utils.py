@@ -5,21 +5,34 @@ Utility functions.
 
 from __future__ import absolute_import, unicode_literals
 
-import io
 import logging
 import os
 
-from lxml import etree
-
 from cfme_testcases.exceptions import TestcasesException
+from cfme_testcases.lazy_import import LazyModule
 
 
 # pylint: disable=invalid-name
 logger = logging.getLogger(__name__)
 
+etree = LazyModule('lxml.etree')
+
 
 _NOT_EXPECTED_FORMAT_MSG = 'XML file is not in expected format'
 
+_XML_PARSER = None
+
+
+def _get_xml_parser():
+    """Returns parser tuned for the big XML files with testcases and testsuites.
+
+    lxml parsers are not thread safe, use it only from the main thread.
+    """
+    global _XML_PARSER  # pylint: disable=global-statement
+    if _XML_PARSER is None:
+        _XML_PARSER = etree.XMLParser(huge_tree=True, remove_blank_text=True, collect_ids=False)
+    return _XML_PARSER
+
 
 def get_unicode_str(obj):
     """Makes sure obj is a unicode string."""
@@ -42,7 +55,7 @@ def get_unicode_str(obj):
 def get_xml_root(xml_file):
     """Returns XML root."""
     try:
-        xml_tree = etree.parse(os.path.expanduser(xml_file))
+        xml_tree = etree.parse(os.path.expanduser(xml_file), _get_xml_parser())
         xml_root = xml_tree.getroot()
     # pylint: disable=broad-except
     except Exception as err:
@@ -106,29 +119,71 @@ def etree_to_string(xml_root):
     return get_unicode_str(etree.tostring(xml_root, encoding='utf-8'))
 
 
-def get_all_testcases(testcases_file):
-    """Gets all testcases from XML."""
-    xml_root = get_xml_root(testcases_file)
+def iterparse_testcases(xml_file):
+    """Yields fully parsed `testcase` elements of the XML file one by one.
 
-    if xml_root.tag != 'testcases':
-        raise TestcasesException(
-            "XML file '{}' is not in expected format".format(testcases_file))
+    Elements preceding the testcase (e.g. properties) are available through its
+    parent. Processed testcases are cleared and removed from the tree so memory
+    consumption stays constant no matter how many testcases there are.
+    """
+    xml_file = os.path.expanduser(xml_file)
+    context = etree.iterparse(
+        xml_file, events=('end',), tag='testcase', huge_tree=True, remove_blank_text=True)
+    try:
+        for __, testcase in context:
+            yield testcase
+            testcase.clear()
+            previous = testcase.getprevious()
+            if previous is not None and previous.tag == 'testcase':
+                testcase.getparent().remove(previous)
+    except (etree.XMLSyntaxError, IOError, OSError) as err:
+        raise TestcasesException("Failed to parse XML file '{}': {}".format(xml_file, err))
 
-    testcase_instances = xml_root.findall('testcase')
-    attr = 'id'
 
-    for testcase in testcase_instances:
-        tc_id = testcase.get(attr)
+def get_all_testcases(testcases_file):
+    """Gets all testcases from XML, the XML is not loaded into memory at once."""
+    for testcase in iterparse_testcases(testcases_file):
+        xml_root = testcase.getparent()
+        if xml_root.tag != 'testcases' or xml_root.getparent() is not None:
+            raise TestcasesException(
+                "XML file '{}' is not in expected format".format(testcases_file))
+
+        tc_id = testcase.get('id')
         if tc_id:
             yield tc_id
 
 
-def write_xml(xml_root, filename):
-    """Outputs the XML content into a file."""
+def xml_writer(filename, xml_root, compress=False):
+    """Coroutine that writes XML into a file incrementally.
+
+    Writes start of the `xml_root` element and its current children and then
+    each element sent to it. Sending `None` finishes the file.
+    """
+    with etree.xmlfile(filename, encoding='utf-8', compression=9 if compress else 0) as xml_file:
+        with xml_file.element(xml_root.tag, xml_root.attrib):
+            for child in xml_root:
+                xml_file.write(child)
+            while True:
+                element = yield
+                if element is None:
+                    break
+                xml_file.write(element)
+    logger.info('Data written to %s', filename)
+
+
+def write_xml(xml_root, filename, compress=False):
+    """Outputs the XML content into a file (gzip compressed if requested).
+
+    The XML is serialized straight to the file without intermediate string.
+    """
     if xml_root is None:
         raise TestcasesException('No data to write.')
 
-    xml_str = etree_to_string(xml_root)
-    with io.open(filename, 'w', encoding='utf-8') as xml_file:
-        xml_file.write(get_unicode_str(xml_str))
+    try:
+        etree.ElementTree(xml_root).write(
+            filename,
+            encoding='utf-8',
+            compression=9 if compress else 0)
+    except (IOError, OSError) as err:
+        raise TestcasesException("Failed to write XML file '{}': {}".format(filename, err))
     logger.info('Data written to %s', filename)
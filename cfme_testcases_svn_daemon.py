@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Serve testcases from SVN repo with Polarion project to cfme-testcases.
+"""
+
+import sys
+
+from cfme_testcases.cli import daemon_main
+
+
+if __name__ == '__main__':
+    sys.exit(daemon_main())
@@ -9,9 +9,10 @@ setup(
     author='Martin Kourim',
     author_email='mkourim@redhat.com',
     license='GPL',
-    packages=find_packages(exclude=('tests',)),
-    scripts=['cfme_testcases_upload.py'],
-    install_requires=['pytest', 'dump2polarion>=0.19'],
+    packages=find_packages(exclude=('tests', 'benchmarks')),
+    scripts=['cfme_testcases_upload.py', 'cfme_testcases_svn_daemon.py'],
+    install_requires=['pytest', 'dump2polarion>=0.19,<0.20', 'scandir; python_version < "3.5"'],
+    python_requires='>=2.7, !=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*',
     keywords=['polarion', 'testing'],
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import, unicode_literals
+
+import io
+import os
+import shutil
+
+import pytest
+
+from cfme_testcases import svn_testcases
+
+
+_WORKITEM_TMPL = '''<?xml version="1.0" encoding="UTF-8"?>
+<work-item>
+  <field id="assignee">user</field>
+  <field id="caseautomation">automated</field>
+  <field id="status">{status}</field>
+  <field id="title">{title}</field>
+  <field id="type">{type}</field>
+</work-item>
+'''
+
+
+class SVNRepo(object):
+    """Working copy of SVN repo with Polarion project, only workitems are there."""
+
+    def __init__(self, repo_dir, project='RHCF3'):
+        self.repo_dir = repo_dir
+        self.project = project
+        self.workitems_dir = os.path.join(repo_dir, 'tracker', 'workitems')
+        os.makedirs(self.workitems_dir)
+
+    def get_id(self, num):
+        return '{}-{}'.format(self.project, num)
+
+    def get_dir(self, num):
+        return os.path.join(
+            self.workitems_dir, svn_testcases.WorkItemCache.get_path(num), self.get_id(num))
+
+    def add(self, num, title, status='approved', workitem_type='testcase'):
+        item_dir = self.get_dir(num)
+        if not os.path.isdir(item_dir):
+            os.makedirs(item_dir)
+        with io.open(os.path.join(item_dir, 'workitem.xml'), 'w', encoding='utf-8') as out:
+            out.write(_WORKITEM_TMPL.format(title=title, status=status, type=workitem_type))
+        return self.get_id(num)
+
+    def remove(self, num):
+        shutil.rmtree(self.get_dir(num))
+
+
+@pytest.fixture
+def svn_repo(tmpdir):
+    return SVNRepo(str(tmpdir.join('repo')))
+
+
+def _write_input_xmls(work_dir, names):
+    testcases = work_dir.join('testcases.xml')
+    testcases.write_text(
+        '<testcases project-id="RHCF3"><properties>'
+        '<property name="lookup-method" value="custom"/></properties>{}</testcases>'.format(
+            ''.join('<testcase id="{0}"><title>{0}</title></testcase>'.format(name)
+                    for name in names)),
+        'utf-8')
+    testsuites = work_dir.join('testsuites.xml')
+    testsuites.write_text(
+        '<testsuites><properties><property name="polarion-testrun-id" value="RUN"/>'
+        '</properties><testsuite name="Import" tests="{0}" skipped="{0}">{1}</testsuite>'
+        '</testsuites>'.format(
+            len(names), ''.join('<testcase name="{}"/>'.format(name) for name in names)),
+        'utf-8')
+    return str(testcases), str(testsuites)
+
+
+@pytest.fixture
+def write_input_xmls():
+    """Returns function writing XMLs with testcases and testsuites with the names to a dir."""
+    return _write_input_xmls
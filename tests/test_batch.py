@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring,redefined-outer-name
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+
+import pytest
+
+from dump2polarion import submit
+
+from cfme_testcases import batch, cli, exceptions, filters, metrics, utils
+
+
+@pytest.fixture
+def batch_args(tmpdir, svn_repo, write_input_xmls):
+    """RUN-1 and RUN-2 share XMLs, RUN-3 has its own."""
+    svn_repo.add(1000, 'test_0')
+    svn_repo.add(1001, 'test_1')
+    shared_testcases, shared_testsuites = write_input_xmls(
+        tmpdir.mkdir('shared'), ['test_0', 'test_1', 'test_2', 'test_3'])
+    own_testcases, own_testsuites = write_input_xmls(tmpdir.mkdir('own'), ['test_1', 'test_4'])
+    manifest = tmpdir.join('manifest.txt')
+    manifest.write_text(
+        '# testruns\nRUN-1\n\nRUN-2\nRUN-3 {} {}\n'.format(own_testcases, own_testsuites),
+        'utf-8')
+    return cli.get_args([
+        '--batch', str(manifest), '--testcases', shared_testcases,
+        '--testsuites', shared_testsuites, '--use-svn', svn_repo.repo_dir,
+        '--no-svn-daemon', '--no-svn-index', '--no-testcases-update',
+        '-o', str(tmpdir.mkdir('out'))])
+
+
+def _get_testrun_id(xml_root):
+    for prop in xml_root.iterfind('properties/property'):
+        if prop.get('name') == 'polarion-testrun-id':
+            return prop.get('value')
+    return None
+
+
+class TestReadBatchManifest(object):
+    def test_read(self, tmpdir):
+        manifest = tmpdir.join('manifest.txt')
+        manifest.write_text('# comment\nRUN-1\n\n  RUN-2 cases.xml suites.xml\n', 'utf-8')
+        assert batch.read_batch_manifest(str(manifest)) == [
+            batch.BatchRun('RUN-1', None, None),
+            batch.BatchRun('RUN-2', 'cases.xml', 'suites.xml')]
+
+    @pytest.mark.parametrize('content', [
+        'RUN-1 cases.xml\n',
+        'RUN-1\nRUN-1 cases.xml suites.xml\n',
+    ], ids=['missing_xml', 'duplicate'])
+    def test_invalid(self, tmpdir, content):
+        manifest = tmpdir.join('manifest.txt')
+        manifest.write_text(content, 'utf-8')
+        with pytest.raises(exceptions.TestcasesException):
+            batch.read_batch_manifest(str(manifest))
+
+    def test_empty(self, tmpdir):
+        manifest = tmpdir.join('manifest.txt')
+        manifest.write_text('# nothing\n', 'utf-8')
+        with pytest.raises(exceptions.NothingToDoException):
+            batch.read_batch_manifest(str(manifest))
+
+
+class TestRunBatch(object):
+    def test_no_submit(self, batch_args):
+        batch_args.no_submit = True
+        run_metrics = metrics.Metrics()
+        batch.run_batch(batch_args, None, run_metrics)
+
+        testcases = []
+        testsuites = {}
+        for fname in os.listdir(batch_args.output_dir):
+            if '-missing-' not in fname:
+                continue
+            xml_root = utils.get_xml_root(os.path.join(batch_args.output_dir, fname))
+            if xml_root.tag == 'testsuites':
+                testsuites[_get_testrun_id(xml_root)] = filters.get_testcases_names(xml_root)
+            else:
+                testcases.append(filters.get_testcases_names(xml_root))
+        # missing testcases are written once for each distinct set of XMLs
+        assert sorted(testcases, key=sorted) == [{'test_2', 'test_3'}, {'test_4'}]
+        assert testsuites == {
+            'RUN-1': {'test_2', 'test_3'},
+            'RUN-2': {'test_2', 'test_3'},
+            'RUN-3': {'test_4'},
+        }
+        assert run_metrics.phases['missing'].counts['missing'] == 3
+
+    def test_submit(self, batch_args, monkeypatch):
+        submitted = []
+
+        def _submit_and_verify(xml_root=None, **kwargs):
+            submitted.append((
+                xml_root.tag, _get_testrun_id(xml_root), filters.get_testcases_names(xml_root)))
+            return True
+
+        monkeypatch.setattr(submit, 'submit_and_verify', _submit_and_verify)
+        batch_args.submit_workers = 1
+        batch.run_batch(batch_args, None, metrics.Metrics())
+
+        submitted_testcases = [names for tag, __, names in submitted if tag == 'testcases']
+        assert sorted(submitted_testcases, key=sorted) == [{'test_2', 'test_3'}, {'test_4'}]
+        submitted_testruns = [testrun_id for tag, testrun_id, __ in submitted
+                              if tag == 'testsuites']
+        assert sorted(submitted_testruns) == ['RUN-1', 'RUN-2', 'RUN-3']
+
+    def test_testrun_init(self, batch_args):
+        batch_args.testrun_init = True
+        with pytest.raises(exceptions.TestcasesException):
+            batch.run_batch(batch_args, None, metrics.Metrics())
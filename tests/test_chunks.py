@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import, unicode_literals
+
+import argparse
+
+import pytest
+
+from lxml import etree
+
+from cfme_testcases import exceptions, filters, submissions
+
+
+def _get_testcases(count):
+    xml_root = etree.fromstring(
+        '<testcases project-id="RHCF3"><properties>'
+        '<property name="lookup-method" value="name"/></properties></testcases>')
+    for num in range(count):
+        testcase = etree.SubElement(xml_root, 'testcase', id='test_{}'.format(num))
+        etree.SubElement(testcase, 'title').text = 'test_{}'.format(num)
+    return xml_root
+
+
+def _get_testsuites(*sizes):
+    xml_root = etree.fromstring(
+        '<testsuites><properties>'
+        '<property name="polarion-testrun-id" value="RUN"/></properties></testsuites>')
+    num = 0
+    for suite_num, size in enumerate(sizes):
+        testsuite = etree.SubElement(
+            xml_root, 'testsuite', name='suite{}'.format(suite_num), tests=str(size))
+        for __ in range(size):
+            etree.SubElement(testsuite, 'testcase', name='test_{}'.format(num))
+            num += 1
+    return xml_root
+
+
+def _get_chunk_names(chunks):
+    return [sorted(filters.get_testcases_names(chunk), key=lambda name: int(name[5:]))
+            for chunk in chunks]
+
+
+class TestSplitXML(object):
+    def test_testcases(self):
+        xml_root = _get_testcases(5)
+        chunks = filters.split_xml(xml_root, 2)
+        assert _get_chunk_names(chunks) == [
+            ['test_0', 'test_1'], ['test_2', 'test_3'], ['test_4']]
+        for chunk in chunks:
+            assert chunk.get('project-id') == 'RHCF3'
+            assert chunk.find('properties/property').get('value') == 'name'
+        # the input is not modified
+        assert len(xml_root.findall('testcase')) == 5
+
+    def test_testsuites(self):
+        xml_root = _get_testsuites(3, 2)
+        chunks = filters.split_xml(xml_root, 2)
+        assert _get_chunk_names(chunks) == [
+            ['test_0', 'test_1'], ['test_2', 'test_3'], ['test_4']]
+        # chunk spanning two testsuites keeps both of them with updated counts
+        assert [(testsuite.get('name'), testsuite.get('tests'))
+                for testsuite in chunks[1].iterfind('testsuite')] == [
+                    ('suite0', '1'), ('suite1', '1')]
+        for chunk in chunks:
+            assert chunk.find('properties/property').get('value') == 'RUN'
+        assert xml_root.find('testsuite').get('tests') == '3'
+
+    def test_single_chunk(self):
+        chunks = filters.split_xml(_get_testcases(3), 3)
+        assert len(chunks) == 1
+
+    def test_empty(self):
+        assert filters.split_xml(_get_testcases(0), 2) == []
+
+    def test_bad_chunk_size(self):
+        with pytest.raises(exceptions.TestcasesException):
+            filters.split_xml(_get_testcases(1), 0)
+
+    def test_bad_root(self):
+        with pytest.raises(exceptions.TestcasesException):
+            filters.split_xml(etree.Element('foo'), 1)
+
+
+def _get_submission(name):
+    return [submission for submission in submissions.SUBMISSIONS if submission.name == name][0]
+
+
+class TestSubmitChunks(object):
+    def test_no_chunking(self):
+        xml_root = _get_testcases(5)
+        args = argparse.Namespace(chunk_size=None)
+        chunks = submissions.get_submit_chunks(args, _get_submission('testcases'), xml_root)
+        assert len(chunks) == 1
+        assert chunks[0].job_name == 'testcases'
+        assert chunks[0].xml is xml_root
+        assert chunks[0].names is None
+
+    def test_one_chunk(self):
+        args = argparse.Namespace(chunk_size=10)
+        chunks = submissions.get_submit_chunks(
+            args, _get_submission('testcases'), _get_testcases(5))
+        assert [chunk.job_name for chunk in chunks] == ['testcases']
+        assert len(chunks[0].names) == 5
+
+    def test_chunks(self):
+        args = argparse.Namespace(chunk_size=2)
+        chunks = submissions.get_submit_chunks(
+            args, _get_submission('testrun'), _get_testsuites(3, 2))
+        assert [chunk.job_name for chunk in chunks] == ['testrun-1', 'testrun-2', 'testrun-3']
+        assert chunks[0].description == 'update testrun (chunk 1/3)'
+        assert chunks[2].names == {'test_4'}
+
+    def test_chunk_deps(self):
+        args = argparse.Namespace(chunk_size=2)
+        testcases_chunks = submissions.get_submit_chunks(
+            args, _get_submission('testcases'), _get_testcases(4))
+        testrun_chunks = submissions.get_submit_chunks(
+            args, _get_submission('testrun'), _get_testsuites(1, 1, 1, 1))
+        deps = [submissions._get_chunk_deps(chunk, testcases_chunks) for chunk in testrun_chunks]
+        assert deps == [
+            ['testcases-1'], ['testcases-2']]
+
+    def test_chunk_deps_spanning(self):
+        args = argparse.Namespace(chunk_size=2)
+        testcases_chunks = submissions.get_submit_chunks(
+            args, _get_submission('testcases'), _get_testcases(4))
+        args.chunk_size = 3
+        testrun_chunks = submissions.get_submit_chunks(
+            args, _get_submission('testrun'), _get_testsuites(4))
+        deps = [submissions._get_chunk_deps(chunk, testcases_chunks) for chunk in testrun_chunks]
+        assert deps == [
+            ['testcases-1', 'testcases-2'], ['testcases-2']]
+
+    def test_chunk_deps_no_shared(self):
+        args = argparse.Namespace(chunk_size=1)
+        dep_chunks = submissions.get_submit_chunks(
+            args, _get_submission('testcases'), _get_testcases(2))
+        chunk = submissions.SubmitChunk('testrun', 'update testrun', None, {'test_other'})
+        # without shared testcases the chunk depends on all of them
+        assert submissions._get_chunk_deps(chunk, dep_chunks) == ['testcases-1', 'testcases-2']
+
+    def test_chunk_deps_unchunked(self):
+        args = argparse.Namespace(chunk_size=1)
+        dep_chunks = submissions.get_submit_chunks(
+            args, _get_submission('testcases'), _get_testcases(2))
+        chunk = submissions.SubmitChunk('testrun', 'update testrun', None, None)
+        assert submissions._get_chunk_deps(chunk, dep_chunks) == ['testcases-1', 'testcases-2']
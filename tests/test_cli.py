@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from cfme_testcases import cli
+
+
+class TestMain(object):
+    @pytest.mark.parametrize('args', [
+        ['--detect-renames'],
+        ['--hybrid-missing'],
+        ['--use-svn', 'repo', '--svn-id-range', '1000-1999'],
+    ], ids=['renames_without_svn', 'hybrid_without_svn', 'range_without_hybrid'])
+    def test_incompatible_options(self, args):
+        assert cli.main(['-n'] + args) == 1
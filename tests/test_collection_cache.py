@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring,redefined-outer-name
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+
+import pytest
+
+from cfme_testcases import collection_cache, exceptions
+
+
+FILES = ('test_case_import.xml', 'test_run_import.xml')
+
+
+@pytest.fixture
+def src_dir(tmpdir):
+    src = tmpdir.mkdir('src')
+    for fname in FILES:
+        src.join(fname).write_binary(os.urandom(2048))
+    return src
+
+
+def _set_stamp(cache, key, mark, stamp):
+    os.utime(os.path.join(cache.cache_dir, key, mark), (stamp, stamp))
+
+
+class TestCollectionCache(object):
+    def test_store_restore(self, tmpdir, src_dir):
+        cache = collection_cache.CollectionCache(str(tmpdir.join('cache')))
+        cache.store('key', FILES, str(src_dir))
+
+        dest = tmpdir.mkdir('dest')
+        assert cache.restore('key', FILES, str(dest))
+        for fname in FILES:
+            assert dest.join(fname).read_binary() == src_dir.join(fname).read_binary()
+
+    def test_miss(self, tmpdir, src_dir):
+        cache = collection_cache.CollectionCache(str(tmpdir.join('cache')))
+        assert not cache.restore('key', FILES, str(tmpdir))
+        cache.store('key', FILES, str(src_dir))
+        assert not cache.restore('other', FILES, str(tmpdir))
+
+    def test_restore_broken(self, tmpdir, src_dir):
+        cache = collection_cache.CollectionCache(str(tmpdir.join('cache')))
+        cache.store('key', FILES, str(src_dir))
+        os.remove(os.path.join(cache.cache_dir, 'key', FILES[1] + '.gz'))
+
+        dest = tmpdir.mkdir('dest')
+        assert not cache.restore('key', FILES, str(dest))
+        # no partially restored files are left behind
+        assert dest.listdir() == []
+
+    def test_incomplete_entry_ignored(self, tmpdir, src_dir):
+        cache = collection_cache.CollectionCache(str(tmpdir.join('cache')), max_size=1)
+        tmp_entry = tmpdir.join('cache', '.tmp-entry').ensure(dir=True)
+        tmp_entry.join(FILES[0] + '.gz').write_binary(os.urandom(4096))
+        cache.store('key', FILES, str(src_dir))
+        # entry being stored by another process is not evicted
+        assert tmp_entry.check(dir=True)
+        assert cache.restore('key', FILES, str(tmpdir.mkdir('dest')))
+
+    @pytest.mark.parametrize('policy, evicted', [('lru', 'second'), ('fifo', 'first')])
+    def test_evict(self, tmpdir, src_dir, policy, evicted):
+        cache = collection_cache.CollectionCache(str(tmpdir.join('cache')), policy=policy)
+        cache.store('first', FILES, str(src_dir))
+        cache.store('second', FILES, str(src_dir))
+        _set_stamp(cache, 'first', '.stored', 1000)
+        _set_stamp(cache, 'second', '.stored', 2000)
+        # the first entry was used more recently
+        _set_stamp(cache, 'first', '.used', 4000)
+        _set_stamp(cache, 'second', '.used', 3000)
+
+        entry_size = sum(
+            os.path.getsize(os.path.join(cache.cache_dir, 'first', fname))
+            for fname in os.listdir(os.path.join(cache.cache_dir, 'first')))
+        cache.max_size = entry_size * 2 + 1
+        cache.store('third', FILES, str(src_dir))
+
+        assert sorted(os.listdir(cache.cache_dir)) == sorted(
+            {'first', 'second', 'third'} - {evicted})
+
+    def test_newest_kept(self, tmpdir, src_dir):
+        cache = collection_cache.CollectionCache(str(tmpdir.join('cache')), max_size=0)
+        cache.store('first', FILES, str(src_dir))
+        cache.store('second', FILES, str(src_dir))
+        _set_stamp(cache, 'first', '.used', 2000)
+        _set_stamp(cache, 'second', '.used', 1000)
+        cache.max_size = 1
+        cache.evict()
+        assert os.listdir(cache.cache_dir) == ['first']
+
+    def test_unknown_policy(self):
+        with pytest.raises(exceptions.TestcasesException):
+            collection_cache.CollectionCache('cache', policy='random')
+
+
+class TestContentHash(object):
+    def test_changes_with_content(self, tmpdir):
+        tests_dir = tmpdir.mkdir('cfme').mkdir('tests')
+        tests_dir.join('test_a.py').write('def test_a(): pass\n')
+        tests_dir.join('notes.txt').write('ignored\n')
+
+        def _hash():
+            return collection_cache.get_content_hash(['--collect-only'], str(tmpdir))
+
+        orig_hash = _hash()
+        assert _hash() == orig_hash
+        tests_dir.join('notes.txt').write('still ignored\n')
+        assert _hash() == orig_hash
+        tests_dir.join('test_a.py').write('def test_b(): pass\n')
+        assert _hash() != orig_hash
+
+    def test_changes_with_args(self, tmpdir):
+        assert collection_cache.get_content_hash(['a'], str(tmpdir)) != (
+            collection_cache.get_content_hash(['b'], str(tmpdir)))
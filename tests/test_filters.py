@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from lxml import etree
+
+from cfme_testcases import filters, utils
+from cfme_testcases.input_xmls import InputXMLs
+
+
+NAMES = ['test_{}'.format(num) for num in range(6)]
+
+TESTCASES_XML = '''<?xml version="1.0" encoding="utf-8"?>
+<testcases project-id="RHCF3">
+  <properties><property name="lookup-method" value="custom"/></properties>
+  <response-properties><response-property name="cfme-testcases" value="x"/></response-properties>
+  {}
+</testcases>
+'''.format('\n  '.join(
+    '<testcase id="{0}"><title>{0}</title><custom-fields>'
+    '<custom-field content="automated" id="caseautomation"/>'
+    '<custom-field content="cfme/tests/{0}.py" id="automation_script"/>'
+    '<custom-field content="medium" id="caseimportance"/>'
+    '</custom-fields></testcase>'.format(name) for name in NAMES))
+
+TESTSUITES_XML = '''<?xml version="1.0" encoding="utf-8"?>
+<testsuites>
+  <properties>
+    <property name="polarion-testrun-id" value="RUN"/>
+    <property name="polarion-response-cfme-testcases" value="x"/>
+  </properties>
+  <testsuite errors="0" failures="0" name="Import" skipped="6" tests="6" time="0">
+    {}
+  </testsuite>
+</testsuites>
+'''.format('\n    '.join(
+    '<testcase name="{}"><skipped message="collect-only"/></testcase>'.format(name)
+    for name in NAMES))
+
+
+def _normalize(xml_root):
+    if xml_root is None:
+        return None
+    for element in xml_root.iter():
+        if element.text is not None and not element.text.strip():
+            element.text = None
+        element.tail = None
+    return etree.tostring(xml_root)
+
+
+def _read(xml_file):
+    if xml_file is None:
+        return None
+    return _normalize(utils.get_xml_root(xml_file))
+
+
+@pytest.fixture
+def input_files(tmpdir):
+    testcases = tmpdir.join('testcases.xml')
+    testcases.write_text(TESTCASES_XML, 'utf-8')
+    testsuites = tmpdir.join('testsuites.xml')
+    testsuites.write_text(TESTSUITES_XML, 'utf-8')
+    return str(testcases), str(testsuites)
+
+
+def _filter_both(tmpdir, input_files, missing, **kwargs):
+    input_xmls = InputXMLs(*input_files)
+    in_memory = filters.get_filtered_xmls(input_xmls, missing, **kwargs)
+    output_files = filters.FilteredXMLs(*(
+        str(tmpdir.join('{}.xml'.format(name))) for name in filters.FilteredXMLs._fields))
+    streamed = filters.write_filtered_xmls(
+        input_files[0], input_files[1], missing, output_files, **kwargs)
+    return ([_normalize(xml_root) for xml_root in in_memory],
+            [_read(xml_file) for xml_file in streamed])
+
+
+class TestStreamingParity(object):
+    @pytest.mark.parametrize('kwargs', [
+        {},
+        {'fields': ('caseimportance',)},
+        {'is_changed': lambda testcase: testcase.get('id') in ('test_1', 'test_4')},
+        {'is_changed': lambda testcase: False},
+        {'renames': {'test_0': 'RHCF3-100'}},
+        {'unknown': {'test_2', 'test_3'}},
+    ], ids=['plain', 'fields', 'changed', 'nothing_changed', 'renames', 'unknown'])
+    def test_same_output(self, tmpdir, input_files, kwargs):
+        in_memory, streamed = _filter_both(tmpdir, input_files, {'test_0', 'test_5'}, **kwargs)
+        assert in_memory == streamed
+
+    def test_nothing_missing(self, tmpdir, input_files):
+        in_memory, streamed = _filter_both(tmpdir, input_files, set())
+        assert in_memory == streamed
+        assert in_memory[0] is None and in_memory[1] is None
+
+    def test_content(self, tmpdir, input_files):
+        __, streamed = _filter_both(
+            tmpdir, input_files, {'test_0', 'test_5'}, renames={'test_0': 'RHCF3-100'},
+            unknown={'test_2'})
+        missing_testcases, missing_testsuites, updated_testcases, renamed_testcases = [
+            etree.fromstring(content) for content in streamed]
+
+        assert filters.get_testcases_names(missing_testcases) == {'test_5'}
+        assert filters.get_testcases_names(missing_testsuites) == {'test_0', 'test_5'}
+        assert missing_testsuites.find('testsuite').get('tests') == '2'
+        assert filters.get_testcases_names(updated_testcases) == {'test_1', 'test_3', 'test_4'}
+        assert renamed_testcases.find('testcase').get('id') == 'RHCF3-100'
+        # response properties are removed
+        assert missing_testcases.find('response-properties') is None
+        # only the updated custom fields are kept
+        assert set(field.get('id') for field in updated_testcases.iterfind(
+            'testcase/custom-fields/custom-field')) == set(filters.UPDATED_FIELDS)
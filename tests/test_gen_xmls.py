@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from cfme_testcases import exceptions, filters, gen_xmls, utils
+
+
+def _write_shard(work_dir, names, skipped=None):
+    work_dir.join('test_case_import.xml').write_text(
+        '<testcases project-id="RHCF3"><properties>'
+        '<property name="lookup-method" value="custom"/></properties>{}</testcases>'.format(
+            ''.join('<testcase id="{0}"><title>{0}</title></testcase>'.format(name)
+                    for name in names)),
+        'utf-8')
+    work_dir.join('test_run_import.xml').write_text(
+        '<testsuites tests="{0}"><properties>'
+        '<property name="polarion-testrun-id" value="RUN"/></properties>'
+        '<testsuite name="pytest" tests="{0}" skipped="{1}">{2}</testsuite>'
+        '</testsuites>'.format(
+            len(names),
+            len(names) if skipped is None else skipped,
+            ''.join('<testcase name="{}"/>'.format(name) for name in names)),
+        'utf-8')
+    return str(work_dir)
+
+
+class TestMergeXMLs(object):
+    def test_merge(self, tmpdir):
+        work_dirs = [
+            _write_shard(tmpdir.mkdir('shard0'), ['test_a', 'test_b']),
+            _write_shard(tmpdir.mkdir('shard1'), ['test_c'], skipped=0),
+            _write_shard(tmpdir.mkdir('shard2'), ['test_d', 'test_e', 'test_f']),
+        ]
+        output_dir = tmpdir.mkdir('out')
+        gen_xmls.merge_xmls(work_dirs, str(output_dir))
+
+        testcases = utils.get_xml_root(str(output_dir.join('test_case_import.xml')))
+        assert [testcase.get('id') for testcase in testcases.iterfind('testcase')] == [
+            'test_a', 'test_b', 'test_c', 'test_d', 'test_e', 'test_f']
+        # properties of the first shard are kept
+        assert len(testcases.findall('properties/property')) == 1
+
+        testsuites = utils.get_xml_root(str(output_dir.join('test_run_import.xml')))
+        assert len(testsuites.findall('testsuite')) == 1
+        assert filters.get_testcases_names(testsuites) == {
+            'test_a', 'test_b', 'test_c', 'test_d', 'test_e', 'test_f'}
+        testsuite = testsuites.find('testsuite')
+        assert testsuite.get('tests') == '6'
+        assert testsuite.get('skipped') == '5'
+        assert testsuites.get('tests') == '6'
+        assert len(testsuites.findall('properties/property')) == 1
+
+    def test_single_shard(self, tmpdir):
+        work_dir = _write_shard(tmpdir.mkdir('shard0'), ['test_a'])
+        output_dir = tmpdir.mkdir('out')
+        gen_xmls.merge_xmls([work_dir], str(output_dir))
+        testsuites = utils.get_xml_root(str(output_dir.join('test_run_import.xml')))
+        assert testsuites.find('testsuite').get('tests') == '1'
+
+    def test_missing_xml(self, tmpdir):
+        work_dirs = [
+            _write_shard(tmpdir.mkdir('shard0'), ['test_a']),
+            str(tmpdir.mkdir('shard1')),
+        ]
+        with pytest.raises(exceptions.TestcasesException):
+            gen_xmls.merge_xmls(work_dirs, str(tmpdir.mkdir('out')))
+
+
+class TestGetShards(object):
+    def test_shards(self, tmpdir):
+        tests_dir = tmpdir.mkdir('tests')
+        for path in ('infra/test_a.py', 'infra/sub/test_b.py', 'cloud/test_c.py',
+                     '_private/test_d.py', 'empty/conftest.py', 'test_top.py'):
+            tests_dir.join(path).ensure()
+        tests_dir.join('conftest.py').ensure()
+
+        assert gen_xmls.get_shards(str(tests_dir)) == [
+            [str(tests_dir.join('infra'))],
+            [str(tests_dir.join('cloud'))],
+            [str(tests_dir.join('test_top.py'))],
+        ]
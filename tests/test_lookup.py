@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring,redefined-outer-name
+
+from __future__ import absolute_import, unicode_literals
+
+import io
+
+import pytest
+
+from cfme_testcases import cli, exceptions, filters, lookup, svn_testcases
+from cfme_testcases.input_xmls import InputXMLs
+
+
+NAMES = ['test_{}'.format(num) for num in range(4)]
+
+_PREFIX = '2017-10-10 10:10:10,100 INFO  [org.example.importer.Importer] (Worker-1) - '
+
+
+def write_log(log_file, found=(), not_found=()):
+    lines = ['Starting import of test cases']
+    lines.extend("Updated test case '{}' (RHCF3-1/x)".format(name) for name in found)
+    lines.extend("Created test case '{}' (RHCF3-2/x)".format(name) for name in not_found)
+    with io.open(log_file, 'w', encoding='utf-8') as out:
+        out.write(''.join('{}{}\n'.format(_PREFIX, line) for line in lines))
+
+
+@pytest.fixture
+def hybrid(tmpdir, svn_repo, write_input_xmls, monkeypatch):
+    """SVN repo knows test_0 and test_1, test_1 was changed after the last update."""
+    svn_repo.add(1000, 'test_0')
+    svn_repo.add(1001, 'test_1')
+    monkeypatch.setattr(
+        svn_testcases, 'get_changed_workitems', lambda *args, **kwargs: {'RHCF3-1001'})
+
+    input_xmls = InputXMLs(*write_input_xmls(tmpdir, NAMES))
+    args = cli.get_args([
+        '--use-svn', svn_repo.repo_dir, '--hybrid-missing', '-t', 'RUN',
+        '--job-log', str(tmpdir.join('init.log'))])
+    polarion_testcases = svn_testcases.load_testcases(svn_repo.repo_dir)
+    svn_missing, unknown = polarion_testcases.get_missing(input_xmls.get_testcases_names())
+    return args, input_xmls, polarion_testcases, svn_missing, unknown
+
+
+def _get_missing_hybrid(hybrid):
+    args, input_xmls, polarion_testcases, svn_missing, unknown = hybrid
+    return lookup.get_missing_hybrid(
+        args, {}, None, input_xmls, polarion_testcases, svn_missing, unknown)
+
+
+class TestGetMissingHybrid(object):
+    def test_dry_run(self, hybrid, monkeypatch):
+        submitted = []
+
+        def _submit(xml_root, submit_args, config, log):
+            submitted.append(filters.get_testcases_names(xml_root))
+            # test_2 was added to Polarion after the last update of the SVN repo,
+            # test_1 was removed
+            write_log(log, found=['test_2'], not_found=['test_1', 'test_3'])
+
+        monkeypatch.setattr(lookup, '_submit_initial_xml', _submit)
+        missing, unknown = _get_missing_hybrid(hybrid)
+        # only the testcases the SVN repo can't confirm are submitted
+        assert submitted == [{'test_1', 'test_2', 'test_3'}]
+        assert missing == {'test_1', 'test_3'}
+        assert not unknown
+
+    def test_existing_log(self, hybrid, monkeypatch):
+        args = hybrid[0]
+        write_log(args.job_log, found=['test_1', 'test_3'], not_found=['test_2'])
+
+        def _submit(*args):
+            raise AssertionError('no submit expected')
+
+        monkeypatch.setattr(lookup, '_submit_initial_xml', _submit)
+        missing, __ = _get_missing_hybrid(hybrid)
+        assert missing == {'test_2'}
+
+    def test_all_confirmed(self, hybrid, monkeypatch):
+        monkeypatch.setattr(
+            svn_testcases, 'get_changed_workitems', lambda *args, **kwargs: set())
+        args, input_xmls, polarion_testcases, __, __ = hybrid
+        missing, unknown = lookup.get_missing_hybrid(
+            args, {}, None, input_xmls, polarion_testcases, set(), set())
+        assert missing == set()
+        assert unknown == set()
+
+    def test_no_submit(self, hybrid):
+        args = hybrid[0]
+        args.no_submit = True
+        missing, __ = _get_missing_hybrid(hybrid)
+        # falls back to the SVN repo
+        assert missing == {'test_2', 'test_3'}
+
+    def test_svn_server_unavailable(self, hybrid, monkeypatch):
+        def _changed(*args, **kwargs):
+            raise exceptions.TestcasesException('svn failed')
+
+        submitted = []
+
+        def _submit(xml_root, submit_args, config, log):
+            submitted.append(filters.get_testcases_names(xml_root))
+            write_log(log, not_found=['test_2', 'test_3'])
+
+        monkeypatch.setattr(svn_testcases, 'get_changed_workitems', _changed)
+        monkeypatch.setattr(lookup, '_submit_initial_xml', _submit)
+        missing, __ = _get_missing_hybrid(hybrid)
+        # all testcases are checked
+        assert submitted == [set(NAMES)]
+        assert missing == {'test_2', 'test_3'}
+
+    def test_changed_from_index(self, tmpdir, svn_repo, hybrid, monkeypatch):
+        def _changed(*args, **kwargs):
+            raise AssertionError('SVN server is not expected to be asked')
+
+        monkeypatch.setattr(svn_testcases, 'get_changed_workitems', _changed)
+        args, input_xmls, __, svn_missing, unknown = hybrid
+        index_file = str(tmpdir.join('index.sqlite'))
+        svn_testcases.load_testcases(svn_repo.repo_dir, index_file=index_file)
+        svn_repo.add(1000, 'test_0', status='draft')
+        polarion_testcases = svn_testcases.load_testcases(
+            svn_repo.repo_dir, index_file=index_file)
+        # test_0 was changed in the working copy since the previous load
+        assert lookup.get_unconfirmed_testcases(
+            args, input_xmls, polarion_testcases, svn_missing, unknown) == {
+                'test_0', 'test_2', 'test_3'}
+
+    def test_check_svn_server(self, tmpdir, svn_repo, hybrid):
+        args, input_xmls, __, svn_missing, unknown = hybrid
+        args.check_svn_server = True
+        polarion_testcases = svn_testcases.load_testcases(
+            svn_repo.repo_dir, index_file=str(tmpdir.join('index.sqlite')))
+        # the SVN server reports test_1 as changed
+        assert lookup.get_unconfirmed_testcases(
+            args, input_xmls, polarion_testcases, svn_missing, unknown) == {
+                'test_1', 'test_2', 'test_3'}
+
+
+@pytest.fixture
+def from_log(tmpdir, write_input_xmls, monkeypatch):
+    """Input XMLs are also the XMLs generated by pytest, used for the initial submit."""
+    input_files = write_input_xmls(tmpdir, NAMES)
+    tmpdir.join('testcases.xml').copy(tmpdir.join('test_case_import.xml'))
+    monkeypatch.chdir(tmpdir)
+    args = cli.get_args(['-t', 'RUN', '--job-log', str(tmpdir.join('init.log'))])
+    return args, InputXMLs(*input_files)
+
+
+class TestGetMissingFromLog(object):
+    def test_submit(self, from_log, monkeypatch):
+        def _submit(xml_root, submit_args, config, log):
+            assert filters.get_testcases_names(xml_root) == set(NAMES)
+            write_log(log, found=['test_0'], not_found=['test_1'])
+
+        monkeypatch.setattr(lookup, '_submit_initial_xml', _submit)
+        args, input_xmls = from_log
+        assert lookup.get_missing_from_log(args, {}, None, input_xmls) == {'test_1'}
+
+    def test_submit_failed(self, from_log, monkeypatch):
+        def _submit(*args):
+            raise exceptions.TestcasesException('Failed to do the initial submit')
+
+        monkeypatch.setattr(lookup, '_submit_initial_xml', _submit)
+        args, input_xmls = from_log
+        with pytest.raises(exceptions.TestcasesException, match='initial submit'):
+            lookup.get_missing_from_log(args, {}, None, input_xmls)
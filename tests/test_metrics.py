@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import, unicode_literals
+
+import io
+import json
+
+import pytest
+
+from cfme_testcases import exceptions, metrics, scheduler
+
+
+def _get_metrics():
+    run_metrics = metrics.Metrics()
+    run_metrics.started = 1500000000.0
+    with run_metrics.phase('missing') as phase:
+        phase.count('missing', 3)
+        phase.add('renames', 1)
+        phase.add('renames', 1)
+    with pytest.raises(exceptions.TestcasesException):
+        with run_metrics.phase('submit'):
+            raise exceptions.TestcasesException('failed')
+
+    job = scheduler.Job('testcases-1', lambda: True)
+    job.outcome = scheduler.SUCCEEDED
+    job.attempts = 2
+    job.duration = 1.5
+    run_metrics.add_job(job, testcases=10)
+    job = scheduler.Job('testrun "x"', lambda: True)
+    job.outcome = scheduler.FAILED
+    job.attempts = 1
+    job.duration = 0.5
+    run_metrics.add_job(job)
+    return run_metrics
+
+
+def _get_samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        name, value = line.rsplit(' ', 1)
+        samples[name] = float(value)
+    return samples
+
+
+class TestMetrics(object):
+    def test_phases(self):
+        run_metrics = _get_metrics()
+        phases = run_metrics.to_dict()['phases']
+        assert list(phases) == ['missing', 'submit']
+        assert phases['missing']['counts'] == {'missing': 3, 'renames': 2}
+        assert not phases['missing']['failed']
+        assert phases['submit']['failed']
+        assert phases['missing']['wall_seconds'] >= 0
+
+    def test_prometheus(self):
+        samples = _get_samples(_get_metrics().to_prometheus())
+        assert samples['cfme_testcases_phase_items{phase="missing",item="missing"}'] == 3
+        assert samples['cfme_testcases_phase_items{phase="missing",item="renames"}'] == 2
+        assert samples['cfme_testcases_phase_failed{phase="missing"}'] == 0
+        assert samples['cfme_testcases_phase_failed{phase="submit"}'] == 1
+        assert 'cfme_testcases_phase_wall_seconds{phase="submit"}' in samples
+        assert samples['cfme_testcases_job_attempts{job="testcases-1"}'] == 2
+        assert samples['cfme_testcases_job_duration_seconds{job="testcases-1"}'] == 1.5
+        assert samples['cfme_testcases_job_succeeded{job="testcases-1"}'] == 1
+        assert samples['cfme_testcases_job_items{job="testcases-1",item="testcases"}'] == 10
+        # quotes in label values are escaped
+        assert samples['cfme_testcases_job_succeeded{job="testrun \\"x\\""}'] == 0
+        assert samples['cfme_testcases_last_run_timestamp_seconds'] == 1500000000.0
+
+    def test_prometheus_format(self):
+        lines = _get_metrics().to_prometheus().splitlines()
+        help_lines = [line for line in lines if line.startswith('# HELP ')]
+        type_lines = [line for line in lines if line.startswith('# TYPE ')]
+        # each metric is described once, right before its samples
+        assert len(help_lines) == len(set(help_lines)) == len(type_lines)
+        for num, line in enumerate(lines):
+            if line.startswith('# HELP '):
+                name = line.split()[2]
+                assert lines[num + 1] == '# TYPE {} gauge'.format(name)
+                assert lines[num + 2].startswith(name)
+
+    def test_missing_values_skipped(self):
+        run_metrics = metrics.Metrics()
+        run_metrics.phases['empty'] = metrics.Phase('empty')
+        samples = _get_samples(run_metrics.to_prometheus())
+        assert list(samples) == [
+            'cfme_testcases_phase_failed{phase="empty"}',
+            'cfme_testcases_last_run_timestamp_seconds']
+
+    @pytest.mark.parametrize('metrics_format', metrics.FORMATS)
+    def test_write(self, tmpdir, metrics_format):
+        metrics_file = tmpdir.join('metrics')
+        run_metrics = _get_metrics()
+        run_metrics.write(str(metrics_file), metrics_format)
+        with io.open(str(metrics_file), encoding='utf-8') as input_file:
+            content = input_file.read()
+        if metrics_format == 'json':
+            assert json.loads(content)['jobs']['testcases-1']['attempts'] == 2
+        else:
+            assert content == run_metrics.to_prometheus()
+        # no temporary files are left behind
+        assert tmpdir.listdir() == [metrics_file]
+
+    def test_write_unknown_format(self, tmpdir):
+        with pytest.raises(exceptions.TestcasesException):
+            metrics.Metrics().write(str(tmpdir.join('metrics')), 'xml')
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import, unicode_literals
+
+import gzip
+
+import pytest
+
+from cfme_testcases import exceptions, parselog
+
+
+_PREFIX = b'2017-10-10 10:10:10,100 INFO  [org.example.importer.Importer] (Worker-1) - '
+
+XUNIT_LOG = b'\n'.join(_PREFIX + line for line in (
+    b'Starting import of XUnit results',
+    b"Work item: 'test_power_on' (RHCF3-1)",
+    b"Unable to find work item for 'test_power_off'.",
+    b"Unable to find *unique* work item for 'test_tag_vm'.",
+    b"Work item: 'test_provision[rhv]' (RHCF3-2)",
+)) + b'\n'
+
+TEST_CASE_LOG = b'\n'.join(_PREFIX + line for line in (
+    b'Starting import of test cases',
+    b"Updated test case 'test_power_on' (RHCF3-1/x)",
+    b"Created test case 'test_power_off' (RHCF3-3/x)",
+    b"Found multiple work items with the title 'test_tag_vm'.",
+))
+
+XUNIT_OUTCOME = {
+    'results': [('test_power_on', 'RHCF3-1'), ('test_provision[rhv]', 'RHCF3-2')],
+    'not_found': ['test_power_off'],
+    'not_unique': ['test_tag_vm'],
+}
+
+TEST_CASE_OUTCOME = {
+    'results': [('test_power_on', 'RHCF3-1')],
+    'not_found': ['test_power_off'],
+    'not_unique': ['test_tag_vm'],
+}
+
+
+def _parse(tmpdir, data):
+    log_file = tmpdir.join('test.log')
+    log_file.write_binary(data)
+    return parselog.parse(str(log_file))
+
+
+class TestParse(object):
+    @pytest.mark.parametrize('log, outcome', [
+        (XUNIT_LOG, XUNIT_OUTCOME),
+        (TEST_CASE_LOG, TEST_CASE_OUTCOME),
+    ], ids=['xunit', 'test_case'])
+    def test_outcome(self, tmpdir, log, outcome):
+        assert _parse(tmpdir, log) == outcome
+
+    def test_crlf(self, tmpdir):
+        assert _parse(tmpdir, XUNIT_LOG.replace(b'\n', b'\r\n')) == XUNIT_OUTCOME
+
+    def test_gzip(self, tmpdir):
+        log_file = tmpdir.join('test.log.gz')
+        with gzip.open(str(log_file), 'wb') as out:
+            out.write(TEST_CASE_LOG)
+        assert parselog.parse(str(log_file)) == TEST_CASE_OUTCOME
+
+    def test_get_missing(self, tmpdir):
+        log_file = tmpdir.join('test.log')
+        log_file.write_binary(XUNIT_LOG)
+        assert parselog.get_missing(str(log_file)) == {'test_power_off'}
+
+    @pytest.mark.parametrize('data', [b'', b'nothing here\n'], ids=['empty', 'no_data'])
+    def test_no_data(self, tmpdir, data):
+        with pytest.raises(exceptions.TestcasesException):
+            _parse(tmpdir, data)
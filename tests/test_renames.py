@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import, unicode_literals
+
+import random
+
+import pytest
+
+from cfme_testcases import renames
+
+
+def _brute_force_search(titles, name, threshold):
+    ngrams = renames.get_ngrams(name)
+    found = [(renames.jaccard(ngrams, renames.get_ngrams(title)), title) for title in titles]
+    found = [item for item in found if item[0] >= threshold]
+    found.sort(key=lambda item: (-item[0], item[1]))
+    return found
+
+
+def _mutate(rnd, name):
+    chars = list(name)
+    for __ in range(rnd.randint(0, 8)):
+        pos = rnd.randrange(len(chars))
+        operation = rnd.choice(('delete', 'insert', 'replace'))
+        if operation == 'delete' and len(chars) > 1:
+            del chars[pos]
+        elif operation == 'insert':
+            chars.insert(pos, rnd.choice('abc_'))
+        else:
+            chars[pos] = rnd.choice('abc_')
+    return ''.join(chars)
+
+
+def _get_titles(seed):
+    rnd = random.Random(seed)
+    titles = set()
+    for __ in range(10):
+        base = 'test_{}'.format(''.join(rnd.choice('abc_') for __ in range(rnd.randint(5, 25))))
+        titles.add(base)
+        titles.update(_mutate(rnd, base) for __ in range(15))
+    return sorted(titles)
+
+
+class TestTitleIndex(object):
+    @pytest.mark.parametrize('threshold', [0.28, 0.5, 0.56, 0.68, 0.7, 0.9])
+    @pytest.mark.parametrize('seed', range(3))
+    def test_same_as_brute_force(self, seed, threshold):
+        titles = _get_titles(seed)
+        index = renames.TitleIndex(titles)
+        for name in titles[::7] + ['test_abc', 'test_']:
+            assert index.search(name, threshold) == _brute_force_search(
+                titles, name, threshold), name
+
+    @pytest.mark.parametrize('name, title, threshold', [
+        # 0.28 * 25 is 7.000000000000001
+        ('abcdefg hijklmnopqrstuvwx', 'abcdefg', 0.28),
+        # 0.56 * 25 is 14.000000000000002
+        ('abcdefghijklmn opqrstuvwx', 'abcdefghijklmn', 0.56),
+    ])
+    def test_threshold_float_error(self, name, title, threshold):
+        titles = [title, 'unrelated']
+        found = renames.TitleIndex(titles).search(name, threshold)
+        assert found == _brute_force_search(titles, name, threshold)
+        assert [item[1] for item in found] == [title]
+
+
+class TestFindRenames(object):
+    def test_one_to_one(self):
+        testcases = {'test_vm_power_on': 'RHCF3-1', 'test_vm_power_off': 'RHCF3-2'}
+        found = renames.find_renames(
+            ['test_vm_power_on_new', 'test_vm_power_on_newer'], testcases, [])
+        assert list(found) == ['test_vm_power_on_new']
+        assert found['test_vm_power_on_new'].work_item_id == 'RHCF3-1'
+
+    def test_current_names_not_renamed(self):
+        testcases = {'test_vm_power_on': 'RHCF3-1'}
+        assert not renames.find_renames(
+            ['test_vm_power_on_new'], testcases, ['test_vm_power_on'])
+
+    def test_other_parametrization_not_renamed(self):
+        testcases = {
+            'test_vm_power[vsphere]': 'RHCF3-1',
+            'test_synthetic_rhcf3_0': 'RHCF3-2',
+            'test_provision_1[rhv]': 'RHCF3-3',
+        }
+        assert not renames.find_renames(
+            ['test_vm_power[rhv]', 'test_synthetic_rhcf3_53', 'test_provision_2[scvmm]'],
+            testcases, [], threshold=0.3)
+
+    def test_parametrized_renamed(self):
+        testcases = {'test_vm_power[rhv]': 'RHCF3-1', 'test_vm_power[vsphere]': 'RHCF3-2'}
+        found = renames.find_renames(
+            ['test_vm_power_cycle[rhv]', 'test_vm_power_cycle[vsphere]'], testcases, [],
+            threshold=0.5)
+        assert {name: rename.work_item_id for name, rename in found.items()} == {
+            'test_vm_power_cycle[rhv]': 'RHCF3-1',
+            'test_vm_power_cycle[vsphere]': 'RHCF3-2',
+        }
+
+    def test_ambiguous_title(self):
+        # both titles are equally similar to the missing name
+        testcases = {'test_power_ab': 'RHCF3-1', 'test_power_cd': 'RHCF3-2'}
+        assert not renames.find_renames(['test_power_new'], testcases, [], threshold=0.5)
+
+    def test_ambiguous_name(self):
+        # both missing names are equally similar to the title
+        testcases = {'test_power_new': 'RHCF3-1'}
+        assert not renames.find_renames(
+            ['test_power_ab', 'test_power_cd'], testcases, [], threshold=0.5)
+
+    @pytest.mark.parametrize('name, stem', [
+        ('test_vm', 'test_vm'),
+        ('test_vm_10', 'test_vm_'),
+        ('test_vm[rhv-4.2]', 'test_vm'),
+        ('test_vm_1[rhv][a]', 'test_vm_'),
+        ('test_vm2x', 'test_vm2x'),
+    ])
+    def test_get_stem(self, name, stem):
+        assert renames.get_stem(name) == stem
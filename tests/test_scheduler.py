@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+
+import pytest
+
+from cfme_testcases import exceptions, scheduler
+
+
+def _recorder(record, name, retval=True):
+    def _func():
+        record.append(name)
+        return retval
+    return _func
+
+
+def _outcomes(jobs):
+    return {job.name: job.outcome for job in jobs}
+
+
+class TestScheduler(object):
+    def test_skip_cascade(self):
+        record = []
+        job_scheduler = scheduler.Scheduler(max_workers=2)
+        job_scheduler.add('a', _recorder(record, 'a', False))
+        job_scheduler.add('b', _recorder(record, 'b'), depends_on=['a'])
+        job_scheduler.add('c', _recorder(record, 'c'), depends_on=['b'])
+        job_scheduler.add('d', _recorder(record, 'd'))
+        jobs = job_scheduler.run()
+
+        assert _outcomes(jobs) == {
+            'a': scheduler.FAILED,
+            'b': scheduler.SKIPPED,
+            'c': scheduler.SKIPPED,
+            'd': scheduler.SUCCEEDED,
+        }
+        assert sorted(record) == ['a', 'd']
+
+    def test_exception_is_failure(self):
+        def _raise():
+            raise ValueError('broken')
+
+        job_scheduler = scheduler.Scheduler()
+        job = job_scheduler.add('a', _raise)
+        job_scheduler.run()
+        assert job.outcome == scheduler.FAILED
+        assert isinstance(job.error, ValueError)
+
+    def test_retries_backoff(self, monkeypatch):
+        delays = []
+        monkeypatch.setattr(scheduler.time, 'sleep', delays.append)
+        retvals = [False, False, True]
+
+        job_scheduler = scheduler.Scheduler(retries=2, backoff=5)
+        job = job_scheduler.add('a', lambda: retvals.pop(0))
+        job_scheduler.run()
+        assert job.outcome == scheduler.SUCCEEDED
+        assert job.attempts == 3
+        assert delays == [5, 10]
+
+    def test_retries_exhausted(self, monkeypatch):
+        monkeypatch.setattr(scheduler.time, 'sleep', lambda __: None)
+        record = []
+
+        job_scheduler = scheduler.Scheduler(retries=3)
+        job = job_scheduler.add('a', _recorder(record, 'a', False), retries=1)
+        job_scheduler.add('b', _recorder(record, 'b'), depends_on=['a'])
+        jobs = job_scheduler.run()
+        assert job.attempts == 2
+        assert _outcomes(jobs) == {'a': scheduler.FAILED, 'b': scheduler.SKIPPED}
+        assert record == ['a', 'a']
+
+    def test_required_jobs_first(self):
+        record = []
+        job_scheduler = scheduler.Scheduler(max_workers=1)
+        job_scheduler.add('a', _recorder(record, 'a'))
+        job_scheduler.add('b', _recorder(record, 'b'))
+        job_scheduler.add('c', _recorder(record, 'c'), depends_on=['b'])
+        job_scheduler.run()
+        assert record == ['b', 'a', 'c']
+
+    def test_limited_workers(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def _func():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return True
+
+        job_scheduler = scheduler.Scheduler(max_workers=2)
+        for num in range(6):
+            job_scheduler.add(str(num), _func)
+        jobs = job_scheduler.run()
+        assert all(job.succeeded for job in jobs)
+        assert peak[0] == 2
+
+    def test_dependency_waits(self):
+        record = []
+
+        def _slow():
+            time.sleep(0.05)
+            record.append('a')
+            return True
+
+        job_scheduler = scheduler.Scheduler(max_workers=3)
+        job_scheduler.add('a', _slow)
+        job_scheduler.add('b', _recorder(record, 'b'), depends_on=['a'])
+        job_scheduler.run()
+        assert record == ['a', 'b']
+
+    def test_unknown_dependency(self):
+        job_scheduler = scheduler.Scheduler()
+        with pytest.raises(exceptions.TestcasesException):
+            job_scheduler.add('b', lambda: True, depends_on=['a'])
+
+    def test_duplicate_job(self):
+        job_scheduler = scheduler.Scheduler()
+        job_scheduler.add('a', lambda: True)
+        with pytest.raises(exceptions.TestcasesException):
+            job_scheduler.add('a', lambda: True)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring,redefined-outer-name
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from cfme_testcases import exceptions, svn_daemon
+
+
+@pytest.fixture
+def daemon(tmpdir, svn_repo):
+    svn_repo.add(1000, 'test_one')
+    svn_repo.add(1001, 'test_two')
+    svn_repo.add(2000, 'test_three')
+    svn_daemon_obj = svn_daemon.SVNDaemon(
+        svn_repo.repo_dir, socket_path=str(tmpdir.join('daemon.sock')),
+        index_file=str(tmpdir.join('index.sqlite')), poll_interval=0.1)
+    return svn_daemon_obj
+
+
+@pytest.fixture
+def running_daemon(daemon):
+    errors = []
+
+    def _serve():
+        try:
+            daemon.serve_forever()
+        # pylint: disable=broad-except
+        except Exception as err:
+            errors.append(err)
+
+    serve_thread = threading.Thread(target=_serve)
+    serve_thread.start()
+    deadline = time.time() + 10
+    while not os.path.exists(daemon.socket_path) and not errors and time.time() < deadline:
+        time.sleep(0.01)
+    assert not errors
+    yield daemon
+    daemon.shutdown()
+    serve_thread.join(10)
+    assert not serve_thread.is_alive()
+
+
+def _send_line(socket_path, line):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(10)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(line)
+        response_file = sock.makefile('rb')
+        try:
+            return json.loads(response_file.readline().decode('utf-8'))
+        finally:
+            response_file.close()
+    finally:
+        sock.close()
+
+
+class TestHandleRequest(object):
+    def test_get_missing(self, daemon, svn_repo):
+        assert daemon.refresh()
+        response = daemon.handle_request({
+            'command': 'get_missing',
+            'repo_dir': svn_repo.repo_dir,
+            'names': ['test_one', 'test_three', 'test_new'],
+            'id_range': None,
+        })
+        assert response['status'] == 'ok'
+        assert response['missing'] == ['test_new']
+        assert response['testcases'] == {'test_one': 'RHCF3-1000', 'test_three': 'RHCF3-2000'}
+
+    def test_status(self, daemon, svn_repo):
+        assert daemon.refresh()
+        response = daemon.handle_request({'command': 'status'})
+        assert response['status'] == 'ok'
+        assert response['repo_dir'] == os.path.abspath(svn_repo.repo_dir)
+        assert response['testcases'] == 3
+
+    @pytest.mark.parametrize('request_data', [
+        ['get_missing'],
+        {'command': 'unknown'},
+        {'command': 'get_missing', 'repo_dir': '/other/repo', 'names': []},
+    ], ids=['not_object', 'unknown_command', 'other_repo'])
+    def test_error(self, daemon, request_data):
+        assert daemon.refresh()
+        assert daemon.handle_request(request_data)['status'] == 'error'
+
+    def test_range(self, tmpdir, svn_repo):
+        svn_repo.add(1000, 'test_one')
+        svn_repo.add(2000, 'test_two')
+        range_daemon = svn_daemon.SVNDaemon(
+            svn_repo.repo_dir, socket_path=str(tmpdir.join('daemon.sock')),
+            id_range=(1000, 1999))
+        assert range_daemon.refresh()
+        response = range_daemon.handle_request({
+            'command': 'get_missing', 'names': ['test_one', 'test_two'],
+            'id_range': [1000, 1999]})
+        assert response['missing'] == ['test_two']
+        assert tuple(response['id_range']) == (1000, 1999)
+        # the daemon can't answer for all workitems
+        response = range_daemon.handle_request({
+            'command': 'get_missing', 'names': ['test_one'], 'id_range': None})
+        assert response['status'] == 'error'
+
+
+class TestProtocol(object):
+    def test_query_missing(self, running_daemon, svn_repo):
+        missing, testcases, id_range = svn_daemon.query_missing(
+            running_daemon.socket_path, svn_repo.repo_dir, ['test_one', 'test_new'])
+        assert missing == {'test_new'}
+        assert testcases == {'test_one': 'RHCF3-1000'}
+        assert id_range is None
+
+    def test_refreshed(self, running_daemon, svn_repo):
+        svn_repo.add(1002, 'test_new')
+        assert running_daemon.refresh()
+        missing, testcases, __ = svn_daemon.query_missing(
+            running_daemon.socket_path, svn_repo.repo_dir, ['test_new'])
+        assert not missing
+        assert testcases == {'test_new': 'RHCF3-1002'}
+
+    def test_load_testcases(self, running_daemon, svn_repo):
+        polarion_testcases = svn_daemon.load_testcases(
+            running_daemon.socket_path, svn_repo.repo_dir, ['test_two', 'test_new'])
+        assert polarion_testcases.get_missing(['test_two', 'test_new']) == ({'test_new'}, set())
+        assert polarion_testcases.get_fields_by_name('test_two')['title'] == 'test_two'
+
+    def test_several_requests(self, running_daemon):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(10)
+        try:
+            sock.connect(running_daemon.socket_path)
+            sock.sendall(b'{"command": "status"}\n{"command": "status"}\n')
+            response_file = sock.makefile('rb')
+            try:
+                responses = [json.loads(response_file.readline().decode('utf-8'))
+                             for __ in range(2)]
+            finally:
+                response_file.close()
+        finally:
+            sock.close()
+        assert [response['status'] for response in responses] == ['ok', 'ok']
+
+    @pytest.mark.parametrize('line', [b'not json\n', b'{"command": "get_missing"}\n'])
+    def test_bad_request(self, running_daemon, line):
+        response = _send_line(running_daemon.socket_path, line)
+        assert response['status'] == 'error'
+
+    def test_error_raised(self, running_daemon, svn_repo):
+        with pytest.raises(exceptions.TestcasesException):
+            svn_daemon.query_missing(
+                running_daemon.socket_path, svn_repo.repo_dir + '-other', ['test_one'])
+
+    def test_already_running(self, running_daemon, svn_repo):
+        other = svn_daemon.SVNDaemon(svn_repo.repo_dir, socket_path=running_daemon.socket_path)
+        with pytest.raises(exceptions.TestcasesException):
+            other.serve_forever()
+
+    def test_not_running(self, tmpdir, svn_repo):
+        assert svn_daemon.query_missing(
+            str(tmpdir.join('none.sock')), svn_repo.repo_dir, ['test_one']) is None
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring,redefined-outer-name
+
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from cfme_testcases import svn_index, svn_testcases
+
+
+class _Parser(object):
+    """Parses workitems and records which ones were parsed."""
+
+    def __init__(self):
+        self.parsed = []
+
+    def __call__(self, workitem_files):
+        for summary in svn_testcases.iter_workitem_summaries(workitem_files):
+            self.parsed.append(summary[0])
+            yield summary
+
+
+@pytest.fixture
+def index(tmpdir, svn_repo):
+    workitem_index = svn_index.WorkItemIndex(str(tmpdir.join('index.sqlite')), svn_repo.repo_dir)
+    yield workitem_index
+    workitem_index.close()
+
+
+def _refresh(index, svn_repo, id_range=None):
+    parser = _Parser()
+    in_scope = None
+    if id_range:
+        def in_scope(work_item_id):
+            return svn_testcases.in_id_range(
+                svn_testcases.get_workitem_number(work_item_id), id_range)
+    counts = index.refresh(
+        svn_testcases.iter_workitem_files(svn_repo.workitems_dir, id_range), parser, in_scope)
+    return counts, sorted(parser.parsed)
+
+
+class TestWorkItemIndex(object):
+    def test_refresh(self, index, svn_repo):
+        svn_repo.add(1000, 'test_one')
+        svn_repo.add(1001, 'test_two')
+        svn_repo.add(1002, 'requirement', workitem_type='requirement')
+        svn_repo.add(1003, 'test_inactive', status='inactive')
+        assert _refresh(index, svn_repo) == ((4, 0), ['RHCF3-1000', 'RHCF3-1001', 'RHCF3-1002',
+                                                      'RHCF3-1003'])
+        assert index.get_active_testcases() == {
+            'test_one': 'RHCF3-1000', 'test_two': 'RHCF3-1001'}
+
+        # nothing changed, nothing is parsed
+        assert _refresh(index, svn_repo) == ((0, 0), [])
+
+    def test_refresh_add_change_delete(self, index, svn_repo):
+        svn_repo.add(1000, 'test_one')
+        svn_repo.add(1001, 'test_two')
+        _refresh(index, svn_repo)
+
+        svn_repo.add(1001, 'test_two_renamed')
+        svn_repo.add(1002, 'test_three')
+        svn_repo.remove(1000)
+        assert _refresh(index, svn_repo) == ((2, 1), ['RHCF3-1001', 'RHCF3-1002'])
+        assert index.changed == {'RHCF3-1001', 'RHCF3-1002'}
+        assert index.get_active_testcases() == {
+            'test_two_renamed': 'RHCF3-1001', 'test_three': 'RHCF3-1002'}
+
+    def test_refresh_in_scope(self, index, svn_repo):
+        svn_repo.add(1000, 'test_one')
+        svn_repo.add(2000, 'test_two')
+        _refresh(index, svn_repo)
+
+        svn_repo.remove(1000)
+        svn_repo.remove(2000)
+        # workitem outside of the traversed range is not deleted
+        assert _refresh(index, svn_repo, id_range=(1000, 1999)) == ((0, 1), [])
+        assert index.get_active_testcases() == {'test_two': 'RHCF3-2000'}
+
+    def test_active_in_scope(self, index, svn_repo):
+        svn_repo.add(1000, 'test_one')
+        svn_repo.add(2000, 'test_two')
+        _refresh(index, svn_repo)
+        assert index.get_active_testcases(lambda work_item_id: work_item_id == 'RHCF3-2000') == {
+            'test_two': 'RHCF3-2000'}
+
+    def test_rebuilt_for_other_repo(self, tmpdir, index, svn_repo):
+        svn_repo.add(1000, 'test_one')
+        _refresh(index, svn_repo)
+        index.close()
+
+        other_index = svn_index.WorkItemIndex(index.index_file, str(tmpdir.join('other')))
+        try:
+            assert other_index.get_active_testcases() == {}
+        finally:
+            other_index.close()
+
+
+class TestLoadActiveTestcases(object):
+    @pytest.mark.parametrize('use_index', [True, False], ids=['index', 'no_index'])
+    def test_records(self, tmpdir, svn_repo, use_index):
+        svn_repo.add(1000, 'test_one')
+        svn_repo.add(1001, 'test_inactive', status='inactive')
+        svn_repo.add(1002, 'requirement', workitem_type='requirement')
+        polarion_testcases = svn_testcases.load_testcases(
+            svn_repo.repo_dir,
+            index_file=str(tmpdir.join('index.sqlite')) if use_index else None)
+        assert polarion_testcases.available_testcases == {'test_one': 'RHCF3-1000'}
+        # compact record is kept without parsing the workitem again
+        record = polarion_testcases.wi_cache._records['RHCF3-1000']
+        assert (record.work_item_id, record.title, record.status) == (
+            'RHCF3-1000', 'test_one', 'approved')
+        assert polarion_testcases.wi_cache.get_record('RHCF3-1000') is record